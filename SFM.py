@@ -1,9 +1,29 @@
+import argparse
+import sys
+import time
+import traceback
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
 from matplotlib import pyplot as plt
 import os 
-from scipy.optimize import least_squares
 from tqdm import tqdm 
+from feature_store import FeaturePrefetcher, FeatureStore, decode_image, extract_image_features
+from matching import FeatureMatcher
+from octree import write_octree
+from ply import PlyStreamWriter, write_ply
+from point_cloud import PointCloud, filter_point_cloud, sample_colors
+from profiling import PipelineProfiler, profile_call
+from retrieval import build_view_graph
+from tracks import FeatureTracks
+from streaming import IMAGE_EXTENSIONS, watch_directory
+from triangulation import triangulate_tracks
+from two_view import verify_view_graph
+from view_graph import ViewGraph
+from checkpoint import load_checkpoint, save_checkpoint
+from bundle_adjustment import K_from_intrinsics, LocalBundleAdjustmentScheduler, bundle_adjustment, intrinsics_from_K, params_to_transform, project, transform_to_params
 
 class ImageLoader:
     """
@@ -15,12 +35,16 @@ class ImageLoader:
         Camera intrinsic matrix.
     image_list : list
         List of image paths.
+    name : str
+        Name of the dataset (the image directory name).
     path : str
-        Current working directory.
+        Directory the results are written to, the current working directory by default.
     factor : float
         Downscale factor.
+    cache_size : int
+        Maximum number of decoded frames kept in memory.
     """
-    def __init__(self, img_dir:str, downscale_factor:float):
+    def __init__(self, img_dir:str, downscale_factor:float, output_dir:str = None, cache_size:int = 4):
         """
         Initialize the ImageLoader with directory and downscale factor.
 
@@ -30,38 +54,74 @@ class ImageLoader:
             Directory containing images and intrinsic matrix.
         downscale_factor : float
             Factor by which to downscale the images and intrinsic matrix.
+        output_dir : str
+            Directory the results are written to, defaults to the current working directory.
+        cache_size : int
+            Maximum number of decoded frames kept in memory.
         """
         # Load camera intrinsic matrix from file
-        with open(img_dir + '\\K.txt') as f:
-            self.K = np.array(list((map(lambda x:list(map(lambda x:float(x), x.strip().split(' '))),f.read().split('\n')))))
+        with open(os.path.join(img_dir, 'K.txt')) as f:
+            self.K = np.array(list((map(lambda x:list(map(lambda x:float(x), x.strip().split())),f.read().strip().split('\n')))))
             self.image_list = []
 
         # Load image file paths    
         for image in sorted(os.listdir(img_dir)):
-            if image[-4:].lower() == '.jpg' or image[-5:].lower() == '.png':
-                self.image_list.append(img_dir + '\\' + image)
+            if image.lower().endswith(IMAGE_EXTENSIONS):
+                self.image_list.append(os.path.join(img_dir, image))
         
-        self.path = os.getcwd()
+        self.name = os.path.basename(os.path.normpath(img_dir))
+        self.path = output_dir if output_dir is not None else os.getcwd()
         self.factor = downscale_factor
+        self.cache_size = cache_size
+        self._frames = OrderedDict()
         self.downscale_instrinsics()
 
-    def downscale_image(self, image):
+    def load_image(self, index:int, grayscale:bool = False):
         """
-        Downscale an image using pyramid down method.
+        Decode an image at the downscaled resolution, keeping the most recently used frames in memory.
 
         Parameters:
         -----------
-        image : np.ndarray
-            Image to be downscaled.
+        index : int
+            Index of the image in image_list.
+        grayscale : bool
+            Flag indicating whether to return a single channel frame instead of BGR.
 
         Returns:
         --------
         np.ndarray
-            Downscaled image.
+            Read-only view of the cached frame.
         """
-        for _ in range(1,int(self.factor / 2) + 1):
-            image = cv2.pyrDown(image)
-        return image
+        key = (index, grayscale)
+        if key in self._frames:
+            self._frames.move_to_end(key)
+            return self._frames[key]
+        frame = decode_image(self.image_list[index], self.factor, grayscale)
+        frame.flags.writeable = False
+        if self.cache_size > 0:
+            self._frames[key] = frame
+            while len(self._frames) > self.cache_size:
+                self._frames.popitem(last=False)
+        return frame
+
+    def add_image(self, image_path:str) -> int:
+        """
+        Append an image that was not in the directory at construction, e.g. one that arrived in a stream.
+
+        Parameters:
+        -----------
+        image_path : str
+            Path of the image file.
+
+        Returns:
+        --------
+        int
+            Index of the image in image_list, its existing index if it is already listed.
+        """
+        if image_path in self.image_list:
+            return self.image_list.index(image_path)
+        self.image_list.append(image_path)
+        return len(self.image_list) - 1
 
     def downscale_instrinsics(self) -> None:
         """
@@ -81,8 +141,69 @@ class StructurefromMotion:
     -----------
     img_obj : ImageLoader
         Instance of ImageLoader class.
+    feature_store : FeatureStore
+        Cache of SIFT keypoints and descriptors shared within and across runs.
+    matcher : FeatureMatcher
+        Descriptor matcher used between image pairs.
+    feature_workers : int
+        Number of processes extracting features ahead of the reconstruction.
+    prefetcher : FeaturePrefetcher
+        Feature extraction stage of the current run, None outside of a run.
+    profiler : PipelineProfiler
+        Per-stage timing and memory measurements, written next to the results of every run.
+    tracks : FeatureTracks
+        Feature tracks and their 3D points built by the last run.
+    point_cloud : PointCloud
+        Colored points of the last run with their track ids and reprojection errors.
+    view_graph : ViewGraph
+        Image pairs matched by the last run, which also decide the registration order.
+    initial_pair : tuple
+        Indices of the two images the last run started from.
+    view_errors : list
+        (step, reprojection error) of every view registered after the initial pair.
+    global_ba_done : bool
+        Flag indicating that global bundle adjustment has been applied to the current state.
+    cameras : dict
+        Maps the index of every registered image to its 3x4 extrinsic matrix.
     """
-    def __init__(self, img_dir=str, downscale_factor:float = 2.0):
+    PLY_SCALE = 200
+    # Function evaluations of the per-view adjustment of bundle_adjustment_mode='view'
+    VIEW_BA_MAX_NFEV = 20
+    # Fewest 2D-3D correspondences a view is registered from
+    MIN_PNP_POINTS = 6
+
+    def __init__(
+            self,
+            img_dir:str,
+            downscale_factor:float = 2.0,
+            sift_params:dict = None,
+            feature_cache_dir:str = None,
+            feature_cache_size:int = 2 * 1024 ** 3,
+            use_feature_cache:bool = True,
+            feature_workers:int = None,
+            prefetch_size:int = None,
+            matcher:str = 'bf',
+            match_ratio:float = 0.70,
+            max_features:int = None,
+            output_dir:str = None,
+            profiler:PipelineProfiler = None,
+            pair_selection:str = 'sequential',
+            retrieval_neighbors:int = 5,
+            verify_pairs:bool = True,
+            verification_workers:int = None,
+            min_pair_inliers:int = 30,
+            min_initial_angle:float = 2.0,
+            checkpoint_dir:str = None,
+            checkpoint_every:int = 5,
+            local_ba_window:int = 5,
+            local_ba_every:int = 5,
+            local_ba_threshold:float = 1.0,
+            min_triangulation_angle:float = 1.0,
+            max_triangulation_error:float = 4.0,
+            stream_window:int = 5,
+            export_filter:dict = None,
+            lod_tile_size:int = 100000
+    ):
         """
         Initialize the StructurefromMotion with image directory and downscale factor.
 
@@ -92,63 +213,219 @@ class StructurefromMotion:
             Directory containing images and intrinsic matrix.
         downscale_factor : float
             Factor by which to downscale the images and intrinsic matrix.
+        sift_params : dict
+            Keyword arguments forwarded to cv2.SIFT_create.
+        feature_cache_dir : str
+            Directory of the on-disk feature cache, defaults to .sfm_cache/features in the working directory.
+        feature_cache_size : int
+            Maximum size of the on-disk feature cache in bytes.
+        use_feature_cache : bool
+            Flag indicating whether features are persisted across runs.
+        feature_workers : int
+            Number of feature extraction processes, defaults to the number of CPUs.
+        prefetch_size : int
+            Maximum number of images extracted ahead of the reconstruction, defaults to twice the worker count.
+        matcher : str
+            Matcher backend, one of 'bf', 'flann' or 'crosscheck'.
+        match_ratio : float
+            Lowe's ratio test threshold.
+        max_features : int
+            Maximum number of SIFT features kept per image, None keeps all.
+        output_dir : str
+            Directory the results are written to, defaults to the current working directory.
+        profiler : PipelineProfiler
+            Collector of the per-stage measurements, a default one is created if None.
+        pair_selection : str
+            'sequential' matches consecutive images in filename order, 'retrieval' proposes pairs
+            by bag-of-words image similarity, for unordered collections.
+        retrieval_neighbors : int
+            Number of candidate pairs proposed per image by 'retrieval'.
+        verify_pairs : bool
+            Flag indicating whether every candidate pair is verified with essential matrix RANSAC
+            up front, which also chooses the initial pair by inliers and triangulation angle.
+        verification_workers : int
+            Number of threads verifying pairs, defaults to the number of CPUs.
+        min_pair_inliers : int
+            Minimum number of inliers for a verified pair to be kept.
+        min_initial_angle : float
+            Minimum median triangulation angle in degrees of the initial pair.
+        checkpoint_dir : str
+            Directory of the reconstruction checkpoints, defaults to checkpoint in the output directory.
+        checkpoint_every : int
+            Number of registered views between checkpoints, 0 disables checkpointing.
+        local_ba_window : int
+            Number of most recently registered cameras refined by local bundle adjustment.
+        local_ba_every : int
+            Maximum number of views between two local bundle adjustments, 0 to trigger on the error only.
+        local_ba_threshold : float
+            Mean reprojection error in pixels of the new points of a view that triggers local bundle adjustment at once.
+        min_triangulation_angle : float
+            Minimum triangulation angle in degrees of a new point.
+        max_triangulation_error : float
+            Maximum reprojection error in pixels of a new point in any view observing it.
+        stream_window : int
+            Number of most recent images every image pushed into a stream is matched against,
+            older images keep their keypoints but release their descriptors.
+        export_filter : dict
+            Keyword arguments forwarded to filter_point_cloud when the PLY is written, sizes are in PLY units.
+        lod_tile_size : int
+            Maximum number of points per tile of the level-of-detail octree written next to the PLY, 0 disables the octree.
         """
-        self.img_obj =ImageLoader(img_dir, downscale_factor)
+        if pair_selection not in ('sequential', 'retrieval'):
+            raise ValueError("pair_selection must be 'sequential' or 'retrieval', got {!r}".format(pair_selection))
+        self.img_obj =ImageLoader(img_dir, downscale_factor, output_dir)
+        if max_features is not None:
+            sift_params = dict(sift_params or {}, nfeatures=max_features)
+        if use_feature_cache and feature_cache_dir is None:
+            feature_cache_dir = os.path.join(os.getcwd(), '.sfm_cache', 'features')
+        self.feature_store = FeatureStore(feature_cache_dir if use_feature_cache else None, feature_cache_size, sift_params)
+        self.matcher = FeatureMatcher(matcher, match_ratio)
+        self.feature_workers = feature_workers if feature_workers is not None else (os.cpu_count() or 1)
+        self.prefetch_size = prefetch_size
+        self.prefetcher = None
+        self.profiler = profiler if profiler is not None else PipelineProfiler()
+        self.tracks = None
+        self.point_cloud = PointCloud()
+        self.cameras = {}
+        self.pair_selection = pair_selection
+        self.retrieval_neighbors = retrieval_neighbors
+        self.verify_pairs = verify_pairs
+        self.verification_workers = verification_workers
+        self.min_pair_inliers = min_pair_inliers
+        self.min_initial_angle = min_initial_angle
+        self.checkpoint_dir = checkpoint_dir if checkpoint_dir is not None else os.path.join(self.img_obj.path, 'checkpoint')
+        self.checkpoint_every = checkpoint_every
+        self.local_ba_window = local_ba_window
+        self.local_ba_every = local_ba_every
+        self.local_ba_threshold = local_ba_threshold
+        self.min_triangulation_angle = min_triangulation_angle
+        self.max_triangulation_error = max_triangulation_error
+        self.stream_window = stream_window
+        self.export_filter = export_filter if export_filter is not None else {}
+        self.lod_tile_size = lod_tile_size
+        self._stream = None
+        self.view_errors = []
+        self.global_ba_done = False
+        self._checkpoint_views = 0
+        self.view_graph = None
+        self.initial_pair = None
 
-    def feature_matching(self, image_0, image_1) -> tuple:
+    def extract_features(self, index:int) -> tuple:
         """
-        Perform feature matching between two images using SIFT.
+        Get the SIFT keypoints and descriptors of an image, running SIFT only on a cache miss.
 
         Parameters:
         -----------
-        image_0 : np.ndarray
-            First image.
-        image_1 : np.ndarray
-            Second image.
+        index : int
+            Index of the image in the image list.
 
         Returns:
         --------
         tuple
-            Matched feature points from both images.
+            Keypoint coordinates and descriptors.
+        """
+        if self.prefetcher is not None:
+            return self.prefetcher.get(index)
+        image_path = self.img_obj.image_list[index]
+        features = self.feature_store.get(image_path, self.img_obj.factor)
+        if features is None:
+            points, descriptors, timings = extract_image_features(image_path, self.img_obj.factor, self.feature_store.detector_params)
+            self.record_timings(index, timings)
+            features = self.feature_store.put(image_path, self.img_obj.factor, points, descriptors)
+        return features
+
+    def record_timings(self, index:int, timings:dict) -> None:
         """
-        sift = cv2.SIFT_create()
-        # Detect and compute SIFT keypoints and descriptors
-        key_points0, descriptors_0 = sift.detectAndCompute(cv2.cvtColor(image_0, cv2.COLOR_BGR2GRAY), None)
-        key_points1, descriptors_1 = sift.detectAndCompute(cv2.cvtColor(image_1, cv2.COLOR_BGR2GRAY), None)
+        Add the feature extraction step durations of an image to the profiler.
 
-        # Match descriptors using BFMatcher with k-nearest neighbors
-        bf = cv2.BFMatcher()
-        matches = bf.knnMatch(descriptors_0, descriptors_1, k=2)
-        feature = []
-        for m, n in matches:
-            if m.distance < 0.70 * n.distance:
-                feature.append(m)
-        return np.float32([key_points0[m.queryIdx].pt for m in feature]), np.float32([key_points1[m.trainIdx].pt for m in feature])
+        Parameters:
+        -----------
+        index : int
+            Index of the image in the image list.
+        timings : dict
+            Maps step names to durations in seconds.
+        """
+        for stage, seconds in timings.items():
+            self.profiler.record(stage, seconds, view=index)
 
-    def triangulation(self, pts_2d_1, pts_2d_2, proj_matrix_1, proj_matrix_2) -> tuple:
+    def build_view_graph(self) -> ViewGraph:
         """
-        Triangulate points from two views.
+        Build the graph of image pairs to match.
+
+        Returns:
+        --------
+        ViewGraph
+            Chain of consecutive images for 'sequential' pair selection, otherwise every image
+            linked to its retrieval_neighbors most similar images. With verify_pairs every pair
+            is matched and verified in a thread pool, and pairs with too few inliers are dropped.
+        """
+        num_images = len(self.img_obj.image_list)
+        if self.pair_selection == 'sequential':
+            view_graph = ViewGraph.sequential(num_images)
+        else:
+            descriptors = [self.extract_features(index)[1] for index in range(num_images)]
+            with self.profiler.stage('retrieval'):
+                view_graph = build_view_graph(descriptors, self.retrieval_neighbors)
+        if self.verify_pairs:
+            features = [self.extract_features(index) for index in range(num_images)]
+            with self.profiler.stage('verification'):
+                verify_view_graph(view_graph, [points for points, _ in features], [descriptors for _, descriptors in features], self.matcher, self.img_obj.K, self.verification_workers,
+                                  self.min_pair_inliers, on_pair=self.record_pair_timings)
+        return view_graph
+
+    def record_pair_timings(self, image_0:int, image_1:int, match_seconds:float, pose_seconds:float) -> None:
+        """
+        Record the matching and relative pose timings of a verified pair under the second image.
+        """
+        self.profiler.record('matching', match_seconds, view=image_1)
+        self.profiler.record('pose_estimation', pose_seconds, view=image_1)
+
+    def pair_matches(self, index_0:int, index_1:int) -> tuple:
+        """
+        Get the matches of an image pair, reusing the inlier matches of two-view verification if available.
 
         Parameters:
         -----------
-        pts_2d_1 : np.ndarray
-            2D points from the first view.
-        pts_2d_2 : np.ndarray
-            2D points from the second view.
-        proj_matrix_1 : np.ndarray
-            Projection matrix of the first view.
-        proj_matrix_2 : np.ndarray
-            Projection matrix of the second view.
+        index_0 : int
+            Index of the first image.
+        index_1 : int
+            Index of the second image.
 
         Returns:
         --------
         tuple
-            Projection matrices and 3D points.
+            Indices of the matched keypoints in both images.
         """
-        # Triangulate points using projection matrices
-        point_cloud = cv2.triangulatePoints(pts_2d_1, pts_2d_2, proj_matrix_1.T, proj_matrix_2.T)
-        return proj_matrix_1.T, proj_matrix_2.T, (point_cloud/point_cloud[3])
-    
+        edge = self.view_graph.edge(index_0, index_1) if self.view_graph is not None else None
+        if edge is None or 'matches' not in edge:
+            return self.match_keypoints(index_0, index_1)
+        matches_0, matches_1 = edge['matches']
+        return (matches_0, matches_1) if index_0 < index_1 else (matches_1, matches_0)
+
+    def match_keypoints(self, index_0:int, index_1:int) -> tuple:
+        """
+        Match SIFT descriptors of two images and return the matched keypoint indices.
+
+        Parameters:
+        -----------
+        index_0 : int
+            Index of the first image.
+        index_1 : int
+            Index of the second image.
+
+        Returns:
+        --------
+        tuple
+            Indices of the matched keypoints in both images.
+        """
+        # Fetch SIFT keypoints and descriptors from the feature store
+        _, descriptors_0 = self.extract_features(index_0)
+        _, descriptors_1 = self.extract_features(index_1)
+
+        # Match descriptors with k-nearest neighbors and the ratio test
+        with self.profiler.stage('matching', view=index_1):
+            return self.matcher.match(descriptors_0, descriptors_1)
+
     def solve_PnP(self, obj_point, image_point, K, dist_coeff, rot_vector, initial) -> tuple:
         """
         Solve Perspective-n-Point (PnP) problem.
@@ -171,7 +448,8 @@ class StructurefromMotion:
         Returns:
         --------
         tuple
-            Rotation matrix, translation vector, image points, object points, and rotation vector.
+            Rotation matrix, translation vector, and the RANSAC inliers among the image points, object points
+            and rotation vector, or None if RANSAC found no pose.
         """
         if initial == 1:
             obj_point=obj_point[:,0,:]
@@ -179,55 +457,16 @@ class StructurefromMotion:
             rot_vector = rot_vector.T
 
         # Solve PnP with RANSAC to estimate camera pose    
-        _, rot_vector_calc, tran_vector, inlier = cv2.solvePnPRansac(obj_point, image_point, K, dist_coeff, cv2.SOLVEPNP_ITERATIVE)
+        success, rot_vector_calc, tran_vector, inlier = cv2.solvePnPRansac(obj_point, image_point, K, dist_coeff, cv2.SOLVEPNP_ITERATIVE)
+        if not success or inlier is None or len(inlier) == 0 or not (np.isfinite(rot_vector_calc).all() and np.isfinite(tran_vector).all()):
+            return None
         rot_matrix, _ =cv2.Rodrigues(rot_vector_calc)
 
-        if inlier is not None:
-            image_point=image_point[inlier[:,0]]
-            obj_point=obj_point[inlier[:,0]]
-            rot_vector = rot_vector[inlier[:,0]]
+        image_point=image_point[inlier[:,0]]
+        obj_point=obj_point[inlier[:,0]]
+        rot_vector = rot_vector[inlier[:,0]]
         return rot_matrix, tran_vector,image_point,obj_point,rot_vector
     
-    def find_common_points(self, image_points_1, image_points_2, image_points_3) -> tuple:
-        """
-        Find common points between three sets of image points.
-
-        Parameters:
-        -----------
-        image_points_1 : np.ndarray
-            Image points from the first image.
-        image_points_2 : np.ndarray
-            Image points from the second image.
-        image_points_3 : np.ndarray
-            Image points from the third image.
-
-        Returns:
-        --------
-        tuple
-            Indices of common points and mask arrays.
-        """
-        cm_points_1= []
-        cm_points_2= []
-        # Find common points between first and second set of image points
-        for i in range(image_points_1.shape[0]):
-            a= np.where(image_points_2 == image_points_1[i, :])
-            if a[0].size !=0:
-                cm_points_1.append(i)
-                cm_points_2.append(a[0][0])
-
-        # Mask arrays to remove common points
-        mask_array_1 = np.ma.array(image_points_2, mask= False)
-        mask_array_1.mask[cm_points_2] = True
-        mask_array_1 = mask_array_1.compressed()
-        mask_array_1=mask_array_1.reshape(int(mask_array_1.shape[0]/2),2)
-
-        mask_array_2 = np.ma.array(image_points_3, mask=False)
-        mask_array_2.mask[cm_points_2] = True
-        mask_array_2 = mask_array_2.compressed()
-        mask_array_2 = mask_array_2.reshape(int(mask_array_2.shape[0] / 2), 2)
-        print(" Shape of New Array", mask_array_1.shape, mask_array_2.shape)
-        return np.array(cm_points_1), np.array(cm_points_2), mask_array_1, mask_array_2
-
     def reproj_error(self, obj_points, image_points, transform_matrix, K, homogenity) -> tuple:
         """
         Compute reprojection error.
@@ -253,6 +492,8 @@ class StructurefromMotion:
         rot_matrix = transform_matrix[:3,:3]
         tran_vector = transform_matrix[:3, 3]
         rot_vector, _ = cv2.Rodrigues(rot_matrix)
+        if np.size(obj_points) == 0:
+            return 0.0, obj_points
 
         if homogenity == 1:
             obj_points= cv2.convertPointsFromHomogeneous(obj_points.T)
@@ -263,80 +504,200 @@ class StructurefromMotion:
         total_error = cv2.norm(image_points_calc, np.float32(image_points.T) if homogenity == 1 else np.float32(image_points), cv2.NORM_L2)
         return total_error/ len(image_points_calc), obj_points
             
-    def optimize_reproj_error(self, obj_points) -> np.array:
+    def point_errors(self, obj_points, image_points, transform_matrix, K) -> np.ndarray:
         """
-        Optimize reprojection error.
+        Compute the reprojection error of every point separately.
 
         Parameters:
         -----------
         obj_points : np.ndarray
-            Object points.
+            (N, 3) 3D object points.
+        image_points : np.ndarray
+            (N, 2) observed image points.
+        transform_matrix : np.ndarray
+            Transformation matrix of the observing camera.
+        K : np.ndarray
+            Camera intrinsic matrix.
 
         Returns:
         --------
-        np.array
-            Optimized reprojection error.
-        """
-        transform_matrix = obj_points[0:12].reshape((3,4))
-        K = obj_points[12:21].reshape((3,3))
-        rest= int(len(obj_points[21:])* 0.4)
-        p = obj_points[21:21 + rest].reshape((2, int(rest/2))).T
-        obj_points = obj_points[21 + rest:].reshape((int(len(obj_points[21 + rest:])/3),3))
-        rot_matrix = transform_matrix[:3,:3]
-        tran_vector = transform_matrix[:3, 3]
-        rot_vector , _ = cv2.Rodrigues(rot_matrix)
-        image_points ,_ =cv2.projectPoints(obj_points, rot_vector, tran_vector, K, None)
-        image_points = image_points[:,0,:]
-        error = [(p[idx]- image_points[idx])**2 for idx in range(len(p))]
-        return np.array(error).ravel()/len(p)
-    
-    def compute_bundle_adjustment(self, _3d_point, opt, transform_matrix_new, K, r_error) -> tuple:
+        np.ndarray
+            (N,) reprojection error of every point in pixels.
+        """
+        projected = np.matmul(np.matmul(np.reshape(obj_points, (-1, 3)), transform_matrix[:3, :3].T) + transform_matrix[:3, 3], K.T)
+        return np.linalg.norm(projected[:, :2] / projected[:, 2:] - np.reshape(image_points, (-1, 2)), axis=1)
+
+    def observations(self, image_ids=None, track_ids=None, triangulated:bool = True) -> tuple:
         """
-        Compute bundle adjustment.
+        Collect every observation of a triangulated track in a set of registered views.
 
         Parameters:
         -----------
-        _3d_point : np.ndarray
-            3D points.
-        opt : np.ndarray
-            Optimized points.
-        transform_matrix_new : np.ndarray
-            New transformation matrix.
-        K : np.ndarray
-            Camera intrinsic matrix.
-        r_error : float
-            Reprojection error.
+        image_ids : iterable
+            Indices of the views to use, defaults to every registered view.
+        track_ids : np.ndarray
+            Tracks to use, defaults to every track.
+        triangulated : bool
+            Flag indicating whether only tracks with a 3D point are used.
 
         Returns:
         --------
         tuple
-            Adjusted 3D points, optimized points, and transformation matrix.
+            Sorted view indices, camera slot (position in the view indices) of every observation,
+            ids of the observed tracks, point slot (position in the track ids) of every observation
+            and the (N, 2) observed image points.
         """
-        # Concatenate all optimization variables
-        opt_variables = np.hstack((transform_matrix_new.ravel(), K.ravel()))
-        opt_variables= np.hstack((opt_variables, opt.ravel()))
-        opt_variables= np.hstack((opt_variables, _3d_point.ravel()))
+        image_ids = np.array(sorted(self.cameras if image_ids is None else image_ids), dtype=np.int64)
+        camera_slot = np.full(image_ids.max() + 1, -1, dtype=np.int64)
+        camera_slot[image_ids] = np.arange(len(image_ids))
 
-        # Perform least squares optimization
-        values_corrected = least_squares(self.optimize_reproj_error, opt_variables, g_tolrance= r_error).x
-        K = values_corrected[12:21].reshape((3,3))
-        rest = int(len(values_corrected[21:])* 0.4)
-        return values_corrected[21+rest:].reshape((int(len(values_corrected[21+rest:])/3),3)), values_corrected[21:21 + rest].reshape((2, int(rest/2))).T, values_corrected[0:12].reshape((3,4))
+        obs_track, obs_image, obs_keypoint = self.tracks.obs_track, self.tracks.obs_image, self.tracks.obs_keypoint
+        keep = np.isin(obs_image, image_ids)
+        if triangulated:
+            keep &= self.tracks.is_triangulated(obs_track)
+        if track_ids is not None:
+            keep &= np.isin(obs_track, track_ids)
+        obs_track, obs_image, obs_keypoint = obs_track[keep], obs_image[keep], obs_keypoint[keep]
+        track_ids, point_indices = np.unique(obs_track, return_inverse=True)
+        points_2d = np.empty((len(obs_image), 2))
+        for image_id in image_ids:
+            in_view = obs_image == image_id
+            points_2d[in_view] = self.extract_features(image_id)[0][obs_keypoint[in_view]]
+        return image_ids, camera_slot[obs_image], track_ids, point_indices, points_2d
 
-    def save_to_ply(self, path, point_cloud, colors, bundle_adjustment_enabled):
+    def triangulate_new_tracks(self, track_ids) -> tuple:
         """
-        Save point cloud to a PLY file.
+        Triangulate tracks from all of their observations in the registered views.
+
+        Parameters:
+        -----------
+        track_ids : np.ndarray
+            Tracks to triangulate.
+
+        Returns:
+        --------
+        tuple
+            Ids of the tracks that passed the cheirality, angle and reprojection error checks,
+            their (N, 3) points and their mean reprojection errors in pixels.
+        """
+        if len(track_ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty((0, 3)), np.empty(0)
+        image_ids, camera_indices, track_ids, point_indices, points_2d = self.observations(track_ids=track_ids, triangulated=False)
+        transforms = np.array([self.cameras[image_id] for image_id in image_ids], dtype=np.float64)
+        points_3d, valid, errors = triangulate_tracks(transforms, self.img_obj.K, camera_indices, point_indices, points_2d, len(track_ids), self.min_triangulation_angle, self.max_triangulation_error)
+        return track_ids[valid], points_3d[valid], errors[valid]
+
+    def mean_reprojection_error(self) -> float:
+        """
+        Mean reprojection error in pixels over every observation of every triangulated track.
+        """
+        image_ids, camera_indices, track_ids, point_indices, points_2d = self.observations()
+        camera_params = np.array([transform_to_params(self.cameras[image_id]) for image_id in image_ids])
+        projected = project(self.tracks.points[track_ids][point_indices], camera_params[camera_indices], intrinsics_from_K(self.img_obj.K))
+        return float(np.mean(np.linalg.norm(projected - points_2d, axis=1)))
+
+    def global_bundle_adjustment(self, refine_intrinsics:bool = False, gtol:float = 1e-8, ftol:float = 1e-4, max_nfev:int = None, loss:str = 'huber', f_scale:float = 2.0) -> tuple:
+        """
+        Refine every registered camera and every triangulated track using all their observations.
+
+        The first camera of the initial pair is held fixed to remove the gauge freedom, and a
+        robust loss keeps badly triangulated points from dominating the solution.
+
+        Parameters:
+        -----------
+        refine_intrinsics : bool
+            Flag indicating whether the shared intrinsics are refined as well.
+        gtol, ftol : float
+            Tolerances forwarded to least_squares.
+        max_nfev : int
+            Maximum number of function evaluations.
+        loss : str
+            Robust loss forwarded to least_squares.
+        f_scale : float
+            Inlier residual scale of the robust loss, in pixels.
+
+        Returns:
+        --------
+        tuple
+            Mean reprojection error in pixels before and after the adjustment, NaN after if it diverged
+            and the state was left unchanged.
+        """
+        image_ids, camera_indices, track_ids, point_indices, points_2d = self.observations()
+        camera_params = np.array([transform_to_params(self.cameras[image_id]) for image_id in image_ids])
+        initial_error = np.mean(np.linalg.norm(project(self.tracks.points[track_ids][point_indices], camera_params[camera_indices], intrinsics_from_K(self.img_obj.K)) - points_2d, axis=1))
+        cameras, points_3d, intrinsics, result = bundle_adjustment(camera_params, self.tracks.points[track_ids], intrinsics_from_K(self.img_obj.K), camera_indices, point_indices, points_2d,
+                                                                   fixed_cameras=(int(np.searchsorted(image_ids, self.initial_pair[0])),), refine_intrinsics=refine_intrinsics, gtol=gtol, ftol=ftol, max_nfev=max_nfev, loss=loss, f_scale=f_scale)
+
+        if not (np.isfinite(cameras).all() and np.isfinite(points_3d).all()):
+            print("Global Bundle Adjustment diverged, keeping the previous cameras and points")
+            return initial_error, np.nan
+        for image_id, params in zip(image_ids, cameras):
+            self.cameras[image_id] = params_to_transform(params)
+        self.tracks.set_points(track_ids, points_3d)
+        if refine_intrinsics:
+            self.img_obj.K = K_from_intrinsics(intrinsics)
+
+        return initial_error, np.mean(np.linalg.norm(result.fun.reshape(-1, 2), axis=1))
+
+    def local_bundle_adjustment(self, window:list, gtol:float = 1e-8, ftol:float = 1e-4, max_nfev:int = 50, loss:str = 'huber', f_scale:float = 2.0) -> tuple:
+        """
+        Refine the cameras of a window of views and every track they observe.
+
+        Every other registered camera observing those tracks contributes its observations
+        but is held fixed, as is the first camera of the initial pair.
+
+        Parameters:
+        -----------
+        window : list
+            Indices of the views whose cameras are refined.
+        gtol, ftol : float
+            Tolerances forwarded to least_squares.
+        max_nfev : int
+            Maximum number of function evaluations.
+        loss : str
+            Robust loss forwarded to least_squares.
+        f_scale : float
+            Inlier residual scale of the robust loss, in pixels.
+
+        Returns:
+        --------
+        tuple
+            Mean reprojection error in pixels of the window observations before and after the adjustment,
+            NaN after if it diverged and the state was left unchanged.
+        """
+        window_tracks = np.unique(np.concatenate([self.tracks.observed_tracks(image_id, triangulated=True)[1] for image_id in window]))
+        if len(window_tracks) == 0:
+            return np.nan, np.nan
+        observing = np.unique(self.tracks.obs_image[np.isin(self.tracks.obs_track, window_tracks)])
+        image_ids, camera_indices, track_ids, point_indices, points_2d = self.observations([image_id for image_id in observing if image_id in self.cameras], window_tracks)
+        camera_params = np.array([transform_to_params(self.cameras[image_id]) for image_id in image_ids])
+        fixed = [slot for slot, image_id in enumerate(image_ids) if image_id not in window or image_id == self.initial_pair[0]]
+        initial_error = np.mean(np.linalg.norm(project(self.tracks.points[track_ids][point_indices], camera_params[camera_indices], intrinsics_from_K(self.img_obj.K)) - points_2d, axis=1))
+        cameras, points_3d, _, result = bundle_adjustment(camera_params, self.tracks.points[track_ids], intrinsics_from_K(self.img_obj.K), camera_indices, point_indices, points_2d,
+                                                          fixed_cameras=fixed, gtol=gtol, ftol=ftol, max_nfev=max_nfev, loss=loss, f_scale=f_scale)
+
+        if not (np.isfinite(cameras).all() and np.isfinite(points_3d).all()):
+            print("Local Bundle Adjustment diverged, keeping the previous cameras and points")
+            return initial_error, np.nan
+        for image_id, params in zip(image_ids, cameras):
+            if image_id in window:
+                self.cameras[image_id] = params_to_transform(params)
+        self.tracks.set_points(track_ids, points_3d)
+        return initial_error, np.mean(np.linalg.norm(result.fun.reshape(-1, 2), axis=1))
+
+    def results_dir(self, bundle_adjustment_enabled:bool) -> str:
+        """
+        Get (and create) the directory the results of a run are written to.
 
         Parameters:
         -----------
-        path : str
-            Path to save the PLY file.
-        point_cloud : np.ndarray
-            3D point cloud.
-        colors : np.ndarray
-            Colors associated with the point cloud.
         bundle_adjustment_enabled : bool
             Flag indicating whether bundle adjustment is enabled.
+
+        Returns:
+        --------
+        str
+            Path of the results directory.
         """
         if bundle_adjustment_enabled:
             output_dir = os.path.join(self.img_obj.path, 'Results with Bundle Adjustment')
@@ -345,159 +706,712 @@ class StructurefromMotion:
 
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
+        return output_dir
 
-        ply_filename = os.path.join(output_dir, self.img_obj.image_list[0].split(os.sep)[-1].split('.')[0] + '.ply')
-        out_points = point_cloud.reshape(-1,3) * 200
-        out_colors = colors.reshape(-1, 3)
-        print(out_colors.shape, out_points.shape)
-        verts = np.hstack([out_points, out_colors])
-
-        mean = np.mean(verts[:,:3], axis= 0)
-        scaled_verts = verts[:,:3]- mean
-        dist= np.sqrt(scaled_verts[:,0]** 2 + scaled_verts[:,1] ** 2 + scaled_verts[:,2] **2)
-        indx= np.where(dist < np.mean(dist) + 300)
-        verts = verts[indx]
-        ply_header = '''ply
-            format ascii 1.0
-            element vertex {}
-            property float x
-            property float y
-            property float z
-            property uchar blue
-            property uchar green
-            property uchar red
-            end_header
-            '''.format(len(verts))
-        with open(ply_filename, 'w') as f:
-            f.write(ply_header)
-            np.savetxt(f, verts, '%f %f %f %d %d %d')
-
-    def __call__(self, bundle_adjustmenet_enabled: bool = False):
+    def save_to_ply(self, path, point_cloud, colors, bundle_adjustment_enabled, binary:bool = True):
         """
-        Run the Structure from Motion pipeline.
+        Save point cloud to a PLY file after voxel downsampling and outlier removal with filter_point_cloud,
+        and as a level-of-detail octree next to it for visualize.py.
 
         Parameters:
         -----------
+        path : str
+            Path to save the PLY file.
+        point_cloud : np.ndarray
+            3D point cloud.
+        colors : np.ndarray
+            Colors associated with the point cloud.
         bundle_adjustment_enabled : bool
             Flag indicating whether bundle adjustment is enabled.
+        binary : bool
+            Flag indicating binary_little_endian instead of ascii PLY.
+
+        Returns:
+        --------
+        int
+            Number of points written.
         """
-        cv2.namedWindow('image', cv2.WINDOW_NORMAL)
-        pose_array = self.img_obj.K.ravel()
-        transform_matrix_0 = np.array([[1,0,0,0],[0,1,0,0],[0,0,1,0]])
-        transform_matrix_1 = np.empty((3,4))
+        output_dir = self.results_dir(bundle_adjustment_enabled)
+
+        ply_filename = os.path.join(output_dir, os.path.splitext(os.path.basename(self.img_obj.image_list[0]))[0] + '.ply')
+        out_points = point_cloud.reshape(-1,3) * self.PLY_SCALE
+        out_colors = colors.reshape(-1, 3)
+
+        # Merge near-duplicate points and drop isolated ones
+        with self.profiler.stage('point_filter'):
+            out_points, out_colors = filter_point_cloud(out_points, out_colors, **self.export_filter)
+        write_ply(ply_filename, out_points, out_colors, binary)
+        if self.lod_tile_size:
+            with self.profiler.stage('octree_export'):
+                write_octree(os.path.splitext(ply_filename)[0] + '_octree', out_points, out_colors, self.lod_tile_size)
+        return len(out_points)
+
+    def save_checkpoint(self) -> str:
+        """
+        Save the reconstruction state as a checkpoint named after the number of registered views,
+        or 'final' once global bundle adjustment has been applied.
+
+        Returns:
+        --------
+        str
+            Directory of the checkpoint.
+        """
+        image_ids = list(self.cameras)
+        arrays = {'K': self.img_obj.K, 'camera_ids': np.array(image_ids, dtype=np.int64),
+                  'camera_transforms': np.array([self.cameras[image_id] for image_id in image_ids], dtype=np.float64).reshape(-1, 3, 4)}
+        for prefix, part in (('tracks_', self.tracks), ('cloud_', self.point_cloud), ('graph_', self.view_graph)):
+            arrays.update((prefix + key, value) for key, value in part.to_arrays().items())
+        metadata = {'dataset': self.img_obj.name, 'images': [os.path.basename(path) for path in self.img_obj.image_list],
+                    'downscale_factor': self.img_obj.factor, 'detector_params': sorted(self.feature_store.detector_params.items()),
+                    'initial_pair': [int(index) for index in self.initial_pair], 'view_errors': self.view_errors, 'global_ba_done': self.global_ba_done}
+        with self.profiler.stage('checkpoint'):
+            directory = save_checkpoint(self.checkpoint_dir, 'final' if self.global_ba_done else 'views_{:05d}'.format(len(image_ids)), arrays, metadata)
+        self._checkpoint_views = len(image_ids)
+        return directory
+
+    def restore_checkpoint(self) -> bool:
+        """
+        Restore the reconstruction state from the latest checkpoint in checkpoint_dir.
+
+        Returns:
+        --------
+        bool
+            True if a checkpoint was restored, False if there is none.
+        """
+        checkpoint = load_checkpoint(self.checkpoint_dir)
+        if checkpoint is None:
+            return False
+        arrays, metadata = checkpoint
+        images = [os.path.basename(path) for path in self.img_obj.image_list]
+        if metadata['images'] != images or metadata['downscale_factor'] != self.img_obj.factor or \
+                metadata['detector_params'] != [list(item) for item in sorted(self.feature_store.detector_params.items())]:
+            raise ValueError('checkpoint in {} was made with other images or settings, remove it to start over'.format(self.checkpoint_dir))
+        self.img_obj.K = np.array(arrays['K'])
+        self.cameras = {int(image_id): np.array(transform) for image_id, transform in zip(arrays['camera_ids'], arrays['camera_transforms'])}
+        self.tracks = FeatureTracks.from_arrays({key[len('tracks_'):]: value for key, value in arrays.items() if key.startswith('tracks_')})
+        self.point_cloud = PointCloud.from_arrays({key[len('cloud_'):]: value for key, value in arrays.items() if key.startswith('cloud_')})
+        self.view_graph = ViewGraph.from_arrays(len(images), {key[len('graph_'):]: value for key, value in arrays.items() if key.startswith('graph_')})
+        self.initial_pair = tuple(metadata['initial_pair'])
+        self.view_errors = [tuple(entry) for entry in metadata['view_errors']]
+        self.global_ba_done = metadata['global_ba_done']
+        self._checkpoint_views = len(self.cameras)
+        return True
 
-        # Initial pose (camera extrinsic matrix)
-        pose_0= np.matmul(self.img_obj.K, transform_matrix_0)
-        pose_1 = np.empty((3,4))
-        total_points= np.zeros((1,3))
-        total_colors = np.zeros((1,3))
+    def register_initial_pair(self, ply_stream:PlyStreamWriter = None) -> None:
+        """
+        Register the initial pair of the view graph, triangulate its tracks and add them to the point cloud.
 
-        # Load and downscale the first two images
-        image_0 = self.img_obj.downscale_image(cv2.imread(self.img_obj.image_list[0]))
-        image_1 = self.img_obj.downscale_image(cv2.imread(self.img_obj.image_list[1]))
+        Parameters:
+        -----------
+        ply_stream : PlyStreamWriter
+            Preview PLY the initial points are appended to, if any.
+        """
+        transform_matrix_0 = np.array([[1,0,0,0],[0,1,0,0],[0,0,1,0]])
+        transform_matrix_1 = np.empty((3,4))
+        first, second = self.initial_pair = self.view_graph.initial_pair(self.min_initial_angle)
 
-        # Feature matching between the first two images
-        features_0, features_1 = self.feature_matching(image_0, image_1)
+        self.tracks = FeatureTracks()
+        edge = self.view_graph.edge(first, second)
+        if 'rotation' in edge:
+            # The relative pose and its inlier matches come from two-view verification
+            keypoints_0, keypoints_1 = edge['matches']
+            rot_matrix, tran_matrix = edge['rotation'], edge['translation']
+            features_0 = self.extract_features(first)[0][keypoints_0]
+            features_1 = self.extract_features(second)[0][keypoints_1]
+        else:
+            # Feature matching between the initial pair
+            keypoints_0, keypoints_1 = self.match_keypoints(first, second)
+            features_0 = self.extract_features(first)[0][keypoints_0]
+            features_1 = self.extract_features(second)[0][keypoints_1]
 
-        # Compute essential matrix and recover pose
-        essential_matrix, em_mask = cv2.findEssentialMat(features_0, features_1, self.img_obj.K, method=cv2.RANSAC, prob=0.999, threshold=0.4, mask=None)
-        features_0 = features_0[em_mask.ravel()==1]
-        features_1 = features_1[em_mask.ravel()==1]
+            # Compute essential matrix and recover pose
+            with self.profiler.stage('pose_estimation', view=second):
+                essential_matrix, em_mask = cv2.findEssentialMat(features_0, features_1, self.img_obj.K, method=cv2.RANSAC, prob=0.999, threshold=0.4, mask=None)
+                features_0, keypoints_0 = features_0[em_mask.ravel()==1], keypoints_0[em_mask.ravel()==1]
+                features_1, keypoints_1 = features_1[em_mask.ravel()==1], keypoints_1[em_mask.ravel()==1]
 
-        _, rot_matrix, tran_matrix , em_mask = cv2.recoverPose(essential_matrix, features_0, features_1, self.img_obj.K)
-        features_0 = features_0[em_mask.ravel()>0]
-        features_1 = features_1[em_mask.ravel() > 0] 
+                _, rot_matrix, tran_matrix , em_mask = cv2.recoverPose(essential_matrix, features_0, features_1, self.img_obj.K)
+            features_0, keypoints_0 = features_0[em_mask.ravel()>0], keypoints_0[em_mask.ravel()>0]
+            features_1, keypoints_1 = features_1[em_mask.ravel()>0], keypoints_1[em_mask.ravel()>0]
         transform_matrix_1[:3, :3]= np.matmul(rot_matrix, transform_matrix_0[:3,:3])
         transform_matrix_1[:3,3]= transform_matrix_0[:3, 3] + np.matmul(transform_matrix_0[:3,:3], tran_matrix.ravel())
 
-        pose_1 = np.matmul(self.img_obj.K, transform_matrix_1)
+        self.cameras = {first: transform_matrix_0.astype(np.float64), second: transform_matrix_1}
+
+        # Start a track for every inlier match of the initial pair
+        self.tracks.add_image(first, len(self.extract_features(first)[0]))
+        self.tracks.add_image(second, len(self.extract_features(second)[0]))
+        track_ids = self.tracks.add_matches(first, second, keypoints_0, keypoints_1)
+        track_ids = track_ids[track_ids >= 0]
 
-        # Triangulate points between the first two images
-        features_0, features_1, points_3d = self.triangulation(pose_0, pose_1, features_0, features_1)
-        error, points_3d= self.reproj_error(points_3d, features_1, transform_matrix_1, self.img_obj.K, homogenity=1)
+        # Triangulate points between the initial pair
+        with self.profiler.stage('triangulation', view=second):
+            track_ids, points_3d, errors = self.triangulate_new_tracks(track_ids)
+        points_1 = self.extract_features(second)[0][self.tracks.keypoint_of(track_ids, second)]
+        with self.profiler.stage('reprojection_error', view=second):
+            error, points_3d= self.reproj_error(points_3d, points_1, transform_matrix_1, self.img_obj.K, homogenity=0)
         print("Reprojection error for first two images:", error)
-        _,_, features_1, points_3d, _ = self.solve_PnP(points_3d, features_1, self.img_obj.K, np.zeros((5,1), dtype=np.float32), features_0, initial=1)
+        points_3d = points_3d.reshape(-1, 3)
+        self.tracks.set_points(track_ids, points_3d)
+        color_vector = sample_colors(self.img_obj.load_image(second), points_1)
+        self.point_cloud.append(points_3d, color_vector, track_ids, errors)
+        if ply_stream is not None:
+            ply_stream.append(points_3d * self.PLY_SCALE, color_vector)
 
-        total_images = len(self.img_obj.image_list) - 2
-        pose_array = np.hstack((np.hstack((pose_array, pose_0.ravel())), pose_1.ravel()))
+    def register_view(self, view:int, bundle_adjustment_mode:str = None, local_ba:LocalBundleAdjustmentScheduler = None, ply_stream:PlyStreamWriter = None) -> tuple:
+        """
+        Register a view by PnP against the triangulated tracks and triangulate the tracks it completes.
 
-        # after the first two images, start adding a single image to the group and repeat till last image is added.
-        threshold = 0.5
-        for i in tqdm(range(total_images)):
-            image_2 = self.img_obj.downscale_image(cv2.imread(self.img_obj.image_list[i+2]))
-            features_cur, features_2 = self.feature_matching(image_1, image_2)
+        Parameters:
+        -----------
+        view : int
+            Index of the image to register.
+        bundle_adjustment_mode : str
+            'view' or 'local' to refine the reconstruction after the view is added, None to skip.
+        local_ba : LocalBundleAdjustmentScheduler
+            Scheduler deciding when 'local' adjustment runs.
+        ply_stream : PlyStreamWriter
+            Preview PLY the new points are appended to, if any.
 
-            if i !=0:
-                features_0 , features_1, points_3d = self. triangulation(pose_0, pose_1, features_0, features_1)
-                features_1= features_1.T
-                points_3d= cv2.convertPointsFromHomogeneous(points_3d.T)
+        Returns:
+        --------
+        tuple
+            Reprojection error of the new points and the decoded image, None if the view was not
+            registered because it observes fewer than MIN_PNP_POINTS triangulated tracks or PnP failed.
+        """
+        with self.profiler.stage('decode', view=view):
+            image_2 = self.img_obj.load_image(view)
+        features_2 = self.extract_features(view)[0]
+        self.tracks.add_image(view, len(features_2))
 
-            cm_points_0, cm_points_1, cm_mask_0, cm_mask_1= self.find_common_points(features_1,features_cur, features_2)
-            cm_points_2 = features_2[cm_points_1]
-            cm_points_cur = features_cur[cm_points_1]
+        # Extend the tracks of every registered neighbour into the new view
+        neighbors = [other for other in self.view_graph.neighbors(view) if other in self.cameras]
+        for other in neighbors:
+            keypoints_other, keypoints_2 = self.pair_matches(other, view)
+            self.tracks.add_matches(other, view, keypoints_other, keypoints_2)
 
-            rot_matrix, tran_matrix, cm_points_2, points_3d, cm_points_cur = self.solve_PnP(points_3d[cm_points_0], cm_points_2, self.img_obj.K, np.zeros((5, 1), dtype=np.float32), cm_points_cur, initial = 0)
-            transform_matrix_1= np.hstack((rot_matrix, tran_matrix))
-            pose_2 = np.matmul(self.img_obj.K, transform_matrix_1)
+        # Tracks that already have a 3D point give the 2D-3D correspondences for PnP
+        cm_keypoints_2, cm_track_ids = self.tracks.observed_tracks(view, triangulated=True)
+        if len(cm_track_ids) < self.MIN_PNP_POINTS:
+            return None
+        with self.profiler.stage('pnp', view=view):
+            pose = self.solve_PnP(self.tracks.points[cm_track_ids], features_2[cm_keypoints_2], self.img_obj.K, np.zeros((5, 1), dtype=np.float32), cm_track_ids, initial = 0)
+        if pose is None:
+            return None
+        rot_matrix, tran_matrix, cm_points_2, points_3d, cm_track_ids = pose
+        transform_matrix_1= np.hstack((rot_matrix, tran_matrix))
 
+        with self.profiler.stage('reprojection_error', view=view):
             error, points_3d= self.reproj_error(points_3d, cm_points_2, transform_matrix_1, self.img_obj.K, homogenity=0)
 
-            cm_mask_0, cm_mask_1, points_3d= self.triangulation(pose_1, pose_2, cm_mask_0, cm_mask_1)
-            error, points_3d = self.reproj_error(points_3d, cm_mask_1, transform_matrix_1, self.img_obj.K, homogenity=1)
-            print("Reprojection error:", error)
-            pose_array = np.hstack((pose_array, pose_2.ravel()))
-
-            if bundle_adjustmenet_enabled:
-                points_3d, cm_mask_1, transform_matrix_1 = self.compute_bundle_adjustment(points_3d, cm_mask_1, transform_matrix_1, self.img_obj.K, threshold)
-                pose_2 = np.matmul(self.img_obj.K, transform_matrix_1)
-                error, points_3d = self.reproj_error(points_3d, cm_mask_1, transform_matrix_1, self.img_obj.K, homogenity = 0)
-                print("Reprojection error after Bundle Adjustment: ",error)
-                total_points = np.vstack((total_points, points_3d))
-                points_left = np.array(cm_mask_1, dtype=np.int32)
-                color_vector = np.array([image_2[l[1], l[0]] for l in points_left])
-                total_colors = np.vstack((total_colors, color_vector))
-            else:
-                total_points = np.vstack((total_points, points_3d[:, 0, :]))
-                points_left = np.array(cm_mask_1, dtype=np.int32)
-                color_vector = np.array([image_2[l[1], l[0]] for l in points_left.T])
-                total_colors = np.vstack((total_colors, color_vector)) 
+        # Triangulate every untriangulated track of the new view from all its registered observations
+        self.cameras[view] = transform_matrix_1
+        _, candidate_track_ids = self.tracks.observed_tracks(view, triangulated=False)
+        with self.profiler.stage('triangulation', view=view):
+            new_track_ids, points_3d, new_errors = self.triangulate_new_tracks(candidate_track_ids)
+        new_points_2 = features_2[self.tracks.keypoint_of(new_track_ids, view)]
+        with self.profiler.stage('reprojection_error', view=view):
+            error, points_3d = self.reproj_error(points_3d, new_points_2, transform_matrix_1, self.img_obj.K, homogenity=0)
+        print("Reprojection error:", error)
+
+        points_3d = points_3d.reshape(-1, 3)
+        self.tracks.set_points(new_track_ids, points_3d)
+        if bundle_adjustment_mode == 'view' and len(new_track_ids):
+            # Refine the new pose and every track it observes against the fixed registered cameras
+            with self.profiler.stage('bundle_adjustment', view=view):
+                self.local_bundle_adjustment([view], max_nfev=self.VIEW_BA_MAX_NFEV)
+            transform_matrix_1 = self.cameras[view]
+            points_3d = self.tracks.points[new_track_ids]
+            error, points_3d = self.reproj_error(points_3d, new_points_2, transform_matrix_1, self.img_obj.K, homogenity = 0)
+            print("Reprojection error after Bundle Adjustment: ",error)
+            new_errors = self.point_errors(points_3d, new_points_2, transform_matrix_1, self.img_obj.K)
+            self.point_cloud.update_from_tracks(self.tracks)
+        color_vector = sample_colors(image_2, new_points_2)
+        self.point_cloud.append(points_3d, color_vector, new_track_ids, new_errors)
+        if ply_stream is not None:
+            ply_stream.append(points_3d * self.PLY_SCALE, color_vector)
+
+        if bundle_adjustment_mode == 'local' and local_ba.step(float(np.mean(new_errors)) if len(new_errors) else 0.0):
+            with self.profiler.stage('bundle_adjustment', view=view):
+                ba_before, ba_after = self.local_bundle_adjustment(local_ba.window(self.cameras))
+            print("Mean reprojection error before and after local Bundle Adjustment:", ba_before, ba_after)
+            self.point_cloud.update_from_tracks(self.tracks)
    
-            transform_matrix_0 = np.copy(transform_matrix_1)
-            pose_0 = np.copy(pose_1)
-            plt.scatter(i, error)
-            plt.pause(0.05)
-
-            image_0 = np.copy(image_1)
-            image_1 = np.copy(image_2)
-            features_0 = np.copy(features_cur)
-            features_1 = np.copy(features_2)
-            pose_1 = np.copy(pose_2)
-            cv2.imshow(self.img_obj.image_list[0].split('\\')[-2], image_2)
-            if cv2.waitKey(1) & 0xff == ord('q'):
-                break
-        cv2.destroyAllWindows()
+        return error, image_2
 
-        if bundle_adjustmenet_enabled:
-            plot_dir = os.path.join(self.img_obj.path, 'Results with Bundle Adjustment')
-        else:
-            plot_dir = os.path.join(self.img_obj.path, 'Results')
+    def __call__(
+            self,
+            bundle_adjustment_enabled:bool = False,
+            bundle_adjustment_mode:str = 'view',
+            refine_intrinsics:bool = False,
+            stream_ply:bool = False,
+            headless:bool = False,
+            resume:bool = False,
+            bundle_adjustmenet_enabled:bool = None
+    ):
+        """
+        Run the Structure from Motion pipeline.
+
+        Parameters:
+        -----------
+        bundle_adjustment_enabled : bool
+            Flag indicating whether bundle adjustment is enabled.
+        bundle_adjustment_mode : str
+            'view' refines each new view and the tracks it observes against the fixed earlier cameras
+            as it is added, 'local' refines the last local_ba_window cameras and the points they
+            observe when the scheduler triggers,
+            'global' refines all cameras and points together once every view is registered.
+        refine_intrinsics : bool
+            Flag indicating whether global bundle adjustment also refines the shared intrinsics.
+        stream_ply : bool
+            Flag indicating whether the points of every view are appended to a preview PLY
+            (unfiltered, before global bundle adjustment) as soon as the view is registered.
+        headless : bool
+            Flag indicating that no windows are opened, for machines without a display.
+        resume : bool
+            Flag indicating whether to continue from the latest checkpoint in checkpoint_dir, if any.
+        bundle_adjustmenet_enabled : bool
+            Deprecated misspelling of bundle_adjustment_enabled, overrides it if given.
+
+        Returns:
+        --------
+        dict
+            Dataset name, number of registered views, number of exported points and mean reprojection error.
+        """
+        if bundle_adjustmenet_enabled is not None:
+            warnings.warn('bundle_adjustmenet_enabled is deprecated, use bundle_adjustment_enabled', DeprecationWarning, stacklevel=2)
+            bundle_adjustment_enabled = bundle_adjustmenet_enabled
+        if bundle_adjustment_mode not in ('view', 'local', 'global'):
+            raise ValueError("bundle_adjustment_mode must be 'view', 'local' or 'global', got {!r}".format(bundle_adjustment_mode))
+        if not headless:
+            cv2.namedWindow('image', cv2.WINDOW_NORMAL)
+        self.point_cloud = PointCloud()
+
+        ply_stream = None
+        try:
+            if stream_ply:
+                ply_stream = PlyStreamWriter(os.path.join(self.results_dir(bundle_adjustment_enabled), os.path.splitext(os.path.basename(self.img_obj.image_list[0]))[0] + '_preview.ply'))
+
+            # Start extracting features for every image in parallel ahead of the reconstruction
+            self.prefetcher = FeaturePrefetcher(self.feature_store, self.img_obj.image_list, self.img_obj.factor, self.feature_workers, self.prefetch_size, self.record_timings)
+
+            total_images = len(self.img_obj.image_list) - 2
+            self.view_errors = []
+            self.global_ba_done = False
+            self._checkpoint_views = 0
+            if resume and self.restore_checkpoint():
+                print("Resumed from checkpoint with", len(self.cameras), "registered views")
+                for step, error in self.view_errors:
+                    plt.scatter(step, error)
+            else:
+                self.view_graph = self.build_view_graph()
+                self.register_initial_pair(ply_stream)
 
-        if not os.path.exists(plot_dir):
-            os.makedirs(plot_dir)
+            # after the initial pair, register the image most strongly linked to the registered ones and repeat till no image is left.
+            local_ba = LocalBundleAdjustmentScheduler(self.local_ba_window, self.local_ba_every, self.local_ba_threshold)
+            skipped = set()
+            start = len(self.cameras) - 2
+            for i in tqdm(range(start, total_images), initial=start, total=total_images):
+                view = self.view_graph.next_best_view(set(self.cameras) | skipped)
+                if view is None:
+                    print("No remaining image is linked to the reconstruction, stopping after", len(self.cameras), "views")
+                    break
+                registered = self.register_view(view, bundle_adjustment_mode if bundle_adjustment_enabled else None, local_ba, ply_stream)
+                if registered is None:
+                    print("Could not estimate the pose of view", view, "- skipping it")
+                    skipped.add(view)
+                    continue
+                error, image_2 = registered
+
+                plt.scatter(i, error)
+                self.view_errors.append((i, float(error)))
+                if self.checkpoint_every and len(self.cameras) % self.checkpoint_every == 0:
+                    self.save_checkpoint()
+
+                if not headless:
+                    plt.pause(0.05)
+                    cv2.imshow(self.img_obj.name, image_2)
+                    if cv2.waitKey(1) & 0xff == ord('q'):
+                        break
+            if not headless:
+                cv2.destroyAllWindows()
+            if self.checkpoint_every and len(self.cameras) != self._checkpoint_views:
+                self.save_checkpoint()
+        finally:
+            # Also on errors, so a batch run does not carry a live worker pool into the next dataset
+            if self.prefetcher is not None:
+                self.prefetcher.close()
+                self.prefetcher = None
+            if ply_stream is not None:
+                ply_stream.close()
+
+        if bundle_adjustment_enabled and bundle_adjustment_mode == 'global' and not self.global_ba_done:
+            with self.profiler.stage('bundle_adjustment'):
+                error, ba_error = self.global_bundle_adjustment(refine_intrinsics, gtol=1e-8)
+            print("Mean reprojection error before and after global Bundle Adjustment:", error, ba_error)
+            self.point_cloud.update_from_tracks(self.tracks)
+            self.global_ba_done = True
+            if self.checkpoint_every:
+                self.save_checkpoint()
+        plot_dir = self.results_dir(bundle_adjustment_enabled)
 
         plt.xlabel('Image Index')
         plt.ylabel('Reprojection Error')
         plt.title('Reprojection Error Plot')
         plt.savefig(os.path.join(plot_dir, 'reprojection_errors.png'))
         plt.close()
+        return self.write_results(bundle_adjustment_enabled)
+
+    def write_results(self, bundle_adjustment_enabled:bool) -> dict:
+        """
+        Write the point cloud, the camera poses and the stage timings of the current reconstruction.
+
+        Parameters:
+        -----------
+        bundle_adjustment_enabled : bool
+            Flag indicating whether bundle adjustment is enabled, which selects the results directory.
+
+        Returns:
+        --------
+        dict
+            Dataset name, number of registered views, number of exported points and mean reprojection error.
+        """
+        pose_array = np.hstack([self.img_obj.K.ravel()] + [np.matmul(self.img_obj.K, self.cameras[image_id]).ravel() for image_id in sorted(self.cameras)])
+        output_dir = self.results_dir(bundle_adjustment_enabled)
 
         print("Saving to .ply file.......")
-        print(total_points.shape, total_colors.shape)
-        self.save_to_ply(self.img_obj.path, total_points, total_colors, bundle_adjustmenet_enabled)
+        print(self.point_cloud.points.shape, self.point_cloud.colors.shape)
+        with self.profiler.stage('ply_export'):
+            num_points = self.save_to_ply(self.img_obj.path, self.point_cloud.points, self.point_cloud.colors, bundle_adjustment_enabled)
         print("Saved the point cloud to .ply file!!!")
-        np.savetxt(self.img_obj.path + '\\Results\\' + self.img_obj.image_list[0].split('\\')[-2]+'_pose_array.csv', pose_array, delimiter = '\n')
+        np.savetxt(os.path.join(output_dir, self.img_obj.name + '_pose_array.csv'), pose_array, delimiter = '\n')
+        self.profiler.to_json(os.path.join(output_dir, 'timings.json'))
+        self.profiler.to_csv(os.path.join(output_dir, 'timings.csv'))
+        return {'dataset': self.img_obj.name, 'registered_views': len(self.cameras), 'points': num_points, 'mean_reprojection_error': self.mean_reprojection_error()}
+
+    def start_stream(self, bundle_adjustment_enabled:bool = False, bundle_adjustment_mode:str = 'local', stream_ply:bool = False) -> None:
+        """
+        Start an online reconstruction that images are pushed into one at a time with add_image.
+
+        The reconstruction starts empty, images already in the image directory are only
+        used once pushed. Every new image is paired with the stream_window images before
+        it and the pairs are verified at once, so their inlier matches outlive the
+        descriptors, which are released when an image leaves the window.
+
+        Parameters:
+        -----------
+        bundle_adjustment_enabled : bool
+            Flag indicating whether bundle adjustment is enabled.
+        bundle_adjustment_mode : str
+            'view' or 'local' refine the reconstruction while images arrive, 'global' once in finish_stream.
+        stream_ply : bool
+            Flag indicating whether the points of every view are appended to a preview PLY as soon as the view is registered.
+        """
+        if bundle_adjustment_mode not in ('view', 'local', 'global'):
+            raise ValueError("bundle_adjustment_mode must be 'view', 'local' or 'global', got {!r}".format(bundle_adjustment_mode))
+        self.img_obj.image_list = []
+        self.img_obj._frames.clear()
+        self.view_graph = ViewGraph(0)
+        self.tracks = None
+        self.point_cloud = PointCloud()
+        self.cameras = {}
+        self.initial_pair = None
+        self.view_errors = []
+        self.global_ba_done = False
+        ply_stream = None
+        if stream_ply:
+            ply_stream = PlyStreamWriter(os.path.join(self.results_dir(bundle_adjustment_enabled), self.img_obj.name + '_preview.ply'))
+        self._stream = {'bundle_adjustment_enabled': bundle_adjustment_enabled, 'bundle_adjustment_mode': bundle_adjustment_mode, 'ply_stream': ply_stream,
+                        'local_ba': LocalBundleAdjustmentScheduler(self.local_ba_window, self.local_ba_every, self.local_ba_threshold)}
+
+    def add_image(self, image_path:str) -> list:
+        """
+        Push a new image into the stream and register every view it makes registrable.
+
+        Until the reconstruction is initialized images are only matched, it starts from
+        the first verified pair with a median triangulation angle of min_initial_angle,
+        or from the strongest pair once stream_window images have arrived without one.
+
+        Parameters:
+        -----------
+        image_path : str
+            Path of the image file, images pushed before are ignored.
+
+        Returns:
+        --------
+        list
+            Indices of the views registered by this call, in registration order.
+        """
+        if self._stream is None:
+            raise RuntimeError('call start_stream before pushing images')
+        if image_path in self.img_obj.image_list:
+            return []
+        view = self.img_obj.add_image(image_path)
+        self.view_graph.add_image()
+
+        # Verify the pairs with the window right away, while their descriptors are in memory
+        window = range(max(0, view - self.stream_window), view)
+        features = {index: self.extract_features(index) for index in list(window) + [view]}
+        pairs = [(other, view) for other in window]
+        for other, _ in pairs:
+            self.view_graph.add_edge(other, view, score=1.0)
+        with self.profiler.stage('verification', view=view):
+            verify_view_graph(self.view_graph, {index: points for index, (points, _) in features.items()}, {index: descriptors for index, (_, descriptors) in features.items()}, self.matcher, self.img_obj.K,
+                              self.verification_workers, self.min_pair_inliers, on_pair=self.record_pair_timings, pairs=pairs)
+        if view >= self.stream_window:
+            self.feature_store.release(self.img_obj.image_list[view - self.stream_window], self.img_obj.factor)
+
+        registered = []
+        if self.initial_pair is None:
+            wide = any(edge['triangulation_angle'] >= self.min_initial_angle for edge in self.view_graph.edges.values())
+            if not wide and not (self.view_graph.edges and view >= self.stream_window):
+                return registered
+            self.register_initial_pair(self._stream['ply_stream'])
+            registered.extend(self.initial_pair)
+
+        skipped = set()
+        while True:
+            next_view = self.view_graph.next_best_view(set(self.cameras) | skipped)
+            if next_view is None:
+                break
+            result = self.register_view(next_view, self._stream['bundle_adjustment_mode'] if self._stream['bundle_adjustment_enabled'] else None, self._stream['local_ba'], self._stream['ply_stream'])
+            if result is None:
+                skipped.add(next_view)
+                continue
+            self.view_errors.append((len(self.cameras) - 3, float(result[0])))
+            registered.append(next_view)
+        return registered
+
+    def snapshot(self) -> dict:
+        """
+        Copy the current reconstruction, e.g. to preview it while images are still arriving.
+
+        Returns:
+        --------
+        dict
+            (N, 3) 'points', (N, 3) BGR 'colors', 'poses' mapping the path of every registered
+            image to its 3x4 extrinsic matrix, and the intrinsic matrix 'K'.
+        """
+        return {'points': self.point_cloud.points.copy(), 'colors': self.point_cloud.colors.copy(), 'K': self.img_obj.K.copy(),
+                'poses': {self.img_obj.image_list[image_id]: transform.copy() for image_id, transform in self.cameras.items()}}
+
+    def flush(self) -> dict:
+        """
+        Write the results of the current reconstruction, overwriting those of the previous flush.
+
+        Returns:
+        --------
+        dict
+            Summary returned by write_results, without writing anything before the reconstruction is initialized.
+        """
+        if self.initial_pair is None:
+            return {'dataset': self.img_obj.name, 'registered_views': 0, 'points': 0, 'mean_reprojection_error': float('nan')}
+        return self.write_results(self._stream['bundle_adjustment_enabled'] if self._stream is not None else False)
+
+    def finish_stream(self, refine_intrinsics:bool = False) -> dict:
+        """
+        End the stream, run global bundle adjustment if requested and write the results.
+
+        Parameters:
+        -----------
+        refine_intrinsics : bool
+            Flag indicating whether global bundle adjustment also refines the shared intrinsics.
+
+        Returns:
+        --------
+        dict
+            Summary returned by flush.
+        """
+        if self._stream['ply_stream'] is not None:
+            self._stream['ply_stream'].close()
+        if self._stream['bundle_adjustment_enabled'] and self._stream['bundle_adjustment_mode'] == 'global' and self.initial_pair is not None:
+            with self.profiler.stage('bundle_adjustment'):
+                error, ba_error = self.global_bundle_adjustment(refine_intrinsics, gtol=1e-8)
+            print("Mean reprojection error before and after global Bundle Adjustment:", error, ba_error)
+            self.point_cloud.update_from_tracks(self.tracks)
+            self.global_ba_done = True
+        summary = self.flush()
+        self._stream = None
+        return summary
+
+    def stream(self, source, bundle_adjustment_enabled:bool = False, bundle_adjustment_mode:str = 'local', refine_intrinsics:bool = False, stream_ply:bool = False, flush_every:int = 0) -> dict:
+        """
+        Reconstruct online from an iterable of image paths, e.g. a generator or watch_directory.
+
+        Parameters:
+        -----------
+        source : iterable
+            Image paths in capture order, consumed until exhausted or interrupted with Ctrl+C.
+        bundle_adjustment_enabled : bool
+            Flag indicating whether bundle adjustment is enabled.
+        bundle_adjustment_mode : str
+            'view' or 'local' refine the reconstruction while images arrive, 'global' once at the end.
+        refine_intrinsics : bool
+            Flag indicating whether global bundle adjustment also refines the shared intrinsics.
+        stream_ply : bool
+            Flag indicating whether the points of every view are appended to a preview PLY as soon as the view is registered.
+        flush_every : int
+            Number of registered views between two flushes of the results, 0 only writes them at the end.
+
+        Returns:
+        --------
+        dict
+            Summary returned by finish_stream.
+        """
+        self.start_stream(bundle_adjustment_enabled, bundle_adjustment_mode, stream_ply)
+        next_flush = flush_every
+        try:
+            for image_path in tqdm(source, unit='image'):
+                registered = self.add_image(image_path)
+                if registered:
+                    print("Registered views", registered, "-", len(self.cameras), "of", len(self.img_obj.image_list), "images,", len(self.point_cloud), "points")
+                if flush_every and len(self.cameras) >= next_flush:
+                    self.flush()
+                    next_flush = len(self.cameras) + flush_every
+        except KeyboardInterrupt:
+            print("Stream interrupted after", len(self.img_obj.image_list), "images")
+        return self.finish_stream(refine_intrinsics)
+
+def run_job(img_dir:str, output_dir:str, options:dict) -> dict:
+    """
+    Run the pipeline on one dataset, catching any failure.
+
+    Parameters:
+    -----------
+    img_dir : str
+        Directory containing images and intrinsic matrix.
+    output_dir : str
+        Directory the results of this dataset are written to.
+    options : dict
+        Keyword arguments of StructurefromMotion ('init') and of its __call__ ('run'), plus
+        'profile' to run under cProfile and 'trace_memory' to trace heap peaks per stage.
+        With 'watch', keyword arguments of watch_directory, img_dir is reconstructed online
+        by StructurefromMotion.stream instead and 'run' holds the arguments of stream.
+
+    Returns:
+    --------
+    dict
+        Dataset name, status, exit code, wall time in seconds and error message, plus the
+        reconstruction summary returned by StructurefromMotion.__call__ on success.
+    """
+    start = time.time()
+    name = os.path.basename(os.path.normpath(img_dir))
+    try:
+        profiler = PipelineProfiler(trace_memory=options.get('trace_memory', False))
+        sfm = StructurefromMotion(img_dir, output_dir=output_dir, profiler=profiler, **options.get('init', {}))
+        if options.get('watch') is not None:
+            summary = sfm.stream(watch_directory(img_dir, **options['watch']), **options.get('run', {}))
+        elif options.get('profile', False):
+            os.makedirs(output_dir, exist_ok=True)
+            summary = profile_call(sfm, os.path.join(output_dir, 'profile.pstats'), **options.get('run', {}))
+        else:
+            summary = sfm(**options.get('run', {}))
+    except Exception as e:
+        traceback.print_exc()
+        return {'dataset': name, 'status': 'failed', 'exit_code': 1, 'seconds': time.time() - start, 'error': '{}: {}'.format(type(e).__name__, e)}
+    finally:
+        plt.close('all')
+    return dict(summary, dataset=name, status='ok', exit_code=0, seconds=time.time() - start, error='')
+
+
+def run_batch(img_dirs:list, output_root:str, options:dict, jobs:int = 1) -> list:
+    """
+    Run the pipeline on several datasets in a process pool, one output directory per dataset.
+
+    Parameters:
+    -----------
+    img_dirs : list
+        Dataset directories.
+    output_root : str
+        Directory holding one results subdirectory per dataset.
+    options : dict
+        Options passed to run_job.
+    jobs : int
+        Number of datasets processed concurrently.
+
+    Returns:
+    --------
+    list
+        Result dictionary of every dataset, in the order of img_dirs.
+    """
+    output_dirs = [os.path.join(output_root, os.path.basename(os.path.normpath(img_dir))) for img_dir in img_dirs]
+    if jobs <= 1 or len(img_dirs) <= 1:
+        return [run_job(img_dir, output_dir, options) for img_dir, output_dir in zip(img_dirs, output_dirs)]
+    with ProcessPoolExecutor(jobs) as executor:
+        return list(executor.map(run_job, img_dirs, output_dirs, [options] * len(img_dirs)))
+
+
+def find_datasets(root:str) -> list:
+    """
+    List the subdirectories of root that contain a K.txt file.
+    """
+    return [os.path.join(root, name) for name in sorted(os.listdir(root)) if os.path.isfile(os.path.join(root, name, 'K.txt'))]
+
+
+def main(argv=None) -> int:
+    """
+    Command line entry point, returns 0 if every dataset succeeded and 1 otherwise.
+    """
+    parser = argparse.ArgumentParser(description='Run Structure from Motion on one or more datasets.')
+    parser.add_argument('datasets', nargs='*', help='dataset directories (images and K.txt), defaults to every dataset under --datasets-root')
+    parser.add_argument('--datasets-root', default='Datasets', help='directory searched for datasets when none are given')
+    parser.add_argument('--output-dir', default='Results', help='root directory, each dataset gets its own subdirectory')
+    parser.add_argument('--downscale', type=float, default=2.0, help='image downscale factor')
+    parser.add_argument('--bundle-adjustment', choices=('off', 'view', 'local', 'global'), default='off', help='bundle adjustment mode')
+    parser.add_argument('--local-ba-window', type=int, default=5, help='cameras refined by --bundle-adjustment local')
+    parser.add_argument('--local-ba-every', type=int, default=5, help='maximum number of views between two local adjustments')
+    parser.add_argument('--local-ba-threshold', type=float, default=1.0, help='mean reprojection error in pixels of a new view that triggers a local adjustment')
+    parser.add_argument('--matcher', choices=FeatureMatcher.BACKENDS, default='bf', help='descriptor matcher backend')
+    parser.add_argument('--pairs', choices=('sequential', 'retrieval'), default='sequential', help='match consecutive images, or propose pairs by image retrieval for unordered collections')
+    parser.add_argument('--retrieval-neighbors', type=int, default=5, help='candidate pairs proposed per image by --pairs retrieval')
+    parser.add_argument('--no-verify', action='store_true', help='skip two-view verification of the candidate pairs and start from the first pair')
+    parser.add_argument('--checkpoint-every', type=int, default=5, help='save the reconstruction state every N registered views, 0 disables checkpoints')
+    parser.add_argument('--resume', action='store_true', help='continue every dataset from its latest checkpoint, if any')
+    parser.add_argument('--voxel-size', type=float, default=None, help='voxel edge length in PLY units the exported cloud is downsampled with, by default the median point spacing, 0 disables downsampling')
+    parser.add_argument('--no-point-filter', action='store_true', help='export every point, without voxel downsampling and outlier removal')
+    parser.add_argument('--lod-tile-size', type=int, default=100000, help='points per tile of the level-of-detail octree written next to the .ply file, 0 disables it')
+    parser.add_argument('--watch', action='store_true', help='reconstruct a single dataset online, registering images as they appear in its directory')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds between two scans of the watched directory')
+    parser.add_argument('--idle-timeout', type=float, default=None, help='stop watching after this many seconds without a new image, by default a file named STOP ends the watch')
+    parser.add_argument('--stream-window', type=int, default=5, help='most recent images every new image is matched against with --watch')
+    parser.add_argument('--flush-every', type=int, default=5, help='write the results every N registered views with --watch, 0 only at the end')
+    parser.add_argument('--jobs', type=int, default=1, help='number of datasets processed concurrently')
+    parser.add_argument('--feature-workers', type=int, default=None, help='feature extraction processes per dataset')
+    parser.add_argument('--profile', action='store_true', help='run every dataset under cProfile and write profile.pstats to its output directory')
+    parser.add_argument('--trace-memory', action='store_true', help='record the peak Python heap of every stage with tracemalloc')
+    parser.add_argument('--gui', action='store_true', help='show the images and error plot while running (single dataset only)')
+    args = parser.parse_args(argv)
+
+    img_dirs = args.datasets or find_datasets(args.datasets_root)
+    if not img_dirs:
+        parser.error('no datasets found')
+    if args.watch and len(img_dirs) != 1:
+        parser.error('--watch takes exactly one dataset directory')
+    export_filter = {'voxel_size': args.voxel_size}
+    if args.no_point_filter:
+        export_filter = {'voxel_size': 0, 'num_neighbors': 0, 'radius': 0}
+    jobs = max(1, min(args.jobs, len(img_dirs)))
+    feature_workers = args.feature_workers if args.feature_workers is not None else max(1, (os.cpu_count() or 1) // jobs)
+    options = {
+        'init': {'downscale_factor': args.downscale, 'matcher': args.matcher, 'feature_workers': feature_workers, 'pair_selection': args.pairs, 'retrieval_neighbors': args.retrieval_neighbors,
+                 'verify_pairs': not args.no_verify, 'checkpoint_every': args.checkpoint_every,
+                 'local_ba_window': args.local_ba_window, 'local_ba_every': args.local_ba_every, 'local_ba_threshold': args.local_ba_threshold, 'stream_window': args.stream_window,
+                 'export_filter': export_filter, 'lod_tile_size': args.lod_tile_size},
+        'run': {'bundle_adjustment_enabled': args.bundle_adjustment != 'off', 'bundle_adjustment_mode': args.bundle_adjustment if args.bundle_adjustment != 'off' else 'view',
+                'headless': not (args.gui and len(img_dirs) == 1), 'resume': args.resume},
+        'profile': args.profile,
+        'trace_memory': args.trace_memory,
+    }
+    if args.watch:
+        options['watch'] = {'poll_interval': args.poll_interval, 'idle_timeout': args.idle_timeout}
+        options['run'] = {'bundle_adjustment_enabled': args.bundle_adjustment != 'off', 'bundle_adjustment_mode': args.bundle_adjustment if args.bundle_adjustment != 'off' else 'local',
+                          'flush_every': args.flush_every}
+
+    results = run_batch(img_dirs, args.output_dir, options, jobs)
+    for result in results:
+        print('{:<20s} {:<7s} exit={} {:8.1f}s {}'.format(result['dataset'], result['status'], result['exit_code'], result['seconds'], result['error']))
+    return max(result['exit_code'] for result in results)
+
 
 if __name__ == '__main__':
-    sfm = StructurefromMotion("Datasets\\fountain-P11")
-    sfm()
-    # sfm(bundle_adjustment_enabled=True)
+    sys.exit(main())
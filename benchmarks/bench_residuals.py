@@ -0,0 +1,127 @@
+"""
+Micro-benchmark of the reprojection residual and Jacobian used by bundle adjustment.
+
+Compares the original per-point residual of optimize_reproj_error against the
+batched residual of bundle_adjustment.project, and finite-difference against
+closed-form Jacobians of the multi-view residual. Run from the repository root:
+
+    python benchmarks/bench_residuals.py --points 5000 --cameras 20
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bundle_adjustment import bundle_adjustment, bundle_adjustment_sparsity, project, reprojection_jacobian, transform_to_params
+
+
+def legacy_optimize_reproj_error(obj_points) -> np.ndarray:
+    """
+    Frozen copy of the per-point residual optimize_reproj_error used before it was vectorized, kept as the baseline.
+    """
+    transform_matrix = obj_points[0:12].reshape((3,4))
+    K = obj_points[12:21].reshape((3,3))
+    rest= int(len(obj_points[21:])* 0.4)
+    p = obj_points[21:21 + rest].reshape((2, int(rest/2))).T
+    obj_points = obj_points[21 + rest:].reshape((int(len(obj_points[21 + rest:])/3),3))
+    rot_vector , _ = cv2.Rodrigues(transform_matrix[:3,:3])
+    image_points ,_ =cv2.projectPoints(obj_points, rot_vector, transform_matrix[:3, 3], K, None)
+    image_points = image_points[:,0,:]
+    error = [(p[idx]- image_points[idx])**2 for idx in range(len(p))]
+    return np.array(error).ravel()/len(p)
+
+
+def batched_reproj_error(obj_points) -> np.ndarray:
+    """
+    The residual of legacy_optimize_reproj_error computed with the batched project of bundle adjustment.
+    """
+    transform_matrix = obj_points[0:12].reshape((3, 4))
+    K = obj_points[12:21].reshape((3, 3))
+    rest = int(len(obj_points[21:]) * 0.4)
+    p = obj_points[21:21 + rest].reshape((2, rest // 2)).T
+    points = obj_points[21 + rest:].reshape(-1, 3)
+    camera_params = np.broadcast_to(transform_to_params(transform_matrix), (len(points), 6))
+    image_points = project(points, camera_params, np.array([K[0, 0], K[1, 1], K[0, 2], K[1, 2]]))
+    return ((p - image_points) ** 2).ravel() / len(p)
+
+
+def rate(function, min_time:float = 1.0) -> float:
+    """
+    Call function repeatedly for at least min_time seconds and return calls per second.
+    """
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return calls / elapsed
+
+
+def make_problem(num_cameras:int, num_points:int, seed:int = 0) -> tuple:
+    """
+    Build a synthetic scene where every camera observes every point.
+    """
+    rng = np.random.default_rng(seed)
+    camera_params = np.hstack((rng.normal(0, 0.1, (num_cameras, 3)), rng.normal(0, 0.5, (num_cameras, 3))))
+    points_3d = rng.normal(0, 1, (num_points, 3)) + [0, 0, 8]
+    intrinsics = np.array([1380.0, 1382.0, 760.0, 503.0])
+    camera_indices = np.repeat(np.arange(num_cameras), num_points)
+    point_indices = np.tile(np.arange(num_points), num_cameras)
+    points_2d = project(points_3d[point_indices], camera_params[camera_indices], intrinsics) + rng.normal(0, 0.5, (len(point_indices), 2))
+    return camera_params, points_3d, intrinsics, camera_indices, point_indices, points_2d
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--points', type=int, default=2000, help='number of 3D points')
+    parser.add_argument('--cameras', type=int, default=10, help='number of cameras observing every point')
+    parser.add_argument('--min-time', type=float, default=1.0, help='seconds spent on each measurement')
+    args = parser.parse_args(argv)
+
+    camera_params, points_3d, intrinsics, camera_indices, point_indices, points_2d = make_problem(args.cameras, args.points)
+    K = np.array([[intrinsics[0], 0, intrinsics[2]], [0, intrinsics[1], intrinsics[3]], [0, 0, 1]])
+    rot_matrix, _ = cv2.Rodrigues(camera_params[0, :3])
+    view = camera_indices == 0
+    packed = np.hstack((np.hstack((rot_matrix, camera_params[0, 3:, np.newaxis])).ravel(), K.ravel(), points_2d[view].T.ravel(), points_3d.ravel()))
+    assert np.allclose(legacy_optimize_reproj_error(packed), batched_reproj_error(packed))
+
+    num_cameras, num_points = len(camera_params), len(points_3d)
+    params = np.hstack((camera_params.ravel(), points_3d.ravel()))
+
+    def residuals(x):
+        cameras = x[:num_cameras * 6].reshape(-1, 6)
+        points = x[num_cameras * 6:].reshape(-1, 3)
+        return (project(points[point_indices], cameras[camera_indices], intrinsics) - points_2d).ravel()
+
+    sparsity = bundle_adjustment_sparsity(num_cameras, num_points, camera_indices, point_indices, False)
+
+    def analytic():
+        d_camera, _, d_points = reprojection_jacobian(points_3d[point_indices], camera_params[camera_indices], intrinsics)
+        return np.concatenate([np.concatenate((d_camera[:, axis].ravel(), d_points[:, axis].ravel())) for axis in (0, 1)])
+
+    def first_step(jac):
+        # One residual and one Jacobian evaluation, least_squares stops before taking a step
+        return bundle_adjustment(camera_params, points_3d, intrinsics, camera_indices, point_indices, points_2d, max_nfev=1, jac=jac)
+
+    results = [
+        ('single-view residual, per-point loop (before)', rate(lambda: legacy_optimize_reproj_error(packed), args.min_time)),
+        ('single-view residual, batched (after)', rate(lambda: batched_reproj_error(packed), args.min_time)),
+        ('multi-view residual, batched', rate(lambda: residuals(params), args.min_time)),
+        ('multi-view Jacobian blocks, closed form', rate(analytic, args.min_time)),
+        ('least_squares start, sparse finite differences', rate(lambda: first_step('2-point'), args.min_time)),
+        ('least_squares start, closed form', rate(lambda: first_step('analytic'), args.min_time)),
+    ]
+
+    print('{} cameras, {} points, {} observations, {} Jacobian non-zeros'.format(num_cameras, num_points, len(point_indices), sparsity.nnz))
+    for name, value in results:
+        print('{:<50s}{:>12.1f} evals/s'.format(name, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+End-to-end benchmark of the pipeline over the bundled datasets.
+
+Runs every dataset in every combination of the requested downscale factors,
+bundle adjustment modes and matcher backends, headless and in a fresh process
+per run so peak RSS is not shared between runs. Wall time, images per second,
+registered views, exported points, mean reprojection error and peak RSS are
+written to a JSON results file, and compared against a saved baseline if one
+is given. Run from the repository root:
+
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from SFM import find_datasets, run_job
+from profiling import peak_rss_mb
+
+# Metric name, direction that counts as better
+METRICS = (('seconds', 'lower'), ('images_per_second', 'higher'), ('points', 'higher'),
+           ('mean_reprojection_error', 'lower'), ('peak_rss_mb', 'lower'))
+
+
+def config_name(dataset:str, downscale:float, bundle_adjustment:str, matcher:str) -> str:
+    """
+    Key identifying one benchmark run in the results and baseline files.
+    """
+    return '{}/x{:g}/ba-{}/{}'.format(dataset, downscale, bundle_adjustment, matcher)
+
+
+def benchmark_job(img_dir:str, output_dir:str, downscale:float, bundle_adjustment:str, matcher:str, warm_cache:bool) -> dict:
+    """
+    Run one configuration, meant to be executed in a fresh worker process.
+    """
+    cv2.setNumThreads(1)
+    options = {
+        'init': {'downscale_factor': downscale, 'matcher': matcher, 'feature_workers': 1, 'use_feature_cache': warm_cache},
+        'run': {'bundle_adjustment_enabled': bundle_adjustment != 'off', 'bundle_adjustment_mode': bundle_adjustment if bundle_adjustment != 'off' else 'view', 'headless': True},
+    }
+    result = run_job(img_dir, output_dir, options)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def run_config(img_dir:str, output_dir:str, downscale:float, bundle_adjustment:str, matcher:str, warm_cache:bool) -> dict:
+    """
+    Run one configuration in a freshly spawned process and add its throughput.
+    """
+    num_images = len([name for name in os.listdir(img_dir) if name.lower().endswith(('.jpg', '.png'))])
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        result = executor.submit(benchmark_job, img_dir, output_dir, downscale, bundle_adjustment, matcher, warm_cache).result()
+    result.update(images=num_images, downscale=downscale, bundle_adjustment=bundle_adjustment, matcher=matcher)
+    result['images_per_second'] = num_images / result['seconds'] if result['status'] == 'ok' else None
+    return result
+
+
+def compare(results:dict, baseline:dict, tolerance:float) -> list:
+    """
+    Compare results with a baseline.
+
+    Parameters:
+    -----------
+    results : dict
+        Benchmark results keyed by config_name.
+    baseline : dict
+        Baseline results keyed by config_name.
+    tolerance : float
+        Relative change of a metric in its worse direction that counts as a regression.
+
+    Returns:
+    --------
+    list
+        One (config, metric, baseline value, new value, relative change, regressed) tuple per compared metric.
+    """
+    rows = []
+    for name in sorted(set(results) & set(baseline)):
+        for metric, better in METRICS:
+            old, new = baseline[name].get(metric), results[name].get(metric)
+            if old is None or new is None:
+                regressed = old is not None
+                rows.append((name, metric, old, new, None, regressed))
+                continue
+            change = (new - old) / abs(old) if old else 0.0
+            worse = change if better == 'lower' else -change
+            rows.append((name, metric, old, new, change, worse > tolerance))
+    return rows
+
+
+def main(argv=None) -> int:
+    """
+    Command line entry point, returns 1 if a run failed or regressed against the baseline and 0 otherwise.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('datasets', nargs='*', help='dataset directories, defaults to every dataset under --datasets-root')
+    parser.add_argument('--datasets-root', default=os.path.join(ROOT, 'Datasets'), help='directory searched for datasets when none are given')
+    parser.add_argument('--downscale', type=float, nargs='+', default=[2.0], help='image downscale factors')
+    parser.add_argument('--bundle-adjustment', nargs='+', choices=('off', 'view', 'local', 'global'), default=['off', 'global'], help='bundle adjustment modes')
+    parser.add_argument('--matcher', nargs='+', choices=('bf', 'flann', 'crosscheck'), default=['bf', 'flann'], help='matcher backends')
+    parser.add_argument('--warm-cache', action='store_true', help='reuse the on-disk feature cache instead of extracting features in every run')
+    parser.add_argument('--output', default='benchmark_results.json', help='results file')
+    parser.add_argument('--baseline', help='baseline results file to compare against')
+    parser.add_argument('--save-baseline', help='also write the results to this baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='relative change in the worse direction that counts as a regression')
+    args = parser.parse_args(argv)
+
+    img_dirs = args.datasets or find_datasets(args.datasets_root)
+    if not img_dirs:
+        parser.error('no datasets found')
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='sfm_benchmark_') as output_root:
+        for img_dir, downscale, bundle_adjustment, matcher in itertools.product(img_dirs, args.downscale, args.bundle_adjustment, args.matcher):
+            name = config_name(os.path.basename(os.path.normpath(img_dir)), downscale, bundle_adjustment, matcher)
+            result = run_config(img_dir, os.path.join(output_root, name), downscale, bundle_adjustment, matcher, args.warm_cache)
+            results[name] = result
+            if result['status'] == 'ok':
+                print('{:<45s} {:7.1f}s {:6.2f} img/s {:7d} points {:6.3f} px {:8.1f} MiB'.format(
+                    name, result['seconds'], result['images_per_second'], result['points'], result['mean_reprojection_error'], result['peak_rss_mb'] or float('nan')))
+            else:
+                print('{:<45s} failed: {}'.format(name, result['error']))
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'numpy': np.__version__, 'opencv': cv2.__version__, 'cpus': os.cpu_count()},
+        'results': results,
+    }
+    for filename in filter(None, (args.output, args.save_baseline)):
+        with open(filename, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    exit_code = int(any(result['status'] != 'ok' for result in results.values()))
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        print()
+        for name, metric, old, new, change, regressed in compare(results, baseline, args.tolerance):
+            if change is None:
+                print('{:<45s} {:<24s} {!s:>12} -> {!s:>12}{}'.format(name, metric, old, new, '  REGRESSION' if regressed else ''))
+            else:
+                print('{:<45s} {:<24s} {:12.3f} -> {:12.3f} {:+7.1%}{}'.format(name, metric, old, new, change, '  REGRESSION' if regressed else ''))
+            exit_code |= int(regressed)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
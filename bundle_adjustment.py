@@ -0,0 +1,399 @@
+import cv2
+import numpy as np
+from scipy.optimize import least_squares
+from scipy.sparse import coo_matrix
+
+
+def transform_to_params(transform_matrix) -> np.ndarray:
+    """
+    Convert a 3x4 [R|t] matrix to an axis-angle rotation and translation.
+
+    Parameters:
+    -----------
+    transform_matrix : np.ndarray
+        3x4 camera extrinsic matrix.
+
+    Returns:
+    --------
+    np.ndarray
+        Camera parameters (rx, ry, rz, tx, ty, tz).
+    """
+    rot_vector, _ = cv2.Rodrigues(np.asarray(transform_matrix[:3, :3], dtype=np.float64))
+    return np.hstack((rot_vector.ravel(), np.asarray(transform_matrix[:3, 3], dtype=np.float64).ravel()))
+
+
+def params_to_transform(camera_params) -> np.ndarray:
+    """
+    Convert an axis-angle rotation and translation to a 3x4 [R|t] matrix.
+
+    Parameters:
+    -----------
+    camera_params : np.ndarray
+        Camera parameters (rx, ry, rz, tx, ty, tz).
+
+    Returns:
+    --------
+    np.ndarray
+        3x4 camera extrinsic matrix.
+    """
+    rot_matrix, _ = cv2.Rodrigues(np.asarray(camera_params[:3], dtype=np.float64))
+    return np.hstack((rot_matrix, np.reshape(camera_params[3:6], (3, 1))))
+
+
+def intrinsics_from_K(K) -> np.ndarray:
+    """
+    Get (fx, fy, cx, cy) from a camera intrinsic matrix.
+    """
+    return np.array([K[0, 0], K[1, 1], K[0, 2], K[1, 2]], dtype=np.float64)
+
+
+def K_from_intrinsics(intrinsics) -> np.ndarray:
+    """
+    Build a camera intrinsic matrix from (fx, fy, cx, cy).
+    """
+    fx, fy, cx, cy = intrinsics
+    return np.array([[fx, 0, cx], [0, fy, cy], [0, 0, 1]], dtype=np.float64)
+
+
+def rotate(points, rot_vectors) -> np.ndarray:
+    """
+    Rotate points by axis-angle vectors using Rodrigues' formula, one rotation per point.
+
+    Parameters:
+    -----------
+    points : np.ndarray
+        (N, 3) points.
+    rot_vectors : np.ndarray
+        (N, 3) axis-angle rotations.
+
+    Returns:
+    --------
+    np.ndarray
+        (N, 3) rotated points.
+    """
+    theta = np.linalg.norm(rot_vectors, axis=1)[:, np.newaxis]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        axis = np.nan_to_num(rot_vectors / theta)
+    dot = np.sum(points * axis, axis=1)[:, np.newaxis]
+    cos_theta = np.cos(theta)
+    sin_theta = np.sin(theta)
+    return cos_theta * points + sin_theta * np.cross(axis, points) + dot * (1 - cos_theta) * axis
+
+
+def project(points, camera_params, intrinsics) -> np.ndarray:
+    """
+    Project 3D points into the cameras observing them.
+
+    Parameters:
+    -----------
+    points : np.ndarray
+        (N, 3) points, one row per observation.
+    camera_params : np.ndarray
+        (N, 6) parameters of the observing camera, one row per observation.
+    intrinsics : np.ndarray
+        (fx, fy, cx, cy) shared by all cameras.
+
+    Returns:
+    --------
+    np.ndarray
+        (N, 2) projected image points.
+    """
+    points_cam = rotate(points, camera_params[:, :3]) + camera_params[:, 3:6]
+    points_proj = points_cam[:, :2] / points_cam[:, 2:3]
+    return points_proj * intrinsics[:2] + intrinsics[2:4]
+
+
+def rotation_matrices(rot_vectors) -> np.ndarray:
+    """
+    Convert axis-angle vectors to rotation matrices in one batch.
+
+    Parameters:
+    -----------
+    rot_vectors : np.ndarray
+        (N, 3) axis-angle rotations.
+
+    Returns:
+    --------
+    np.ndarray
+        (N, 3, 3) rotation matrices.
+    """
+    theta = np.linalg.norm(rot_vectors, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        axis = np.nan_to_num(rot_vectors / theta[:, np.newaxis])
+    cross = skew(axis)
+    cos_theta = np.cos(theta)[:, np.newaxis, np.newaxis]
+    sin_theta = np.sin(theta)[:, np.newaxis, np.newaxis]
+    return cos_theta * np.eye(3) + sin_theta * cross + (1 - cos_theta) * axis[:, :, np.newaxis] * axis[:, np.newaxis, :]
+
+
+def skew(vectors) -> np.ndarray:
+    """
+    Build the cross-product matrices of a batch of 3-vectors.
+    """
+    x, y, z = vectors[:, 0], vectors[:, 1], vectors[:, 2]
+    zero = np.zeros_like(x)
+    return np.stack((np.stack((zero, -z, y), axis=1), np.stack((z, zero, -x), axis=1), np.stack((-y, x, zero), axis=1)), axis=1)
+
+
+def reprojection_jacobian(points, camera_params, intrinsics) -> tuple:
+    """
+    Closed-form derivatives of project with respect to the camera, the intrinsics and the point.
+
+    Rotation derivatives use the axis-angle formula of Gallego and Yezzi,
+    d(Rp)/dw = -R [p]x (w w^T + (R^T - I) [w]x) / |w|^2, falling back to -[p]x
+    for near-zero rotations.
+
+    Parameters:
+    -----------
+    points : np.ndarray
+        (N, 3) points, one row per observation.
+    camera_params : np.ndarray
+        (N, 6) parameters of the observing camera, one row per observation.
+    intrinsics : np.ndarray
+        (fx, fy, cx, cy) shared by all cameras.
+
+    Returns:
+    --------
+    tuple
+        (N, 2, 6) camera, (N, 2, 4) intrinsics and (N, 2, 3) point Jacobian blocks.
+    """
+    rot_vectors = camera_params[:, :3]
+    rot = rotation_matrices(rot_vectors)
+    points_cam = np.matmul(rot, points[:, :, np.newaxis])[:, :, 0] + camera_params[:, 3:6]
+    x, y, z = points_cam[:, 0], points_cam[:, 1], points_cam[:, 2]
+    fx, fy = intrinsics[0], intrinsics[1]
+
+    # Derivative of the pixel coordinates with respect to the camera frame point
+    d_cam_point = np.zeros((len(points), 2, 3))
+    d_cam_point[:, 0, 0] = fx / z
+    d_cam_point[:, 0, 2] = -fx * x / z ** 2
+    d_cam_point[:, 1, 1] = fy / z
+    d_cam_point[:, 1, 2] = -fy * y / z ** 2
+    d_points = np.matmul(d_cam_point, rot)
+
+    # Chain through d(Rp)/dw = -R [p]x M, using a^T [p]x = (a x p)^T for the rows of d_points
+    theta_sq = np.sum(rot_vectors ** 2, axis=1)
+    big = theta_sq >= 1e-12
+    M = np.broadcast_to(np.eye(3), (len(points), 3, 3)).copy()
+    if np.any(big):
+        w = rot_vectors[big]
+        M[big] = (w[:, :, np.newaxis] * w[:, np.newaxis, :] + np.matmul(np.swapaxes(rot[big], 1, 2) - np.eye(3), skew(w))) / theta_sq[big][:, np.newaxis, np.newaxis]
+    d_rotation = -np.matmul(np.cross(d_points, points[:, np.newaxis, :]), M)
+
+    d_camera = np.concatenate((d_rotation, d_cam_point), axis=2)
+    d_intrinsics = np.zeros((len(points), 2, 4))
+    d_intrinsics[:, 0, 0] = x / z
+    d_intrinsics[:, 1, 1] = y / z
+    d_intrinsics[:, 0, 2] = 1
+    d_intrinsics[:, 1, 3] = 1
+    return d_camera, d_intrinsics, d_points
+
+
+def _jacobian_structure(num_cameras:int, camera_indices, point_indices, refine_intrinsics:bool) -> tuple:
+    # Row and column of every non-zero: the u rows first, then the v rows, each
+    # listing camera, intrinsics and point blocks in that order
+    num_intrinsics = 4 if refine_intrinsics else 0
+    obs = np.arange(len(point_indices))
+    free = camera_indices >= 0
+    rows = np.concatenate((np.repeat(2 * obs[free], 6), np.repeat(2 * obs, num_intrinsics), np.repeat(2 * obs, 3)))
+    cols = np.concatenate((((camera_indices[free] * 6)[:, np.newaxis] + np.arange(6)).ravel(),
+                           np.broadcast_to(num_cameras * 6 + np.arange(num_intrinsics), (len(obs), num_intrinsics)).ravel(),
+                           ((num_cameras * 6 + num_intrinsics + point_indices * 3)[:, np.newaxis] + np.arange(3)).ravel()))
+    return np.concatenate((rows, rows + 1)), np.concatenate((cols, cols))
+
+
+def bundle_adjustment_sparsity(num_cameras:int, num_points:int, camera_indices, point_indices, refine_intrinsics:bool):
+    """
+    Build the sparsity pattern of the bundle adjustment Jacobian.
+
+    Parameters:
+    -----------
+    num_cameras : int
+        Number of cameras being optimized.
+    num_points : int
+        Number of 3D points.
+    camera_indices : np.ndarray
+        Optimized camera of every observation, -1 for fixed cameras.
+    point_indices : np.ndarray
+        Point of every observation.
+    refine_intrinsics : bool
+        Flag indicating whether the shared intrinsics are optimized.
+
+    Returns:
+    --------
+    scipy.sparse.csr_matrix
+        (2 * observations, parameters) matrix with ones where the Jacobian can be non-zero.
+    """
+    num_intrinsics = 4 if refine_intrinsics else 0
+    rows, cols = _jacobian_structure(num_cameras, camera_indices, point_indices, refine_intrinsics)
+    sparsity = coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(2 * len(point_indices), num_cameras * 6 + num_intrinsics + num_points * 3))
+    return sparsity.tocsr()
+
+
+def bundle_adjustment(
+        camera_params,
+        points_3d,
+        intrinsics,
+        camera_indices,
+        point_indices,
+        points_2d,
+        fixed_cameras=(0,),
+        refine_intrinsics:bool = False,
+        gtol:float = 1e-8,
+        ftol:float = 1e-8,
+        max_nfev:int = None,
+        loss:str = 'linear',
+        f_scale:float = 1.0,
+        jac:str = 'analytic'
+) -> tuple:
+    """
+    Jointly refine camera poses, 3D points and optionally the shared intrinsics.
+
+    Rotations are parametrized as axis-angle vectors. The Jacobian is either
+    computed in closed form (jac='analytic') or estimated by finite differences
+    over its sparsity pattern (jac='2-point'); both scale with the number of
+    observations rather than with the square of the number of parameters.
+
+    Parameters:
+    -----------
+    camera_params : np.ndarray
+        (num_cameras, 6) axis-angle rotation and translation of every camera.
+    points_3d : np.ndarray
+        (num_points, 3) 3D points.
+    intrinsics : np.ndarray
+        (fx, fy, cx, cy) shared by all cameras.
+    camera_indices : np.ndarray
+        Camera of every observation.
+    point_indices : np.ndarray
+        Point of every observation.
+    points_2d : np.ndarray
+        (num_observations, 2) observed image points.
+    fixed_cameras : iterable
+        Cameras held constant, fixing at least one removes the gauge freedom.
+    refine_intrinsics : bool
+        Flag indicating whether the shared intrinsics are optimized.
+    gtol, ftol : float
+        Tolerances forwarded to least_squares.
+    max_nfev : int
+        Maximum number of function evaluations.
+    loss : str
+        Robust loss forwarded to least_squares.
+    f_scale : float
+        Inlier residual scale of the robust loss, in pixels.
+    jac : str
+        'analytic' for the closed-form Jacobian, or a finite difference scheme of least_squares.
+
+    Returns:
+    --------
+    tuple
+        Refined camera parameters, 3D points, intrinsics and the least_squares result.
+    """
+    camera_params = np.asarray(camera_params, dtype=np.float64).reshape(-1, 6)
+    points_3d = np.asarray(points_3d, dtype=np.float64).reshape(-1, 3)
+    intrinsics = np.asarray(intrinsics, dtype=np.float64)
+    camera_indices = np.asarray(camera_indices, dtype=np.int64)
+    point_indices = np.asarray(point_indices, dtype=np.int64)
+    points_2d = np.asarray(points_2d, dtype=np.float64).reshape(-1, 2)
+
+    # Map every camera to its slot in the parameter vector, fixed cameras get -1
+    free = np.ones(len(camera_params), dtype=bool)
+    free[list(fixed_cameras)] = False
+    slot = np.full(len(camera_params), -1, dtype=np.int64)
+    slot[free] = np.arange(free.sum())
+    obs_slot = slot[camera_indices]
+    num_free = int(free.sum())
+    num_intrinsics = 4 if refine_intrinsics else 0
+
+    def unpack(params):
+        cameras = camera_params.copy()
+        cameras[free] = params[:num_free * 6].reshape(-1, 6)
+        shared = params[num_free * 6:num_free * 6 + num_intrinsics] if refine_intrinsics else intrinsics
+        return cameras, shared, params[num_free * 6 + num_intrinsics:].reshape(-1, 3)
+
+    def residuals(params):
+        cameras, shared, points = unpack(params)
+        return (project(points[point_indices], cameras[camera_indices], shared) - points_2d).ravel()
+
+    rows, cols = _jacobian_structure(num_free, obs_slot, point_indices, refine_intrinsics)
+    num_params = num_free * 6 + num_intrinsics + len(points_3d) * 3
+    obs_free = obs_slot >= 0
+
+    def jacobian(params):
+        cameras, shared, points = unpack(params)
+        d_camera, d_intrinsics, d_points = reprojection_jacobian(points[point_indices], cameras[camera_indices], shared)
+        values = [np.concatenate((d_camera[obs_free, axis].ravel(), d_intrinsics[:, axis].ravel() if refine_intrinsics else [], d_points[:, axis].ravel())) for axis in (0, 1)]
+        return coo_matrix((np.concatenate(values), (rows, cols)), shape=(2 * len(points_2d), num_params)).tocsr()
+
+    x0 = np.hstack((camera_params[free].ravel(), intrinsics if refine_intrinsics else [], points_3d.ravel()))
+    if jac == 'analytic':
+        result = least_squares(residuals, x0, jac=jacobian, x_scale='jac', method='trf', loss=loss, f_scale=f_scale, gtol=gtol, ftol=ftol, max_nfev=max_nfev)
+    else:
+        sparsity = bundle_adjustment_sparsity(num_free, len(points_3d), obs_slot, point_indices, refine_intrinsics)
+        result = least_squares(residuals, x0, jac=jac, jac_sparsity=sparsity, x_scale='jac', method='trf', loss=loss, f_scale=f_scale, gtol=gtol, ftol=ftol, max_nfev=max_nfev)
+    cameras, shared, points = unpack(result.x)
+    return cameras, points, np.array(shared, dtype=np.float64), result
+
+
+class LocalBundleAdjustmentScheduler:
+    """
+    Decides after every registered view whether to run a sliding-window bundle adjustment.
+
+    The window holds the last window_size registered views, so the cost of every
+    adjustment is bounded by the window however long the sequence grows. An
+    adjustment is triggered when the error of the latest view exceeds
+    error_threshold, or every `every` views otherwise.
+
+    Attributes:
+    -----------
+    window_size : int
+        Number of most recently registered cameras refined by an adjustment.
+    every : int
+        Maximum number of views between two adjustments, 0 to trigger on the error only.
+    error_threshold : float
+        Mean reprojection error in pixels above which an adjustment is triggered at once.
+    views_since_run : int
+        Number of views registered since the last adjustment.
+    """
+    def __init__(self, window_size:int = 5, every:int = 5, error_threshold:float = 1.0):
+        """
+        Initialize the LocalBundleAdjustmentScheduler.
+
+        Parameters:
+        -----------
+        window_size : int
+            Number of most recently registered cameras refined by an adjustment.
+        every : int
+            Maximum number of views between two adjustments, 0 to trigger on the error only.
+        error_threshold : float
+            Mean reprojection error in pixels above which an adjustment is triggered at once.
+        """
+        self.window_size = window_size
+        self.every = every
+        self.error_threshold = error_threshold
+        self.views_since_run = 0
+
+    def step(self, error:float) -> bool:
+        """
+        Record a newly registered view and decide whether to adjust now.
+
+        Parameters:
+        -----------
+        error : float
+            Mean reprojection error of the new view in pixels.
+
+        Returns:
+        --------
+        bool
+            True if the window should be adjusted.
+        """
+        self.views_since_run += 1
+        if error > self.error_threshold or (self.every and self.views_since_run >= self.every):
+            self.views_since_run = 0
+            return True
+        return False
+
+    def window(self, registration_order) -> list:
+        """
+        The views refined by the next adjustment, the latest window_size registered views.
+        """
+        return list(registration_order)[-self.window_size:]
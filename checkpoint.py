@@ -0,0 +1,91 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+FORMAT_VERSION = 1
+LATEST_FILE = 'latest.json'
+STATE_FILE = 'state.json'
+
+
+def save_checkpoint(root:str, name:str, arrays:dict, metadata:dict, keep:int = 1) -> str:
+    """
+    Write a checkpoint as one .npy file per array plus a JSON state file, then make it the latest.
+
+    The checkpoint is written to its own directory and only becomes visible through
+    the atomically replaced latest.json once complete, so a crash while saving leaves
+    the previous checkpoint intact.
+
+    Parameters:
+    -----------
+    root : str
+        Directory holding the checkpoints.
+    name : str
+        Name of the checkpoint directory, e.g. the number of registered views.
+    arrays : dict
+        Arrays to store, keys are used as file names.
+    metadata : dict
+        JSON serializable state stored next to the arrays.
+    keep : int
+        Number of most recent checkpoints kept on disk, older ones are deleted.
+
+    Returns:
+    --------
+    str
+        Directory of the new checkpoint.
+    """
+    directory = os.path.join(root, name)
+    partial = directory + '.partial'
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+    for key, array in arrays.items():
+        np.save(os.path.join(partial, key + '.npy'), np.ascontiguousarray(array))
+    with open(os.path.join(partial, STATE_FILE), 'w') as f:
+        json.dump(dict(metadata, format_version=FORMAT_VERSION, arrays=sorted(arrays)), f, indent=2)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(partial, directory)
+
+    history = [entry for entry in _read_latest(root).get('history', []) if entry != name] + [name]
+    with open(os.path.join(root, LATEST_FILE + '.tmp'), 'w') as f:
+        json.dump({'latest': name, 'history': history[-max(1, keep):]}, f)
+    os.replace(os.path.join(root, LATEST_FILE + '.tmp'), os.path.join(root, LATEST_FILE))
+    for old in history[:-max(1, keep)]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return directory
+
+
+def load_checkpoint(root:str, mmap_mode:str = 'r') -> tuple:
+    """
+    Load the latest checkpoint.
+
+    Parameters:
+    -----------
+    root : str
+        Directory holding the checkpoints.
+    mmap_mode : str
+        Memory-map mode passed to np.load, None reads the arrays into memory.
+
+    Returns:
+    --------
+    tuple
+        Arrays keyed by name and the metadata, or None if there is no checkpoint.
+    """
+    name = _read_latest(root).get('latest')
+    if name is None:
+        return None
+    directory = os.path.join(root, name)
+    with open(os.path.join(directory, STATE_FILE)) as f:
+        metadata = json.load(f)
+    if metadata.get('format_version') != FORMAT_VERSION:
+        raise ValueError('checkpoint {} has format version {}, expected {}'.format(directory, metadata.get('format_version'), FORMAT_VERSION))
+    arrays = {key: np.load(os.path.join(directory, key + '.npy'), mmap_mode=mmap_mode) for key in metadata['arrays']}
+    return arrays, metadata
+
+
+def _read_latest(root:str) -> dict:
+    try:
+        with open(os.path.join(root, LATEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
@@ -0,0 +1,551 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+def pyramid_downscale(image, downscale_factor:float):
+    """
+    Downscale an image using pyramid down method.
+
+    Parameters:
+    -----------
+    image : np.ndarray
+        Image to be downscaled.
+    downscale_factor : float
+        Downscale factor, one pyrDown is applied per factor of two.
+
+    Returns:
+    --------
+    np.ndarray
+        Downscaled image.
+    """
+    for _ in range(pyramid_levels(downscale_factor)):
+        image = cv2.pyrDown(image)
+    return image
+
+
+def pyramid_levels(downscale_factor:float) -> int:
+    """
+    Number of halvings pyramid_downscale applies for a downscale factor.
+    """
+    return int(downscale_factor / 2)
+
+
+# imread flags decoding directly at 1/2, 1/4 and 1/8 resolution, indexed by [grayscale][levels - 1]
+_REDUCED_FLAGS = {
+    False: (cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_COLOR_8),
+    True: (cv2.IMREAD_REDUCED_GRAYSCALE_2, cv2.IMREAD_REDUCED_GRAYSCALE_4, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+}
+
+
+def read_reduced(image_path:str, levels:int, grayscale:bool = False) -> tuple:
+    """
+    Decode an image, letting the JPEG decoder skip up to three of the requested halvings.
+
+    The JPEG decoder scales in the DCT domain, so the full resolution image is never
+    materialized. Other formats are decoded at full resolution.
+
+    Parameters:
+    -----------
+    image_path : str
+        Path of the image file.
+    levels : int
+        Number of halvings wanted in total.
+    grayscale : bool
+        Flag indicating whether to decode to a single channel instead of BGR.
+
+    Returns:
+    --------
+    tuple
+        Decoded image and the number of halvings still to be applied with cv2.pyrDown.
+    """
+    reduced = min(levels, 3) if os.path.splitext(image_path)[1].lower() in ('.jpg', '.jpeg') else 0
+    if reduced:
+        flag = _REDUCED_FLAGS[grayscale][reduced - 1]
+    else:
+        flag = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+    image = cv2.imread(image_path, flag)
+    if image is None:
+        raise IOError('could not decode image {}'.format(image_path))
+    return image, levels - reduced
+
+
+def decode_image(image_path:str, downscale_factor:float, grayscale:bool = False):
+    """
+    Decode an image at the resolution pyramid_downscale would produce from the full image.
+
+    Parameters:
+    -----------
+    image_path : str
+        Path of the image file.
+    downscale_factor : float
+        Factor by which to downscale the image.
+    grayscale : bool
+        Flag indicating whether to decode to a single channel instead of BGR.
+
+    Returns:
+    --------
+    np.ndarray
+        Downscaled image.
+    """
+    image, remaining = read_reduced(image_path, pyramid_levels(downscale_factor), grayscale)
+    for _ in range(remaining):
+        image = cv2.pyrDown(image)
+    return image
+
+
+def detect_and_compute(image, detector_params:dict = None) -> tuple:
+    """
+    Detect SIFT keypoints and compute their descriptors on a BGR or grayscale image.
+
+    Parameters:
+    -----------
+    image : np.ndarray
+        BGR or grayscale image (already downscaled).
+    detector_params : dict
+        Keyword arguments forwarded to cv2.SIFT_create.
+
+    Returns:
+    --------
+    tuple
+        Keypoint coordinates as an (N, 2) float32 array and descriptors as an (N, 128) float32 array.
+    """
+    sift = cv2.SIFT_create(**(detector_params or {}))
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    key_points, descriptors = sift.detectAndCompute(image, None)
+    points = np.float32([kp.pt for kp in key_points]).reshape(-1, 2)
+    if descriptors is None:
+        descriptors = np.empty((0, 128), dtype=np.float32)
+    return points, descriptors
+
+
+def extract_image_features(image_path:str, downscale_factor:float, detector_params:dict = None) -> tuple:
+    """
+    Decode, downscale and run SIFT on an image file, timing each step.
+
+    JPEG files are decoded straight to grayscale at reduced resolution where the
+    factor allows it, only the remaining halvings are done with cv2.pyrDown.
+
+    Parameters:
+    -----------
+    image_path : str
+        Path of the image file.
+    downscale_factor : float
+        Factor by which to downscale the image.
+    detector_params : dict
+        Keyword arguments forwarded to cv2.SIFT_create.
+
+    Returns:
+    --------
+    tuple
+        Keypoint coordinates, descriptors and a dictionary of step durations in seconds.
+    """
+    start = time.perf_counter()
+    image, remaining = read_reduced(image_path, pyramid_levels(downscale_factor), grayscale=True)
+    decoded = time.perf_counter()
+    for _ in range(remaining):
+        image = cv2.pyrDown(image)
+    downscaled = time.perf_counter()
+    points, descriptors = detect_and_compute(image, detector_params)
+    timings = {'decode': decoded - start, 'downscale': downscaled - decoded, 'sift': time.perf_counter() - downscaled}
+    return points, descriptors, timings
+
+
+def _init_worker() -> None:
+    # One OpenCV thread per worker process, the pool provides the parallelism
+    cv2.setNumThreads(1)
+
+
+@contextmanager
+def _file_lock(path:str):
+    # Exclusive lock held on a separate lock file, shared by every process using the cache
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class FeatureStore:
+    """
+    Cache of SIFT keypoints and descriptors keyed by image file and detector settings.
+
+    Every entry is stored as two .npy files (keypoints and descriptors) that are
+    memory-mapped on load, plus a JSON index used for the size cap. Entries are
+    evicted least recently used first once the cache grows past max_bytes.
+
+    Several processes can share a cache directory: every process merges its own
+    changes into the index on disk under a file lock before writing it back, so
+    no process drops the entries another one added.
+
+    Attributes:
+    -----------
+    cache_dir : str or None
+        Directory holding the cache files, None keeps features in memory only.
+    max_bytes : int
+        Upper bound on the total size of the cached arrays on disk.
+    detector_params : dict
+        Keyword arguments forwarded to cv2.SIFT_create, part of the cache key.
+    """
+    VERSION = 2
+    INDEX_FILE = 'index.json'
+    LOCK_FILE = 'index.lock'
+
+    def __init__(self, cache_dir:str = None, max_bytes:int = 2 * 1024 ** 3, detector_params:dict = None):
+        """
+        Initialize the FeatureStore.
+
+        Parameters:
+        -----------
+        cache_dir : str
+            Directory holding the cache files, None keeps features in memory only.
+        max_bytes : int
+            Upper bound on the total size of the cached arrays on disk.
+        detector_params : dict
+            Keyword arguments forwarded to cv2.SIFT_create.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.detector_params = dict(detector_params or {})
+        self._memory = {}
+        self._index = {}
+        self._changed = {}
+        self._removed = set()
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._index = self._read_index()
+
+    def key(self, image_path:str, downscale_factor:float) -> str:
+        """
+        Build the cache key of an image.
+
+        Parameters:
+        -----------
+        image_path : str
+            Path of the image file.
+        downscale_factor : float
+            Factor the image is downscaled by before detection.
+
+        Returns:
+        --------
+        str
+            Hex digest identifying the file contents and the detector settings.
+        """
+        stat = os.stat(image_path)
+        fields = [self.VERSION, os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size, float(downscale_factor), sorted(self.detector_params.items())]
+        return hashlib.sha1(repr(fields).encode('utf-8')).hexdigest()
+
+    def get(self, image_path:str, downscale_factor:float) -> tuple:
+        """
+        Look up the features of an image.
+
+        Parameters:
+        -----------
+        image_path : str
+            Path of the image file.
+        downscale_factor : float
+            Factor the image is downscaled by before detection.
+
+        Returns:
+        --------
+        tuple or None
+            Keypoint coordinates and descriptors, or None on a cache miss.
+        """
+        key = self.key(image_path, downscale_factor)
+        if key in self._memory:
+            return self._memory[key]
+        if key not in self._index:
+            return None
+        try:
+            points = np.load(self._file(key, 'kp'), mmap_mode='r')
+            descriptors = np.load(self._file(key, 'desc'), mmap_mode='r')
+        except (OSError, ValueError):
+            self._remove(key)
+            self._write_index()
+            return None
+        self._index[key]['last_access'] = time.time()
+        self._changed[key] = self._index[key]
+        self._write_index()
+        self._memory[key] = (points, descriptors)
+        return points, descriptors
+
+    def put(self, image_path:str, downscale_factor:float, points, descriptors) -> tuple:
+        """
+        Store the features of an image and enforce the size cap.
+
+        Once written to the disk cache, the features are kept as memory maps of the
+        cached files, so the store holds no copy of them in RAM.
+
+        Parameters:
+        -----------
+        image_path : str
+            Path of the image file.
+        downscale_factor : float
+            Factor the image is downscaled by before detection.
+        points : np.ndarray
+            (N, 2) keypoint coordinates.
+        descriptors : np.ndarray
+            (N, 128) descriptors.
+
+        Returns:
+        --------
+        tuple
+            The stored keypoint coordinates and descriptors, memory-mapped if they are in the disk cache.
+        """
+        key = self.key(image_path, downscale_factor)
+        points = np.ascontiguousarray(points, dtype=np.float32)
+        descriptors = np.ascontiguousarray(descriptors, dtype=np.float32)
+        if self.cache_dir is None:
+            self._memory[key] = (points, descriptors)
+            return points, descriptors
+        np.save(self._file(key, 'kp'), points)
+        np.save(self._file(key, 'desc'), descriptors)
+        self._index[key] = {'image': os.path.abspath(image_path), 'bytes': int(points.nbytes + descriptors.nbytes), 'last_access': time.time()}
+        self._changed[key] = self._index[key]
+        self._removed.discard(key)
+        self._write_index()
+        if key not in self._index:
+            # Evicted at once because it alone exceeds max_bytes
+            return points, descriptors
+        self._memory[key] = (np.load(self._file(key, 'kp'), mmap_mode='r'), np.load(self._file(key, 'desc'), mmap_mode='r'))
+        return self._memory[key]
+
+    def release(self, image_path:str, downscale_factor:float) -> None:
+        """
+        Drop the descriptors of an image from memory, keeping its keypoints.
+
+        Entries backed by the disk cache are reloaded by the next get, images that
+        only live in memory keep their keypoints and get None as descriptors.
+
+        Parameters:
+        -----------
+        image_path : str
+            Path of the image file.
+        downscale_factor : float
+            Factor the image is downscaled by before detection.
+        """
+        key = self.key(image_path, downscale_factor)
+        features = self._memory.pop(key, None)
+        if features is not None and key not in self._index:
+            self._memory[key] = (features[0], None)
+
+    def evict(self) -> None:
+        """
+        Remove least recently used entries until the cache fits in max_bytes.
+        """
+        total = sum(entry['bytes'] for entry in self._index.values())
+        for key in sorted(self._index, key=lambda k: self._index[k]['last_access']):
+            if total <= self.max_bytes:
+                break
+            total -= self._index[key]['bytes']
+            self._remove(key)
+
+    def clear(self) -> None:
+        """
+        Drop every cached entry, in memory and on disk.
+        """
+        if self.cache_dir is not None:
+            with _file_lock(os.path.join(self.cache_dir, self.LOCK_FILE)):
+                self._index = self._read_index()
+                for key in list(self._index):
+                    self._remove(key)
+                self._dump_index()
+        self._changed.clear()
+        self._removed.clear()
+        self._memory.clear()
+
+    def _file(self, key:str, kind:str) -> str:
+        return os.path.join(self.cache_dir, key + '_' + kind + '.npy')
+
+    def _remove(self, key:str) -> None:
+        self._index.pop(key, None)
+        self._changed.pop(key, None)
+        self._removed.add(key)
+        self._memory.pop(key, None)
+        for kind in ('kp', 'desc'):
+            try:
+                os.remove(self._file(key, kind))
+            except FileNotFoundError:
+                pass
+
+    def _read_index(self) -> dict:
+        try:
+            with open(os.path.join(self.cache_dir, self.INDEX_FILE)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return index if isinstance(index, dict) else {}
+
+    def _write_index(self) -> None:
+        # Merge the changes of this process into the index on disk, then enforce the size cap
+        with _file_lock(os.path.join(self.cache_dir, self.LOCK_FILE)):
+            index = self._read_index()
+            for key in self._removed:
+                index.pop(key, None)
+            for key, entry in self._changed.items():
+                if key in index:
+                    entry['last_access'] = max(entry['last_access'], index[key]['last_access'])
+                index[key] = entry
+            self._index = index
+            self._changed.clear()
+            self._removed.clear()
+            self.evict()
+            self._removed.clear()
+            self._dump_index()
+
+    def _dump_index(self) -> None:
+        # A unique temporary file per writer, so concurrent writers never replace each other's file
+        fd, tmp_path = tempfile.mkstemp(prefix=self.INDEX_FILE + '.', suffix='.tmp', dir=self.cache_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, os.path.join(self.cache_dir, self.INDEX_FILE))
+
+
+class FeaturePrefetcher:
+    """
+    Extracts features for a list of images in a process pool ahead of the reconstruction.
+
+    Images are submitted in order and at most queue_size results are in flight.
+    Finished results are added to the FeatureStore in order as the consumer asks
+    for them, which keeps them memory-mapped from its disk cache, so memory stays
+    bounded however long the image list is. A store without a cache directory
+    keeps every image's features in RAM instead.
+
+    Attributes:
+    -----------
+    store : FeatureStore
+        Store receiving the extracted features.
+    image_list : list
+        List of image paths.
+    factor : float
+        Downscale factor.
+    workers : int
+        Number of worker processes, 1 or less extracts in the calling process.
+    queue_size : int
+        Maximum number of images being extracted or waiting to be consumed.
+    on_timings : callable
+        Called with (index, timings) for every image extracted, timings maps step names to seconds.
+    """
+    def __init__(self, store:FeatureStore, image_list:list, downscale_factor:float, workers:int = None, queue_size:int = None, on_timings=None):
+        """
+        Initialize the FeaturePrefetcher and start extracting the first images.
+
+        Parameters:
+        -----------
+        store : FeatureStore
+            Store receiving the extracted features.
+        image_list : list
+            List of image paths.
+        downscale_factor : float
+            Factor by which to downscale the images.
+        workers : int
+            Number of worker processes, defaults to the number of CPUs.
+        queue_size : int
+            Maximum number of images in flight, defaults to twice the worker count.
+        on_timings : callable
+            Called with (index, timings) for every image extracted.
+        """
+        self.store = store
+        self.image_list = image_list
+        self.factor = downscale_factor
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.queue_size = max(1, queue_size if queue_size is not None else 2 * self.workers)
+        self.on_timings = on_timings
+        self._next_submit = 0
+        self._next_done = 0
+        self._pending = deque()
+        self._executor = ProcessPoolExecutor(self.workers, initializer=_init_worker) if self.workers > 1 else None
+        self._fill()
+
+    def get(self, index:int) -> tuple:
+        """
+        Return the features of an image, waiting for the workers if needed.
+
+        Parameters:
+        -----------
+        index : int
+            Index of the image in the image list.
+
+        Returns:
+        --------
+        tuple
+            Keypoint coordinates and descriptors.
+        """
+        while self._next_done <= index and self._pending:
+            self._consume()
+        image_path = self.image_list[index]
+        features = self.store.get(image_path, self.factor)
+        if features is None:
+            features = self._store(index, extract_image_features(image_path, self.factor, self.store.detector_params))
+        return features
+
+    def close(self) -> None:
+        """
+        Cancel outstanding work and shut the worker pool down.
+        """
+        for _, future in self._pending:
+            if future is not None:
+                future.cancel()
+        self._pending.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _fill(self) -> None:
+        # Keep the window of in-flight images full, cache hits cost no worker time
+        while len(self._pending) < self.queue_size and self._next_submit < len(self.image_list):
+            image_path = self.image_list[self._next_submit]
+            future = None
+            if self._executor is not None and self.store.get(image_path, self.factor) is None:
+                future = self._executor.submit(extract_image_features, image_path, self.factor, self.store.detector_params)
+            self._pending.append((self._next_submit, future))
+            self._next_submit += 1
+
+    def _consume(self) -> None:
+        index, future = self._pending.popleft()
+        if future is not None:
+            self._store(index, future.result())
+        self._next_done = index + 1
+        self._fill()
+
+    def _store(self, index:int, result:tuple) -> tuple:
+        points, descriptors, timings = result
+        features = self.store.put(self.image_list[index], self.factor, points, descriptors)
+        if self.on_timings is not None:
+            self.on_timings(index, timings)
+        return features
@@ -0,0 +1,113 @@
+import cv2
+import numpy as np
+
+
+class FeatureMatcher:
+    """
+    Descriptor matcher with interchangeable nearest-neighbour backends.
+
+    Backends:
+    ---------
+    'bf'
+        Exact brute-force k-nearest neighbours with cv2.BFMatcher.
+    'flann'
+        Approximate k-nearest neighbours with a randomized FLANN KD-tree forest,
+        sub-quadratic on large descriptor sets.
+    'crosscheck'
+        Exact brute force in both directions, keeping only mutual nearest neighbours.
+
+    All backends return their neighbours as arrays, and Lowe's ratio test is
+    applied to those arrays in one vectorized step. The brute-force backends read
+    the DMatch results of OpenCV into an array with a single np.fromiter pass.
+
+    Attributes:
+    -----------
+    backend : str
+        Name of the nearest-neighbour backend.
+    ratio : float
+        Lowe's ratio test threshold, matches are kept if best < ratio * second best.
+    flann_trees : int
+        Number of randomized KD-trees built by the 'flann' backend.
+    flann_checks : int
+        Number of leaves visited per query by the 'flann' backend.
+    """
+    BACKENDS = ('bf', 'flann', 'crosscheck')
+
+    def __init__(self, backend:str = 'bf', ratio:float = 0.70, flann_trees:int = 5, flann_checks:int = 50):
+        """
+        Initialize the FeatureMatcher.
+
+        Parameters:
+        -----------
+        backend : str
+            One of 'bf', 'flann' or 'crosscheck'.
+        ratio : float
+            Lowe's ratio test threshold.
+        flann_trees : int
+            Number of randomized KD-trees built by the 'flann' backend.
+        flann_checks : int
+            Number of leaves visited per query by the 'flann' backend.
+        """
+        if backend not in self.BACKENDS:
+            raise ValueError("backend must be one of {}, got {!r}".format(self.BACKENDS, backend))
+        self.backend = backend
+        self.ratio = ratio
+        self.flann_trees = flann_trees
+        self.flann_checks = flann_checks
+
+    def knn(self, query, train) -> tuple:
+        """
+        Find the two nearest train descriptors of every query descriptor.
+
+        Parameters:
+        -----------
+        query : np.ndarray
+            (N, D) query descriptors.
+        train : np.ndarray
+            (M, D) train descriptors, M >= 2.
+
+        Returns:
+        --------
+        tuple
+            (N, 2) neighbour indices and (N, 2) Euclidean distances.
+        """
+        if self.backend == 'flann':
+            index = cv2.flann_Index(train, dict(algorithm=1, trees=self.flann_trees))
+            indices, distances = index.knnSearch(query, 2, params=dict(checks=self.flann_checks))
+            # FLANN reports squared L2 distances
+            return indices.astype(np.int64), np.sqrt(distances)
+        # One pass over the DMatch pairs straight into a flat array, no per-pair tuples
+        matches = cv2.BFMatcher(cv2.NORM_L2).knnMatch(query, train, k=2)
+        flat = np.fromiter((value for m, n in matches for value in (m.trainIdx, n.trainIdx, m.distance, n.distance)), dtype=np.float64, count=4 * len(matches)).reshape(-1, 4)
+        return flat[:, :2].astype(np.int64), flat[:, 2:]
+
+    def match(self, descriptors_0, descriptors_1) -> tuple:
+        """
+        Match two sets of descriptors.
+
+        Parameters:
+        -----------
+        descriptors_0 : np.ndarray
+            (N, D) descriptors of the first image.
+        descriptors_1 : np.ndarray
+            (M, D) descriptors of the second image.
+
+        Returns:
+        --------
+        tuple
+            Indices of the matched descriptors in both sets.
+        """
+        descriptors_0 = np.ascontiguousarray(descriptors_0, dtype=np.float32)
+        descriptors_1 = np.ascontiguousarray(descriptors_1, dtype=np.float32)
+        if len(descriptors_0) < 2 or len(descriptors_1) < 2:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        indices, distances = self.knn(descriptors_0, descriptors_1)
+        keep = distances[:, 0] < self.ratio * distances[:, 1]
+        if self.backend == 'crosscheck':
+            # Keep a match only if the query is also the nearest neighbour of its train descriptor
+            backward = cv2.BFMatcher(cv2.NORM_L2).match(descriptors_1, descriptors_0)
+            nearest_back = np.fromiter((m.trainIdx for m in backward), dtype=np.int64, count=len(backward))
+            keep &= nearest_back[indices[:, 0]] == np.arange(len(indices))
+        query_indices = np.flatnonzero(keep)
+        return query_indices, indices[query_indices, 0]
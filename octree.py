@@ -0,0 +1,176 @@
+import heapq
+import json
+import os
+import shutil
+
+import numpy as np
+
+from ply import read_ply, write_ply
+
+FORMAT_VERSION = 1
+INDEX_FILE = 'octree.json'
+
+
+def write_octree(directory:str, points, colors, max_points_per_tile:int = 100000, max_depth:int = 12, seed:int = 0) -> dict:
+    """
+    Write a point cloud as a level-of-detail octree of PLY tiles plus a JSON index.
+
+    The points are shuffled once, then every node keeps the first max_points_per_tile
+    points falling into its cube as its tile and passes the rest on to its eight
+    children. Every tile is thus a uniform sample of its cube, coarse near the root
+    and finer towards the leaves, and the tiles together hold every point exactly once,
+    so a viewer can draw any subtree containing the root as a consistent preview.
+
+    The tree is written to directory.partial and renamed when complete.
+
+    Parameters:
+    -----------
+    directory : str
+        Output directory, replaced if it exists.
+    points : np.ndarray
+        (N, 3) point coordinates.
+    colors : np.ndarray
+        (N, 3) BGR colors.
+    max_points_per_tile : int
+        Maximum number of points stored in a tile.
+    max_depth : int
+        Depth below which nodes keep all of their points instead of splitting further.
+    seed : int
+        Seed of the shuffle.
+
+    Returns:
+    --------
+    dict
+        The index written to octree.json: 'bounds' of the root cube, 'num_points' and
+        'nodes', mapping node names ('r', then one octant digit per level) to their
+        'level', 'bounds', 'num_points', tile 'file' and 'children'.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    colors = np.asarray(colors).reshape(-1, 3)
+    order = np.random.default_rng(seed).permutation(len(points))
+    points, colors = points[order], colors[order]
+
+    low = points.min(axis=0) if len(points) else np.zeros(3)
+    high = points.max(axis=0) if len(points) else np.zeros(3)
+    size = max(float(np.max(high - low)), 1e-9)
+    partial = directory + '.partial'
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+
+    nodes = {}
+    stack = [('r', low, size, np.arange(len(points)))]
+    while stack:
+        name, origin, node_size, members = stack.pop()
+        level = len(name) - 1
+        tile = members if level >= max_depth else members[:max_points_per_tile]
+        rest = members[len(tile):]
+        write_ply(os.path.join(partial, name + '.ply'), points[tile], colors[tile])
+        children = []
+        if len(rest):
+            # Octant of every remaining point, bit 0 for x, 1 for y and 2 for z
+            half = node_size / 2
+            upper = points[rest] >= origin + half
+            octants = upper[:, 0] | (upper[:, 1].astype(np.int64) << 1) | (upper[:, 2].astype(np.int64) << 2)
+            sort = np.argsort(octants, kind='stable')
+            rest, octants = rest[sort], octants[sort]
+            bounds = np.searchsorted(octants, np.arange(9))
+            for octant in range(8):
+                child = rest[bounds[octant]:bounds[octant + 1]]
+                if len(child):
+                    offset = half * np.array([octant & 1, (octant >> 1) & 1, (octant >> 2) & 1])
+                    children.append(name + str(octant))
+                    stack.append((name + str(octant), origin + offset, half, child))
+        nodes[name] = {'level': level, 'bounds': [origin.tolist(), (origin + node_size).tolist()], 'num_points': int(len(tile)),
+                       'file': name + '.ply', 'children': sorted(children)}
+
+    index = {'format_version': FORMAT_VERSION, 'bounds': [low.tolist(), (low + size).tolist()], 'num_points': int(len(points)), 'nodes': nodes}
+    with open(os.path.join(partial, INDEX_FILE), 'w') as f:
+        json.dump(index, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(partial, directory)
+    return index
+
+
+def load_octree_index(directory:str) -> dict:
+    """
+    Read the index of an octree written by write_octree.
+
+    Parameters:
+    -----------
+    directory : str
+        Octree directory.
+
+    Returns:
+    --------
+    dict
+        The index, see write_octree.
+    """
+    with open(os.path.join(directory, INDEX_FILE)) as f:
+        index = json.load(f)
+    if index.get('format_version') != FORMAT_VERSION:
+        raise ValueError('octree {} has format version {}, expected {}'.format(directory, index.get('format_version'), FORMAT_VERSION))
+    return index
+
+
+def load_tile(directory:str, index:dict, name:str) -> tuple:
+    """
+    Read the points of one node.
+
+    Parameters:
+    -----------
+    directory : str
+        Octree directory.
+    index : dict
+        Index of the octree.
+    name : str
+        Name of the node.
+
+    Returns:
+    --------
+    tuple
+        (N, 3) float32 points and (N, 3) uint8 BGR colors.
+    """
+    return read_ply(os.path.join(directory, index['nodes'][name]['file']))
+
+
+def select_tiles(index:dict, camera_position, point_budget:int) -> list:
+    """
+    Choose the nodes to draw from a camera position within a point budget.
+
+    Nodes are visited best first by their size over their distance to the camera,
+    so nearby regions are refined before distant ones, and a node is only chosen
+    together with its parent, which keeps the selection a subtree containing the root.
+
+    Parameters:
+    -----------
+    index : dict
+        Index of the octree.
+    camera_position : np.ndarray
+        Camera center in the coordinates of the cloud.
+    point_budget : int
+        Maximum number of points of the chosen nodes, the root is always chosen.
+
+    Returns:
+    --------
+    list
+        Names of the chosen nodes, coarse to fine.
+    """
+    camera_position = np.asarray(camera_position, dtype=np.float64)
+    nodes = index['nodes']
+
+    def priority(name):
+        low, high = np.array(nodes[name]['bounds'])
+        distance = np.linalg.norm(np.clip(camera_position, low, high) - camera_position)
+        return -float(high[0] - low[0]) / max(distance, 1e-9)
+
+    selected, total = [], 0
+    queue = [(priority('r'), 'r')]
+    while queue:
+        _, name = heapq.heappop(queue)
+        if selected and total + nodes[name]['num_points'] > point_budget:
+            continue
+        selected.append(name)
+        total += nodes[name]['num_points']
+        for child in nodes[name]['children']:
+            heapq.heappush(queue, (priority(child), child))
+    return selected
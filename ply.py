@@ -0,0 +1,197 @@
+import numpy as np
+
+# Vertex layout of the exported clouds, colors are stored in OpenCV's BGR order
+VERTEX_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('blue', 'u1'), ('green', 'u1'), ('red', 'u1')])
+_PLY_TYPES = {'<f4': 'float', 'u1': 'uchar'}
+_COUNT_WIDTH = 12
+
+
+def ply_header(num_vertices:int, binary:bool = True, pad_count:bool = False) -> bytes:
+    """
+    Build the header of a PLY vertex file.
+
+    Parameters:
+    -----------
+    num_vertices : int
+        Number of vertices in the file.
+    binary : bool
+        Flag indicating binary_little_endian instead of ascii format.
+    pad_count : bool
+        Zero-pad the vertex count to a fixed width so it can be rewritten in place.
+
+    Returns:
+    --------
+    bytes
+        Encoded header, ending with the end_header line.
+    """
+    count = str(num_vertices).zfill(_COUNT_WIDTH) if pad_count else str(num_vertices)
+    lines = ['ply', 'format binary_little_endian 1.0' if binary else 'format ascii 1.0', 'element vertex ' + count]
+    for name in VERTEX_DTYPE.names:
+        lines.append('property {} {}'.format(_PLY_TYPES[VERTEX_DTYPE[name].str.replace('|', '')], name))
+    lines.append('end_header')
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+
+def to_vertices(points, colors) -> np.ndarray:
+    """
+    Pack points and BGR colors into PLY vertex records.
+
+    Parameters:
+    -----------
+    points : np.ndarray
+        (N, 3) point coordinates.
+    colors : np.ndarray
+        (N, 3) BGR colors.
+
+    Returns:
+    --------
+    np.ndarray
+        (N,) structured array with VERTEX_DTYPE.
+    """
+    points = np.reshape(points, (-1, 3))
+    colors = np.reshape(colors, (-1, 3))
+    vertices = np.empty(len(points), dtype=VERTEX_DTYPE)
+    vertices['x'], vertices['y'], vertices['z'] = points[:, 0], points[:, 1], points[:, 2]
+    colors = np.clip(colors, 0, 255)
+    vertices['blue'], vertices['green'], vertices['red'] = colors[:, 0], colors[:, 1], colors[:, 2]
+    return vertices
+
+
+def _write_vertices(f, points, colors, binary:bool, chunk_size:int) -> None:
+    for start in range(0, len(points), chunk_size):
+        vertices = to_vertices(points[start:start + chunk_size], colors[start:start + chunk_size])
+        if binary:
+            f.write(vertices.tobytes())
+        else:
+            np.savetxt(f, np.column_stack([vertices[name] for name in VERTEX_DTYPE.names]), '%f %f %f %d %d %d')
+
+
+def write_ply(filename:str, points, colors, binary:bool = True, chunk_size:int = 1 << 20) -> None:
+    """
+    Write a colored point cloud to a PLY file, converting at most chunk_size points at a time.
+
+    Parameters:
+    -----------
+    filename : str
+        Path of the PLY file.
+    points : np.ndarray
+        (N, 3) point coordinates.
+    colors : np.ndarray
+        (N, 3) BGR colors.
+    binary : bool
+        Flag indicating binary_little_endian instead of ascii format.
+    chunk_size : int
+        Number of points converted and written per chunk.
+    """
+    points = np.reshape(points, (-1, 3))
+    colors = np.reshape(colors, (-1, 3))
+    with open(filename, 'wb') as f:
+        f.write(ply_header(len(points), binary))
+        _write_vertices(f, points, colors, binary, chunk_size)
+
+
+def read_ply(filename:str) -> tuple:
+    """
+    Read a PLY file written by write_ply or PlyStreamWriter.
+
+    Parameters:
+    -----------
+    filename : str
+        Path of the PLY file.
+
+    Returns:
+    --------
+    tuple
+        (N, 3) float32 point coordinates and (N, 3) uint8 BGR colors.
+    """
+    with open(filename, 'rb') as f:
+        header = []
+        while not header or header[-1] != 'end_header':
+            line = f.readline()
+            if not line:
+                raise ValueError('{} has no end_header line'.format(filename))
+            header.append(line.decode('ascii').strip())
+        num_vertices = int(next(line for line in header if line.startswith('element vertex')).split()[-1])
+        if 'format binary_little_endian 1.0' in header:
+            vertices = np.fromfile(f, dtype=VERTEX_DTYPE, count=num_vertices)
+        elif num_vertices == 0:
+            vertices = np.empty(0, dtype=VERTEX_DTYPE)
+        else:
+            values = np.loadtxt(f, ndmin=2, max_rows=num_vertices).reshape(-1, len(VERTEX_DTYPE.names))
+            vertices = np.empty(len(values), dtype=VERTEX_DTYPE)
+            for column, name in enumerate(VERTEX_DTYPE.names):
+                vertices[name] = values[:, column]
+    points = np.column_stack((vertices['x'], vertices['y'], vertices['z']))
+    colors = np.column_stack((vertices['blue'], vertices['green'], vertices['red']))
+    return points, colors
+
+
+class PlyStreamWriter:
+    """
+    PLY writer that appends points while a reconstruction is running.
+
+    The vertex count in the header is zero-padded to a fixed width and
+    rewritten after every append, so the file is a valid PLY between appends.
+
+    Attributes:
+    -----------
+    filename : str
+        Path of the PLY file.
+    binary : bool
+        Flag indicating binary_little_endian instead of ascii format.
+    num_vertices : int
+        Number of points written so far.
+    """
+    def __init__(self, filename:str, binary:bool = True, chunk_size:int = 1 << 20):
+        """
+        Create the PLY file and write an empty header.
+
+        Parameters:
+        -----------
+        filename : str
+            Path of the PLY file.
+        binary : bool
+            Flag indicating binary_little_endian instead of ascii format.
+        chunk_size : int
+            Number of points converted and written per chunk.
+        """
+        self.filename = filename
+        self.binary = binary
+        self.chunk_size = chunk_size
+        self.num_vertices = 0
+        self._file = open(filename, 'wb')
+        self._file.write(ply_header(0, binary, pad_count=True))
+        self._file.flush()
+
+    def append(self, points, colors) -> None:
+        """
+        Append points to the file and update the header.
+
+        Parameters:
+        -----------
+        points : np.ndarray
+            (N, 3) point coordinates.
+        colors : np.ndarray
+            (N, 3) BGR colors.
+        """
+        points = np.reshape(points, (-1, 3))
+        colors = np.reshape(colors, (-1, 3))
+        self._file.seek(0, 2)
+        _write_vertices(self._file, points, colors, self.binary, self.chunk_size)
+        self.num_vertices += len(points)
+        self._file.seek(0)
+        self._file.write(ply_header(self.num_vertices, self.binary, pad_count=True))
+        self._file.flush()
+
+    def close(self) -> None:
+        """
+        Close the file.
+        """
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
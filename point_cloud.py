@@ -0,0 +1,380 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class PointCloud:
+    """
+    Colored point cloud that grows by whole batches of points.
+
+    Points, colors, track ids and errors live in preallocated arrays whose
+    capacity doubles when full, so appending N points in total costs O(N)
+    time and memory instead of the O(N^2) of repeated np.vstack.
+
+    Attributes:
+    -----------
+    points : np.ndarray
+        (N, 3) point coordinates.
+    colors : np.ndarray
+        (N, 3) uint8 BGR colors.
+    track_ids : np.ndarray
+        (N,) track id of every point, -1 if the point has no track.
+    errors : np.ndarray
+        (N,) mean reprojection error of every point in pixels, over all registered views observing its track.
+    """
+    def __init__(self, capacity:int = 1024):
+        """
+        Initialize an empty point cloud.
+
+        Parameters:
+        -----------
+        capacity : int
+            Number of points allocated up front.
+        """
+        self.num_points = 0
+        self._points = np.empty((capacity, 3))
+        self._colors = np.empty((capacity, 3), dtype=np.uint8)
+        self._track_ids = np.empty(capacity, dtype=np.int64)
+        self._errors = np.empty(capacity, dtype=np.float32)
+
+    @property
+    def points(self) -> np.ndarray:
+        return self._points[:self.num_points]
+
+    @property
+    def colors(self) -> np.ndarray:
+        return self._colors[:self.num_points]
+
+    @property
+    def track_ids(self) -> np.ndarray:
+        return self._track_ids[:self.num_points]
+
+    @property
+    def errors(self) -> np.ndarray:
+        return self._errors[:self.num_points]
+
+    def __len__(self) -> int:
+        return self.num_points
+
+    def append(self, points, colors, track_ids=None, errors=None) -> None:
+        """
+        Append a batch of points.
+
+        Parameters:
+        -----------
+        points : np.ndarray
+            (N, 3) point coordinates.
+        colors : np.ndarray
+            (N, 3) BGR colors.
+        track_ids : np.ndarray
+            (N,) track ids, -1 for all points if None.
+        errors : np.ndarray
+            (N,) reprojection errors, NaN for all points if None.
+        """
+        points = np.reshape(points, (-1, 3))
+        count = len(points)
+        self._reserve(self.num_points + count)
+        batch = slice(self.num_points, self.num_points + count)
+        self._points[batch] = points
+        self._colors[batch] = np.clip(np.reshape(colors, (-1, 3)), 0, 255)
+        self._track_ids[batch] = -1 if track_ids is None else track_ids
+        self._errors[batch] = np.nan if errors is None else errors
+        self.num_points += count
+
+    def update_from_tracks(self, tracks) -> None:
+        """
+        Copy the current 3D positions of the tracks back into the points, e.g. after bundle adjustment.
+
+        Parameters:
+        -----------
+        tracks : FeatureTracks
+            Tracks the track ids refer to.
+        """
+        tracked = self.track_ids >= 0
+        self.points[tracked] = tracks.points[self.track_ids[tracked]]
+
+    def to_arrays(self) -> dict:
+        """
+        Export the points as arrays named after the attributes, e.g. for a checkpoint.
+        """
+        return {'points': self.points, 'colors': self.colors, 'track_ids': self.track_ids, 'errors': self.errors}
+
+    @classmethod
+    def from_arrays(cls, arrays:dict) -> 'PointCloud':
+        """
+        Rebuild a point cloud exported with to_arrays, copying possibly memory-mapped arrays.
+        """
+        cloud = cls(max(1024, len(arrays['points'])))
+        cloud.append(arrays['points'], arrays['colors'], arrays['track_ids'], arrays['errors'])
+        return cloud
+
+    def _reserve(self, capacity:int) -> None:
+        if capacity <= len(self._points):
+            return
+        capacity = max(2 * len(self._points), capacity)
+        for name in ('_points', '_colors', '_track_ids', '_errors'):
+            old = getattr(self, name)
+            grown = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            grown[:self.num_points] = old[:self.num_points]
+            setattr(self, name, grown)
+
+
+def sample_colors(image, image_points) -> np.ndarray:
+    """
+    Look up the colors of image points with one fancy-indexing operation.
+
+    Parameters:
+    -----------
+    image : np.ndarray
+        BGR image.
+    image_points : np.ndarray
+        (N, 2) x, y pixel coordinates, truncated to integers and clipped to the image.
+
+    Returns:
+    --------
+    np.ndarray
+        (N, 3) BGR colors.
+    """
+    image_points = np.asarray(image_points).reshape(-1, 2).astype(np.int64)
+    x = np.clip(image_points[:, 0], 0, image.shape[1] - 1)
+    y = np.clip(image_points[:, 1], 0, image.shape[0] - 1)
+    return image[y, x]
+
+
+def point_spacing(points, sample_size:int = 100000, seed:int = 0) -> float:
+    """
+    Median distance of a point to its nearest neighbour, estimated on a random sample.
+
+    Exact duplicates are merged first. The sampled points are looked up in a KD-tree
+    of all points, as subsampling the tree as well would spread the points out and
+    overestimate the spacing.
+
+    Parameters:
+    -----------
+    points : np.ndarray
+        (N, 3) point coordinates.
+    sample_size : int
+        Maximum number of points whose nearest neighbour is looked up.
+    seed : int
+        Seed of the sample.
+
+    Returns:
+    --------
+    float
+        Median distance to the nearest distinct neighbour, 0 for fewer than two distinct points.
+    """
+    # Exact duplicates would be each other's nearest neighbours and pull the median to 0
+    points = np.unique(np.asarray(points, dtype=np.float64).reshape(-1, 3), axis=0)
+    if len(points) < 2:
+        return 0.0
+    sample = points if len(points) <= sample_size else points[np.random.default_rng(seed).choice(len(points), sample_size, replace=False)]
+    distances, _ = cKDTree(points, balanced_tree=False, compact_nodes=False).query(sample, k=2)
+    return float(np.median(distances[:, 1]))
+
+
+def merge_duplicates(points, colors) -> tuple:
+    """
+    Replace points with identical coordinates by one point with their mean color.
+
+    Parameters:
+    -----------
+    points : np.ndarray
+        (N, 3) point coordinates.
+    colors : np.ndarray
+        (N, 3) colors.
+
+    Returns:
+    --------
+    tuple
+        (M, 3) distinct points and (M, 3) uint8 mean colors, M <= N.
+    """
+    points = np.asarray(points).reshape(-1, 3)
+    colors = np.asarray(colors).reshape(-1, 3)
+    if len(points) == 0:
+        return points, colors.astype(np.uint8)
+    unique, inverse, counts = np.unique(points, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    mean_colors = np.column_stack([np.bincount(inverse, weights=colors[:, channel], minlength=len(counts)) for channel in range(3)]) / counts[:, np.newaxis]
+    return unique, np.clip(np.rint(mean_colors), 0, 255).astype(np.uint8)
+
+
+def voxel_downsample(points, colors, voxel_size:float, chunk_size:int = 1 << 20) -> tuple:
+    """
+    Replace the points of every occupied voxel of a regular grid by their centroid and mean color.
+
+    Voxel coordinates are computed chunk by chunk and packed into one int64 key per
+    point, so the only full-size temporaries are the keys and their inverse index.
+
+    Parameters:
+    -----------
+    points : np.ndarray
+        (N, 3) point coordinates.
+    colors : np.ndarray
+        (N, 3) colors.
+    voxel_size : float
+        Edge length of the voxels.
+    chunk_size : int
+        Number of points converted to voxel keys at a time.
+
+    Returns:
+    --------
+    tuple
+        (M, 3) centroids and (M, 3) uint8 mean colors of the occupied voxels, M <= N.
+    """
+    points = np.asarray(points).reshape(-1, 3)
+    colors = np.asarray(colors).reshape(-1, 3)
+    if len(points) == 0:
+        return np.empty((0, 3)), np.empty((0, 3), dtype=np.uint8)
+    origin = points.min(axis=0)
+    extent = np.floor((points.max(axis=0) - origin) / voxel_size).astype(np.int64) + 1
+    if np.prod(extent.astype(np.float64)) >= 2.0 ** 63:
+        raise ValueError('voxel_size {} is too small for a cloud of extent {}'.format(voxel_size, points.max(axis=0) - origin))
+    keys = np.empty(len(points), dtype=np.int64)
+    for start in range(0, len(points), chunk_size):
+        cells = np.floor((points[start:start + chunk_size] - origin) / voxel_size).astype(np.int64)
+        np.minimum(cells, extent - 1, out=cells)
+        keys[start:start + chunk_size] = (cells[:, 0] * extent[1] + cells[:, 1]) * extent[2] + cells[:, 2]
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    del keys
+    centroids = np.column_stack([np.bincount(inverse, weights=points[:, axis], minlength=len(counts)) for axis in range(3)]) / counts[:, np.newaxis]
+    mean_colors = np.column_stack([np.bincount(inverse, weights=colors[:, channel], minlength=len(counts)) for channel in range(3)]) / counts[:, np.newaxis]
+    return centroids, np.clip(np.rint(mean_colors), 0, 255).astype(np.uint8)
+
+
+def statistical_outlier_mask(points, num_neighbors:int = 16, std_ratio:float = 2.0, tree:cKDTree = None, chunk_size:int = 1 << 18, workers:int = -1) -> np.ndarray:
+    """
+    Flag points whose mean distance to their k nearest neighbours is unusually large.
+
+    Parameters:
+    -----------
+    points : np.ndarray
+        (N, 3) point coordinates.
+    num_neighbors : int
+        Number of nearest neighbours k, the point itself not counted.
+    std_ratio : float
+        A point is an outlier if its mean neighbour distance exceeds the mean over all
+        points by more than std_ratio standard deviations.
+    tree : cKDTree
+        KD-tree of the points, built if None.
+    chunk_size : int
+        Number of points queried at a time, which bounds the (chunk_size, k) distance array.
+    workers : int
+        Threads used by each query, -1 for all CPUs.
+
+    Returns:
+    --------
+    np.ndarray
+        (N,) boolean mask of the points to keep.
+    """
+    points = np.asarray(points).reshape(-1, 3)
+    num_neighbors = min(num_neighbors, len(points) - 1)
+    if num_neighbors < 1:
+        return np.ones(len(points), dtype=bool)
+    tree = tree if tree is not None else cKDTree(points)
+    mean_distances = np.empty(len(points))
+    for start in range(0, len(points), chunk_size):
+        distances, _ = tree.query(points[start:start + chunk_size], k=num_neighbors + 1, workers=workers)
+        mean_distances[start:start + chunk_size] = distances[:, 1:].mean(axis=1)
+    return mean_distances <= mean_distances.mean() + std_ratio * mean_distances.std()
+
+
+def radius_outlier_mask(points, radius:float, min_neighbors:int = 2, tree:cKDTree = None, chunk_size:int = 1 << 18, workers:int = -1) -> np.ndarray:
+    """
+    Flag points with fewer than min_neighbors other points within radius.
+
+    Parameters:
+    -----------
+    points : np.ndarray
+        (N, 3) point coordinates.
+    radius : float
+        Radius of the neighbourhood.
+    min_neighbors : int
+        Minimum number of other points in the neighbourhood of a kept point.
+    tree : cKDTree
+        KD-tree of the points, built if None.
+    chunk_size : int
+        Number of points queried at a time.
+    workers : int
+        Threads used by each query, -1 for all CPUs.
+
+    Returns:
+    --------
+    np.ndarray
+        (N,) boolean mask of the points to keep.
+    """
+    points = np.asarray(points).reshape(-1, 3)
+    tree = tree if tree is not None else cKDTree(points)
+    keep = np.empty(len(points), dtype=bool)
+    for start in range(0, len(points), chunk_size):
+        counts = tree.query_ball_point(points[start:start + chunk_size], radius, workers=workers, return_length=True)
+        keep[start:start + chunk_size] = counts - 1 >= min_neighbors
+    return keep
+
+
+def filter_point_cloud(
+        points,
+        colors,
+        voxel_size:float = None,
+        num_neighbors:int = 16,
+        std_ratio:float = 2.0,
+        radius:float = None,
+        min_neighbors:int = 2,
+        chunk_size:int = 1 << 18,
+        workers:int = -1
+) -> tuple:
+    """
+    Deduplicate and denoise a point cloud for export.
+
+    Exact duplicates are merged first, then voxel grid downsampling merges the
+    near-duplicate points that overlapping views triangulate on the same surface, then statistical and radius outlier removal
+    drop isolated points. Both outlier tests share one KD-tree of the downsampled
+    points. Sizes default to multiples of the median nearest neighbour spacing of
+    the input, so the filter does not depend on the arbitrary scale of the reconstruction.
+
+    Parameters:
+    -----------
+    points : np.ndarray
+        (N, 3) point coordinates.
+    colors : np.ndarray
+        (N, 3) colors.
+    voxel_size : float
+        Edge length of the downsampling voxels, defaults to the median spacing, 0 disables downsampling.
+    num_neighbors : int
+        Neighbours of the statistical outlier test, 0 disables it.
+    std_ratio : float
+        Standard deviations above the mean neighbour distance beyond which a point is an outlier.
+    radius : float
+        Neighbourhood radius of the radius outlier test, defaults to four times the voxel size
+        (or the median spacing without downsampling), 0 disables the test.
+    min_neighbors : int
+        Minimum number of other points within radius of a kept point.
+    chunk_size : int
+        Number of points processed at a time by every stage.
+    workers : int
+        Threads used by the KD-tree queries, -1 for all CPUs.
+
+    Returns:
+    --------
+    tuple
+        Filtered (M, 3) points and (M, 3) uint8 colors.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    colors = np.asarray(colors).reshape(-1, 3)
+    finite = np.isfinite(points).all(axis=1)
+    points, colors = points[finite], colors[finite]
+    if voxel_size != 0:
+        points, colors = merge_duplicates(points, colors)
+    if voxel_size is None or radius is None:
+        spacing = point_spacing(points)
+        voxel_size = spacing if voxel_size is None else voxel_size
+        radius = 4 * (voxel_size or spacing) if radius is None else radius
+    if voxel_size > 0:
+        points, colors = voxel_downsample(points, colors, voxel_size, 4 * chunk_size)
+    if len(points) == 0 or not (num_neighbors > 0 or radius > 0):
+        return points, colors.astype(np.uint8)
+    tree = cKDTree(points)
+    keep = np.ones(len(points), dtype=bool)
+    if num_neighbors > 0:
+        keep &= statistical_outlier_mask(points, num_neighbors, std_ratio, tree, chunk_size, workers)
+    if radius > 0:
+        keep &= radius_outlier_mask(points, radius, min_neighbors, tree, chunk_size, workers)
+    return points[keep], colors[keep].astype(np.uint8)
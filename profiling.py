@@ -0,0 +1,193 @@
+import cProfile
+import csv
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, memory peaks are then reported as None
+    resource = None
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process and its finished children, in MiB.
+
+    This is the high-water mark over the whole life of the process (ru_maxrss), it
+    never goes down. The difference of two readings is how much the code in between
+    raised it.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    unit = 1.0 if sys.platform == 'darwin' else 1024.0
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * unit / (1024.0 * 1024.0)
+
+
+class PipelineProfiler:
+    """
+    Collects per-stage wall times and memory peaks of a pipeline run.
+
+    Every measurement is a record with the stage name, the view it belongs to
+    (None for whole-run stages), its duration, the process RSS high-water mark at
+    its end and, for measured stages, how much the stage raised that mark. With
+    trace_memory the peak Python heap allocation inside the stage is recorded as
+    well, at the cost of slowing allocations down. Stages may be nested, an
+    enclosing stage still reports the heap peak of the stages inside it.
+
+    Attributes:
+    -----------
+    enabled : bool
+        Flag indicating whether measurements are recorded.
+    trace_memory : bool
+        Flag indicating whether tracemalloc measures the heap peak of every stage.
+    records : list
+        One dictionary per measurement.
+    """
+    FIELDS = ('stage', 'view', 'seconds', 'rss_high_water_mb', 'rss_growth_mb', 'peak_traced_mb')
+
+    def __init__(self, enabled:bool = True, trace_memory:bool = False):
+        """
+        Initialize the PipelineProfiler.
+
+        Parameters:
+        -----------
+        enabled : bool
+            Flag indicating whether measurements are recorded.
+        trace_memory : bool
+            Flag indicating whether tracemalloc measures the heap peak of every stage.
+        """
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.records = []
+        self._lock = threading.Lock()
+        # Heap peak seen so far by every open stage, innermost last
+        self._traced_peaks = []
+        self._start = time.perf_counter()
+        if self.enabled and self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name:str, view:int = None):
+        """
+        Measure the enclosed block as one stage.
+
+        Parameters:
+        -----------
+        name : str
+            Stage name.
+        view : int
+            Index of the image the stage works on, None for whole-run stages.
+        """
+        if not self.enabled:
+            yield
+            return
+        if self.trace_memory:
+            # reset_peak also clears the peak of the enclosing stage, so keep it before resetting
+            if self._traced_peaks:
+                self._traced_peaks[-1] = max(self._traced_peaks[-1], tracemalloc.get_traced_memory()[1])
+            self._traced_peaks.append(0)
+            tracemalloc.reset_peak()
+        rss_start = peak_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak_traced = None
+            if self.trace_memory:
+                peak = max(self._traced_peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self._traced_peaks:
+                    self._traced_peaks[-1] = max(self._traced_peaks[-1], peak)
+                peak_traced = peak / (1024.0 * 1024.0)
+            rss_growth = None if rss_start is None else peak_rss_mb() - rss_start
+            self.record(name, seconds, view, peak_traced, rss_growth)
+
+    def record(self, name:str, seconds:float, view:int = None, peak_traced_mb:float = None, rss_growth_mb:float = None) -> None:
+        """
+        Add a measurement taken elsewhere, e.g. inside a worker process.
+
+        Parameters:
+        -----------
+        name : str
+            Stage name.
+        seconds : float
+            Duration of the stage.
+        view : int
+            Index of the image the stage works on.
+        peak_traced_mb : float
+            Peak traced heap during the stage, if known.
+        rss_growth_mb : float
+            How much the stage raised the RSS high-water mark, if known.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.records.append({'stage': name, 'view': None if view is None else int(view), 'seconds': float(seconds),
+                                 'rss_high_water_mb': peak_rss_mb(), 'rss_growth_mb': rss_growth_mb,
+                                 'peak_traced_mb': peak_traced_mb})
+
+    def summary(self) -> dict:
+        """
+        Aggregate the records per stage.
+
+        Returns:
+        --------
+        dict
+            Total wall time, RSS high-water mark and per-stage totals (calls, seconds, mean, max).
+        """
+        stages = {}
+        for record in self.records:
+            entry = stages.setdefault(record['stage'], {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            entry['calls'] += 1
+            entry['seconds'] += record['seconds']
+            entry['max_seconds'] = max(entry['max_seconds'], record['seconds'])
+        for entry in stages.values():
+            entry['mean_seconds'] = entry['seconds'] / entry['calls']
+        return {'wall_seconds': time.perf_counter() - self._start, 'rss_high_water_mb': peak_rss_mb(), 'stages': stages}
+
+    def to_json(self, filename:str) -> None:
+        """
+        Write the summary and every record to a JSON file.
+        """
+        with open(filename, 'w') as f:
+            json.dump({'summary': self.summary(), 'records': self.records}, f, indent=2)
+
+    def to_csv(self, filename:str) -> None:
+        """
+        Write every record as one CSV row.
+        """
+        with open(filename, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+            writer.writeheader()
+            writer.writerows(self.records)
+
+
+def profile_call(function, stats_file:str, *args, **kwargs):
+    """
+    Run a function under cProfile and dump the statistics to a file.
+
+    Parameters:
+    -----------
+    function : callable
+        Function to profile.
+    stats_file : str
+        Path of the pstats file, readable with python -m pstats.
+
+    Returns:
+    --------
+    object
+        Return value of the function.
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        profiler.dump_stats(stats_file)
@@ -0,0 +1,236 @@
+import cv2
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from view_graph import ViewGraph
+
+
+class VocabularyTree:
+    """
+    Hierarchical k-means vocabulary quantizing SIFT descriptors into visual words.
+
+    Every node splits its descriptors into `branching` clusters, down to `depth`
+    levels, and the leaves are the visual words. Quantizing a descriptor compares
+    it with `branching` centers per level instead of with every word.
+
+    Attributes:
+    -----------
+    branching : int
+        Number of children of every node.
+    depth : int
+        Number of levels, the vocabulary has branching ** depth words.
+    centers : list
+        Per level, the (branching ** (level + 1), D) centers of all nodes, children of node n at rows n * branching onwards.
+    """
+    def __init__(self, branching:int = 10, depth:int = 3, max_training:int = 100000, seed:int = 0):
+        """
+        Initialize an untrained VocabularyTree.
+
+        Parameters:
+        -----------
+        branching : int
+            Number of children of every node.
+        depth : int
+            Number of levels.
+        max_training : int
+            Maximum number of descriptors sampled to build the tree.
+        seed : int
+            Seed of the sampling and of k-means, so the same images give the same vocabulary.
+        """
+        self.branching = branching
+        self.depth = depth
+        self.max_training = max_training
+        self.seed = seed
+        self.centers = []
+
+    @property
+    def num_words(self) -> int:
+        return self.branching ** self.depth
+
+    def fit(self, descriptors:list) -> 'VocabularyTree':
+        """
+        Build the tree from the descriptors of a set of images.
+
+        Parameters:
+        -----------
+        descriptors : list
+            (N_i, D) descriptors of every image.
+
+        Returns:
+        --------
+        VocabularyTree
+            The trained tree.
+        """
+        data = np.concatenate([np.asarray(d, dtype=np.float32) for d in descriptors])
+        rng = np.random.default_rng(self.seed)
+        if len(data) > self.max_training:
+            data = data[rng.choice(len(data), self.max_training, replace=False)]
+        cv2.setRNGSeed(self.seed)
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1e-3)
+
+        nodes = np.zeros(len(data), dtype=np.int64)
+        self.centers = []
+        for _ in range(self.depth):
+            num_nodes = len(self.centers[-1]) if self.centers else 1
+            level = np.empty((num_nodes * self.branching, data.shape[1]), dtype=np.float32)
+            children = np.empty(len(data), dtype=np.int64)
+            for node in range(num_nodes):
+                members = np.flatnonzero(nodes == node)
+                if len(members) >= self.branching:
+                    _, labels, node_centers = cv2.kmeans(data[members], self.branching, None, criteria, 1, cv2.KMEANS_PP_CENTERS)
+                    labels = labels.ravel()
+                elif len(members):
+                    # Too few descriptors to split, the leftover children duplicate existing ones
+                    node_centers = data[members[np.arange(self.branching) % len(members)]]
+                    labels = np.arange(len(members))
+                else:
+                    node_centers = np.zeros((self.branching, data.shape[1]), dtype=np.float32) if not self.centers else np.repeat(self.centers[-1][node:node + 1], self.branching, axis=0)
+                    labels = np.empty(0, dtype=np.int64)
+                level[node * self.branching:(node + 1) * self.branching] = node_centers
+                children[members] = node * self.branching + labels
+            self.centers.append(level)
+            nodes = children
+        return self
+
+    def quantize(self, descriptors, chunk_size:int = 4096) -> np.ndarray:
+        """
+        Assign every descriptor to its visual word.
+
+        Parameters:
+        -----------
+        descriptors : np.ndarray
+            (N, D) descriptors.
+        chunk_size : int
+            Number of descriptors pushed down the tree at once, bounds the temporary memory.
+
+        Returns:
+        --------
+        np.ndarray
+            (N,) word ids in [0, num_words).
+        """
+        if not self.centers:
+            raise ValueError('the vocabulary tree has not been trained, call fit first')
+        descriptors = np.asarray(descriptors, dtype=np.float32)
+        words = np.empty(len(descriptors), dtype=np.int64)
+        norms = [np.einsum('ij,ij->i', level, level) for level in self.centers]
+        for start in range(0, len(descriptors), chunk_size):
+            chunk = descriptors[start:start + chunk_size]
+            nodes = np.zeros(len(chunk), dtype=np.int64)
+            for level, level_norms in zip(self.centers, norms):
+                children = nodes[:, np.newaxis] * self.branching + np.arange(self.branching)
+                # Squared distance up to the |descriptor|^2 term, which does not change the argmin
+                distances = level_norms[children] - 2 * np.einsum('nd,nbd->nb', chunk, level[children])
+                nodes = children[np.arange(len(chunk)), np.argmin(distances, axis=1)]
+            words[start:start + chunk_size] = nodes
+        return words
+
+
+class ImageRetrieval:
+    """
+    Bag-of-visual-words image retrieval with TF-IDF weighting and an inverted index.
+
+    Every image becomes an L2-normalized TF-IDF vector over the words of a
+    VocabularyTree. The inverted index is stored as a sparse matrix with one row
+    per word listing the images containing it and their weights, so scoring a
+    query touches only the posting lists of its own words.
+
+    Attributes:
+    -----------
+    vocabulary : VocabularyTree
+        Trained vocabulary.
+    idf : np.ndarray
+        Inverse document frequency of every word.
+    inverted_index : scipy.sparse.csr_matrix
+        (num_words, num_images) posting lists, row w holds the weights of word w in the images containing it.
+    """
+    def __init__(self, vocabulary:VocabularyTree):
+        """
+        Initialize the ImageRetrieval.
+
+        Parameters:
+        -----------
+        vocabulary : VocabularyTree
+            Trained vocabulary.
+        """
+        self.vocabulary = vocabulary
+        self.idf = None
+        self.inverted_index = None
+
+    def build(self, descriptors:list) -> None:
+        """
+        Index a set of images.
+
+        Parameters:
+        -----------
+        descriptors : list
+            (N_i, D) descriptors of every image, the list position is the image id.
+        """
+        num_words = self.vocabulary.num_words
+        counts = np.stack([np.bincount(self.vocabulary.quantize(d), minlength=num_words) for d in descriptors]).astype(np.float64)
+        document_frequency = np.count_nonzero(counts, axis=0)
+        # Smoothed so words seen in every image keep a small weight, small collections would otherwise lose most words
+        self.idf = np.log((1 + len(descriptors)) / (1 + document_frequency)) + 1
+        vectors = counts / np.maximum(counts.sum(axis=1, keepdims=True), 1) * self.idf
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        self.inverted_index = csr_matrix(vectors.T)
+
+    def similarities(self) -> np.ndarray:
+        """
+        Cosine similarity of every pair of indexed images, 0 on the diagonal.
+        """
+        scores = (self.inverted_index.T @ self.inverted_index).toarray()
+        np.fill_diagonal(scores, 0.0)
+        return scores
+
+    def top_k_pairs(self, k:int) -> list:
+        """
+        Propose the k most similar images of every image as candidate pairs.
+
+        Parameters:
+        -----------
+        k : int
+            Number of candidates per image.
+
+        Returns:
+        --------
+        list
+            (i, j, score) with i < j, a pair proposed by both of its images appears once.
+        """
+        scores = self.similarities()
+        k = min(k, len(scores) - 1)
+        pairs = {}
+        for image_id, row in enumerate(scores):
+            for other in np.argsort(-row, kind='stable')[:k]:
+                if row[other] > 0:
+                    pairs[(min(image_id, other), max(image_id, other))] = float(row[other])
+        return [(i, j, score) for (i, j), score in sorted(pairs.items())]
+
+
+def build_view_graph(descriptors:list, num_neighbors:int = 5, branching:int = 10, depth:int = 3, seed:int = 0) -> ViewGraph:
+    """
+    Build a view graph linking every image to its most similar images.
+
+    Parameters:
+    -----------
+    descriptors : list
+        (N_i, D) descriptors of every image, the list position is the image id.
+    num_neighbors : int
+        Number of candidate pairs proposed per image.
+    branching : int
+        Branching factor of the vocabulary tree.
+    depth : int
+        Depth of the vocabulary tree.
+    seed : int
+        Seed of the vocabulary training.
+
+    Returns:
+    --------
+    ViewGraph
+        Graph whose edges carry the retrieval similarity as 'score'.
+    """
+    retrieval = ImageRetrieval(VocabularyTree(branching, depth, seed=seed).fit(descriptors))
+    retrieval.build(descriptors)
+    graph = ViewGraph(len(descriptors))
+    for image_0, image_1, score in retrieval.top_k_pairs(num_neighbors):
+        graph.add_edge(image_0, image_1, score=score)
+    return graph
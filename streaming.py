@@ -0,0 +1,55 @@
+import os
+import time
+
+IMAGE_EXTENSIONS = ('.jpg', '.png')
+
+
+def watch_directory(directory:str, poll_interval:float = 1.0, idle_timeout:float = None, stop_file:str = 'STOP'):
+    """
+    Yield the images of a directory in filename order, then every new image as it appears.
+
+    The directory is polled, which works on every platform and on network shares. A new
+    file is only yielded once its size is unchanged between two polls, so images that
+    are still being copied or written by the camera are not read half-finished.
+
+    Parameters:
+    -----------
+    directory : str
+        Directory to watch.
+    poll_interval : float
+        Seconds between two scans of the directory.
+    idle_timeout : float
+        Stop after this many seconds without a new image, None watches until stop_file appears.
+    stop_file : str
+        Name of a file that ends the watch once created in the directory, None to disable.
+
+    Yields:
+    -------
+    str
+        Path of every image, each exactly once.
+    """
+    seen = set()
+    pending = {}
+    last_new = time.monotonic()
+    while True:
+        names = sorted(os.listdir(directory))
+        for name in names:
+            if name in seen or not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if pending.get(name) == size and size > 0:
+                seen.add(name)
+                pending.pop(name)
+                last_new = time.monotonic()
+                yield path
+            else:
+                pending[name] = size
+        if stop_file is not None and stop_file in names and not pending:
+            return
+        if idle_timeout is not None and not pending and time.monotonic() - last_new > idle_timeout:
+            return
+        time.sleep(poll_interval)
@@ -0,0 +1,74 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bundle_adjustment import intrinsics_from_K, project, rotation_matrices
+from SFM import StructurefromMotion
+from view_graph import ViewGraph
+
+
+@pytest.fixture
+def scene():
+    """
+    Synthetic scene of five cameras on an arc looking at a cloud of 300 points, every point seen by every camera.
+
+    Returns a dict with the intrinsic matrix 'K', the true (5, 6) axis-angle 'camera_params', the true (300, 3)
+    'points', the camera and point index of every observation and its noise-free image point 'points_2d'.
+    """
+    rng = np.random.default_rng(0)
+    num_cameras, num_points = 5, 300
+    K = np.array([[800.0, 0.0, 320.0], [0.0, 800.0, 240.0], [0.0, 0.0, 1.0]])
+    points = rng.uniform(-1, 1, (num_points, 3)) + [0, 0, 6]
+
+    # Camera centers on an arc around the cloud, every camera rotated to keep it in view
+    angles = np.radians(5.0 * (np.arange(num_cameras) - 2))
+    centers = np.column_stack((6 * np.sin(angles), np.zeros(num_cameras), 6 - 6 * np.cos(angles)))
+    rot_vectors = np.column_stack((np.zeros(num_cameras), angles, np.zeros(num_cameras)))
+    translations = -np.matmul(rotation_matrices(rot_vectors), centers[:, :, np.newaxis])[:, :, 0]
+    camera_params = np.hstack((rot_vectors, translations))
+
+    camera_indices = np.repeat(np.arange(num_cameras), num_points)
+    point_indices = np.tile(np.arange(num_points), num_cameras)
+    points_2d = project(points[point_indices], camera_params[camera_indices], intrinsics_from_K(K))
+    return {'K': K, 'camera_params': camera_params, 'points': points, 'camera_indices': camera_indices,
+            'point_indices': point_indices, 'points_2d': points_2d}
+
+
+@pytest.fixture
+def synthetic_sfm(tmp_path, scene):
+    """
+    StructurefromMotion over blank images of the synthetic scene, with its keypoints already in the feature store.
+
+    Keypoint k of every view is the projection of point k with 0.5 px of noise. Points 0-199 are seen by every
+    view, points 200-299 only by views 3 and 4. Every pair of views is linked in the view graph with the matches
+    of the points both see. Nothing is registered yet.
+    """
+    img_dir = tmp_path / 'scene'
+    img_dir.mkdir()
+    np.savetxt(str(img_dir / 'K.txt'), scene['K'])
+    for view in range(5):
+        cv2.imwrite(str(img_dir / '{:02d}.png'.format(view)), np.full((480, 640, 3), 40 * view, dtype=np.uint8))
+    sfm = StructurefromMotion(str(img_dir), 1.0, use_feature_cache=False, output_dir=str(tmp_path), verify_pairs=False, checkpoint_every=0,
+                              local_ba_window=2, local_ba_every=1)
+
+    rng = np.random.default_rng(4)
+    num_points = len(scene['points'])
+    observed = scene['points_2d'] + rng.normal(0, 0.5, scene['points_2d'].shape)
+    for view, image_path in enumerate(sfm.img_obj.image_list):
+        keypoints = observed[scene['camera_indices'] == view]
+        sfm.feature_store.put(image_path, sfm.img_obj.factor, keypoints, rng.random((num_points, 128)))
+
+    visible = {view: np.arange(200) for view in range(3)}
+    visible[3] = visible[4] = np.arange(num_points)
+    sfm.view_graph = ViewGraph(5)
+    for view_0 in range(5):
+        for view_1 in range(view_0 + 1, 5):
+            shared = np.intersect1d(visible[view_0], visible[view_1])
+            sfm.view_graph.add_edge(view_0, view_1, score=1.0, matches=(shared, shared))
+    return sfm
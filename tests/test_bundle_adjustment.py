@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from bundle_adjustment import (LocalBundleAdjustmentScheduler, bundle_adjustment, intrinsics_from_K, params_to_transform, project,
+                               reprojection_jacobian, transform_to_params)
+
+
+def numeric_jacobian(function, x, step:float = 1e-6) -> np.ndarray:
+    """
+    Central differences of function at x, one column per parameter.
+    """
+    columns = []
+    for index in range(len(x)):
+        offset = np.zeros(len(x))
+        offset[index] = step * max(1.0, abs(x[index]))
+        columns.append((function(x + offset) - function(x - offset)) / (2 * offset[index]))
+    return np.column_stack(columns)
+
+
+@pytest.mark.parametrize('rot_scale', [0.0, 1e-8, 0.3, 2.5])
+def test_reprojection_jacobian_matches_finite_differences(rot_scale):
+    rng = np.random.default_rng(1)
+    num = 20
+    points = rng.normal(0, 1, (num, 3)) + [0, 0, 8]
+    camera_params = np.hstack((rng.normal(0, 1, (num, 3)) * rot_scale, rng.normal(0, 0.5, (num, 3))))
+    intrinsics = np.array([900.0, 910.0, 320.0, 240.0])
+    d_camera, d_intrinsics, d_points = reprojection_jacobian(points, camera_params, intrinsics)
+
+    for obs in range(num):
+        numeric_camera = numeric_jacobian(lambda x: project(points[obs:obs + 1], x[np.newaxis], intrinsics)[0], camera_params[obs])
+        numeric_intrinsics = numeric_jacobian(lambda x: project(points[obs:obs + 1], camera_params[obs:obs + 1], x)[0], intrinsics)
+        numeric_points = numeric_jacobian(lambda x: project(x[np.newaxis], camera_params[obs:obs + 1], intrinsics)[0], points[obs])
+        np.testing.assert_allclose(d_camera[obs], numeric_camera, rtol=1e-5, atol=1e-4)
+        np.testing.assert_allclose(d_intrinsics[obs], numeric_intrinsics, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(d_points[obs], numeric_points, rtol=1e-5, atol=1e-4)
+
+
+def test_params_round_trip():
+    params = np.array([0.1, -0.2, 0.3, 1.0, 2.0, 3.0])
+    np.testing.assert_allclose(transform_to_params(params_to_transform(params)), params)
+
+
+@pytest.mark.parametrize('jac', ['analytic', '2-point'])
+def test_bundle_adjustment_recovers_perturbed_scene(scene, jac):
+    rng = np.random.default_rng(2)
+    intrinsics = intrinsics_from_K(scene['K'])
+    # Two fixed cameras pin down the gauge, including the scale
+    cameras = scene['camera_params'].copy()
+    cameras[2:] += np.hstack((rng.normal(0, 0.01, (3, 3)), rng.normal(0, 0.05, (3, 3))))
+    points = scene['points'] + rng.normal(0, 0.05, scene['points'].shape)
+
+    refined_cameras, refined_points, refined_intrinsics, result = bundle_adjustment(cameras, points, intrinsics, scene['camera_indices'], scene['point_indices'],
+                                                                                     scene['points_2d'], fixed_cameras=(0, 1), jac=jac)
+    assert result.success
+    np.testing.assert_allclose(refined_cameras, scene['camera_params'], atol=1e-4)
+    np.testing.assert_allclose(refined_points, scene['points'], atol=1e-4)
+    np.testing.assert_array_equal(refined_cameras[:2], scene['camera_params'][:2])
+    np.testing.assert_array_equal(refined_intrinsics, intrinsics)
+
+
+def test_bundle_adjustment_refines_intrinsics(scene):
+    intrinsics = intrinsics_from_K(scene['K'])
+    _, _, refined_intrinsics, result = bundle_adjustment(scene['camera_params'], scene['points'], intrinsics * [1.02, 1.0, 1.01, 1.0], scene['camera_indices'],
+                                                         scene['point_indices'], scene['points_2d'], fixed_cameras=(0, 1), refine_intrinsics=True)
+    # The cameras only move along x, so fy trades off against the y coordinates of the points, fx does not
+    assert np.abs(result.fun).max() < 1e-3
+    assert abs(refined_intrinsics[0] - intrinsics[0]) < 0.1
+
+
+def test_local_scheduler_triggers_on_count_and_error():
+    scheduler = LocalBundleAdjustmentScheduler(window_size=2, every=3, error_threshold=1.0)
+    assert [scheduler.step(0.1) for _ in range(6)] == [False, False, True, False, False, True]
+    assert scheduler.step(5.0)
+    assert scheduler.window([4, 7, 1, 9]) == [1, 9]
@@ -0,0 +1,97 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from bundle_adjustment import params_to_transform
+from checkpoint import FORMAT_VERSION, LATEST_FILE, STATE_FILE, load_checkpoint, save_checkpoint
+
+
+def test_round_trip_and_pruning(tmp_path):
+    root = str(tmp_path)
+    assert load_checkpoint(root) is None
+    for views in range(1, 4):
+        save_checkpoint(root, 'views_{}'.format(views), {'points': np.arange(views * 3.0).reshape(-1, 3)}, {'views': views}, keep=2)
+
+    arrays, metadata = load_checkpoint(root)
+    assert metadata['views'] == 3 and metadata['format_version'] == FORMAT_VERSION
+    assert isinstance(arrays['points'], np.memmap)
+    np.testing.assert_array_equal(arrays['points'], np.arange(9.0).reshape(3, 3))
+    assert not isinstance(load_checkpoint(root, mmap_mode=None)[0]['points'], np.memmap)
+    assert sorted(entry for entry in os.listdir(root) if entry != LATEST_FILE) == ['views_2', 'views_3']
+
+
+def test_an_interrupted_save_keeps_the_previous_checkpoint(tmp_path):
+    root = str(tmp_path)
+    save_checkpoint(root, 'views_1', {'points': np.zeros((1, 3))}, {'views': 1})
+    # A crash after writing the arrays but before switching latest.json leaves a partial directory behind
+    os.makedirs(os.path.join(root, 'views_2.partial'))
+    assert load_checkpoint(root)[1]['views'] == 1
+    save_checkpoint(root, 'views_2', {'points': np.ones((2, 3))}, {'views': 2})
+    assert load_checkpoint(root)[1]['views'] == 2
+    assert not os.path.exists(os.path.join(root, 'views_2.partial'))
+
+
+def test_other_format_versions_are_rejected(tmp_path):
+    root = str(tmp_path)
+    directory = save_checkpoint(root, 'views_1', {}, {})
+    with open(os.path.join(directory, STATE_FILE), 'w') as f:
+        json.dump({'format_version': FORMAT_VERSION + 1, 'arrays': []}, f)
+    with pytest.raises(ValueError):
+        load_checkpoint(root)
+
+
+def relative_pose(scene, view_0:int, view_1:int) -> tuple:
+    transform_0 = params_to_transform(scene['camera_params'][view_0])
+    transform_1 = params_to_transform(scene['camera_params'][view_1])
+    rotation = np.matmul(transform_1[:, :3], transform_0[:, :3].T)
+    translation = transform_1[:, 3] - np.matmul(rotation, transform_0[:, 3])
+    return rotation, translation / np.linalg.norm(translation)
+
+
+def register_initial_pair(sfm, scene) -> None:
+    """
+    Register views 0 and 2 of the synthetic scene from their true relative pose and mark every edge as verified.
+    """
+    rotation, translation = relative_pose(scene, 0, 2)
+    sfm.view_graph.add_edge(0, 2, inliers=200, rotation=rotation, translation=translation, triangulation_angle=10.0)
+    sfm.register_initial_pair()
+    # Checkpoints keep the matches of verified edges only
+    for edge in sfm.view_graph.edges.values():
+        edge.setdefault('inliers', len(edge['matches'][0]))
+
+
+def test_resume_continues_from_the_saved_views(synthetic_sfm, scene, monkeypatch):
+    sfm = synthetic_sfm
+    register_initial_pair(sfm, scene)
+    sfm.register_view(1)
+    sfm.view_errors = [(0, 0.5)]
+    sfm.save_checkpoint()
+    saved = {view: transform.copy() for view, transform in sfm.cameras.items()}
+    num_tracks = sfm.tracks.num_tracks
+
+    sfm.cameras, sfm.tracks, sfm.point_cloud, sfm.view_graph = {}, None, None, None
+
+    def rebuild():
+        raise AssertionError('a resumed run must not rebuild the view graph')
+
+    monkeypatch.setattr(sfm, 'build_view_graph', rebuild)
+    result = sfm(headless=True, resume=True)
+
+    assert sorted(sfm.cameras) == [0, 1, 2, 3, 4]
+    for view, transform in saved.items():
+        np.testing.assert_array_equal(sfm.cameras[view], transform)
+    assert sfm.tracks.num_tracks >= num_tracks
+    assert sfm.view_errors[0] == (0, 0.5) and len(sfm.view_errors) == 3
+    assert result['points'] > 0
+    assert load_checkpoint(sfm.checkpoint_dir)[1]['images'] == [os.path.basename(path) for path in sfm.img_obj.image_list]
+
+
+def test_restore_rejects_a_checkpoint_of_other_settings(synthetic_sfm, scene):
+    sfm = synthetic_sfm
+    register_initial_pair(sfm, scene)
+    sfm.save_checkpoint()
+    sfm.img_obj.factor = 2.0
+    with pytest.raises(ValueError):
+        sfm.restore_checkpoint()
@@ -0,0 +1,60 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from SFM import find_datasets, main, run_batch
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Datasets', 'Herz-Jesus-P8')
+
+
+@pytest.fixture
+def datasets(tmp_path, monkeypatch):
+    """
+    A root directory with the first four images of Herz-Jesus-P8, a dataset without images and a directory without K.txt.
+    """
+    # The feature cache is created in the working directory
+    monkeypatch.chdir(tmp_path)
+    root = tmp_path / 'Datasets'
+    small = root / 'herz-small'
+    small.mkdir(parents=True)
+    for name in ['K.txt'] + ['{:04d}.jpg'.format(index) for index in range(4)]:
+        shutil.copy(os.path.join(DATASET, name), str(small / name))
+    (root / 'empty').mkdir()
+    shutil.copy(os.path.join(DATASET, 'K.txt'), str(root / 'empty' / 'K.txt'))
+    (root / 'no-intrinsics').mkdir()
+    return root
+
+
+def test_find_datasets_lists_directories_with_intrinsics(datasets):
+    assert [os.path.basename(path) for path in find_datasets(str(datasets))] == ['empty', 'herz-small']
+
+
+def test_run_batch_reports_every_dataset_in_order(datasets, tmp_path):
+    options = {'init': {'downscale_factor': 8.0, 'checkpoint_every': 0, 'lod_tile_size': 0, 'feature_workers': 1}, 'run': {'headless': True}}
+    results = run_batch([str(datasets / 'empty'), str(datasets / 'herz-small')], str(tmp_path / 'Results'), options)
+    assert [result['dataset'] for result in results] == ['empty', 'herz-small']
+    assert results[0]['status'] == 'failed' and results[0]['exit_code'] == 1 and results[0]['error']
+    assert results[1]['status'] == 'ok' and results[1]['exit_code'] == 0 and results[1]['error'] == ''
+    assert results[1]['registered_views'] == 4 and results[1]['points'] > 0
+
+    output_dir = tmp_path / 'Results' / 'herz-small' / 'Results'
+    assert (output_dir / '0000.ply').is_file()
+    with open(str(output_dir / 'timings.json')) as f:
+        stages = json.load(f)['summary']['stages']
+    assert {'sift', 'matching', 'pose_estimation', 'pnp', 'ply_export'} <= set(stages)
+
+
+def test_main_exit_code(datasets, tmp_path):
+    arguments = ['--downscale', '8', '--checkpoint-every', '0', '--lod-tile-size', '0', '--output-dir', str(tmp_path / 'Results')]
+    assert main([str(datasets / 'herz-small')] + arguments) == 0
+    # Every dataset under --datasets-root, one of which fails
+    assert main(['--datasets-root', str(datasets)] + arguments) == 1
+
+
+def test_main_rejects_bad_arguments(datasets, tmp_path):
+    with pytest.raises(SystemExit):
+        main(['--datasets-root', str(datasets / 'no-intrinsics')])
+    with pytest.raises(SystemExit):
+        main([str(datasets / 'empty'), str(datasets / 'herz-small'), '--watch'])
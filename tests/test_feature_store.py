@@ -0,0 +1,184 @@
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from feature_store import FeaturePrefetcher, FeatureStore, decode_image, pyramid_downscale
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for index in range(4):
+        path = tmp_path / 'image_{}.png'.format(index)
+        path.write_bytes(bytes([index]) * 16)
+        paths.append(str(path))
+    return paths
+
+
+def features(num_points:int, seed:int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    return rng.random((num_points, 2)), rng.random((num_points, 128))
+
+
+def entry_bytes(num_points:int) -> int:
+    return num_points * (2 + 128) * 4
+
+
+def read_index(cache_dir:str) -> dict:
+    with open(os.path.join(cache_dir, FeatureStore.INDEX_FILE)) as f:
+        return json.load(f)
+
+
+def cached_files(cache_dir:str) -> set:
+    return {name for name in os.listdir(cache_dir) if name.endswith('.npy')}
+
+
+def assert_consistent(store:FeatureStore) -> None:
+    # The index on disk and the .npy files describe the same entries
+    index = read_index(store.cache_dir)
+    assert cached_files(store.cache_dir) == {key + '_' + kind + '.npy' for key in index for kind in ('kp', 'desc')}
+    assert sum(entry['bytes'] for entry in index.values()) <= store.max_bytes
+
+
+def test_put_get_round_trip(tmp_path, images):
+    cache_dir = str(tmp_path / 'cache')
+    points, descriptors = features(50)
+    FeatureStore(cache_dir).put(images[0], 2.0, points, descriptors)
+
+    store = FeatureStore(cache_dir)
+    cached_points, cached_descriptors = store.get(images[0], 2.0)
+    np.testing.assert_array_equal(cached_points, points.astype(np.float32))
+    np.testing.assert_array_equal(cached_descriptors, descriptors.astype(np.float32))
+    assert store.get(images[0], 4.0) is None
+    assert store.get(images[1], 2.0) is None
+    assert FeatureStore(cache_dir, detector_params={'nfeatures': 10}).get(images[0], 2.0) is None
+    assert_consistent(store)
+
+
+def test_put_keeps_cached_features_memory_mapped(tmp_path, images):
+    store = FeatureStore(str(tmp_path / 'cache'))
+    points, descriptors = store.put(images[0], 2.0, *features(10))
+    assert isinstance(points, np.memmap) and isinstance(descriptors, np.memmap)
+    assert all(isinstance(array, np.memmap) for array in store.get(images[0], 2.0))
+
+    # Without a cache directory, or when the entry alone exceeds the cap, the arrays stay in memory
+    assert not isinstance(FeatureStore(None).put(images[0], 2.0, *features(10))[1], np.memmap)
+    small = FeatureStore(str(tmp_path / 'small'), max_bytes=entry_bytes(5))
+    np.testing.assert_array_equal(small.put(images[0], 2.0, *features(10))[0], features(10)[0].astype(np.float32))
+    assert small.get(images[0], 2.0) is None
+
+
+def test_prefetcher_stores_every_image(tmp_path):
+    rng = np.random.default_rng(5)
+    image_list = []
+    for index in range(3):
+        path = str(tmp_path / 'image_{}.png'.format(index))
+        cv2.imwrite(path, cv2.GaussianBlur(rng.integers(0, 256, (120, 160), dtype=np.uint8), (0, 0), 2))
+        image_list.append(path)
+    store = FeatureStore(str(tmp_path / 'cache'))
+    timed = []
+    with FeaturePrefetcher(store, image_list, 2.0, workers=2, queue_size=1, on_timings=lambda index, timings: timed.append(index)) as prefetcher:
+        for index in range(len(image_list)):
+            points, descriptors = prefetcher.get(index)
+            assert isinstance(descriptors, np.memmap)
+            assert len(points) == len(descriptors)
+    assert timed == [0, 1, 2]
+    assert len(read_index(store.cache_dir)) == 3
+
+
+def test_modified_image_misses(tmp_path, images):
+    store = FeatureStore(str(tmp_path / 'cache'))
+    store.put(images[0], 2.0, *features(10))
+    with open(images[0], 'ab') as f:
+        f.write(b'changed')
+    assert FeatureStore(store.cache_dir).get(images[0], 2.0) is None
+
+
+def test_eviction_drops_least_recently_used(tmp_path, images):
+    store = FeatureStore(str(tmp_path / 'cache'), max_bytes=2 * entry_bytes(100))
+    store.put(images[0], 2.0, *features(100))
+    store.put(images[1], 2.0, *features(100))
+    time.sleep(0.01)
+    # Reading image 0 from another process makes image 1 the least recently used
+    assert FeatureStore(store.cache_dir, store.max_bytes).get(images[0], 2.0) is not None
+    time.sleep(0.01)
+    store.put(images[2], 2.0, *features(100))
+
+    index = read_index(store.cache_dir)
+    assert set(index) == {store.key(images[0], 2.0), store.key(images[2], 2.0)}
+    assert FeatureStore(store.cache_dir).get(images[1], 2.0) is None
+    assert_consistent(store)
+
+
+def test_entry_larger_than_the_cap_is_not_kept(tmp_path, images):
+    store = FeatureStore(str(tmp_path / 'cache'), max_bytes=entry_bytes(10))
+    store.put(images[0], 2.0, *features(100))
+    assert read_index(store.cache_dir) == {}
+    assert_consistent(store)
+
+
+def test_stores_sharing_a_directory_merge_their_entries(tmp_path, images):
+    cache_dir = str(tmp_path / 'cache')
+    first, second = FeatureStore(cache_dir), FeatureStore(cache_dir)
+    first.put(images[0], 2.0, *features(10))
+    second.put(images[1], 2.0, *features(10))
+    first.put(images[2], 2.0, *features(10))
+    assert set(read_index(cache_dir)) == {first.key(path, 2.0) for path in images[:3]}
+    assert_consistent(first)
+
+
+def test_missing_file_drops_the_entry(tmp_path, images):
+    store = FeatureStore(str(tmp_path / 'cache'))
+    store.put(images[0], 2.0, *features(10))
+    store.put(images[1], 2.0, *features(10))
+    key = store.key(images[0], 2.0)
+    os.remove(os.path.join(store.cache_dir, key + '_desc.npy'))
+
+    other = FeatureStore(store.cache_dir)
+    assert other.get(images[0], 2.0) is None
+    assert set(read_index(store.cache_dir)) == {store.key(images[1], 2.0)}
+    assert_consistent(other)
+
+
+def test_clear_removes_every_entry(tmp_path, images):
+    store = FeatureStore(str(tmp_path / 'cache'))
+    for path in images:
+        store.put(path, 2.0, *features(10))
+    store.clear()
+    assert read_index(store.cache_dir) == {}
+    assert cached_files(store.cache_dir) == set()
+    assert store.get(images[0], 2.0) is None
+
+
+def test_release_keeps_keypoints_of_memory_only_entries(images):
+    store = FeatureStore(None)
+    points, descriptors = features(10)
+    store.put(images[0], 2.0, points, descriptors)
+    store.release(images[0], 2.0)
+    cached_points, cached_descriptors = store.get(images[0], 2.0)
+    np.testing.assert_array_equal(cached_points, points.astype(np.float32))
+    assert cached_descriptors is None
+
+
+def test_release_reloads_disk_entries(tmp_path, images):
+    store = FeatureStore(str(tmp_path / 'cache'))
+    points, descriptors = features(10)
+    store.put(images[0], 2.0, points, descriptors)
+    store.release(images[0], 2.0)
+    np.testing.assert_array_equal(store.get(images[0], 2.0)[1], descriptors.astype(np.float32))
+
+
+@pytest.mark.parametrize('extension', ['.jpg', '.png'])
+@pytest.mark.parametrize('downscale_factor', [1.0, 2.0, 4.0, 8.0, 16.0])
+def test_decode_image_matches_the_pyramid_size(tmp_path, extension, downscale_factor):
+    # Odd sizes, where JPEG DCT scaling and cv2.pyrDown could round differently
+    image = np.random.default_rng(6).integers(0, 256, (753, 1001, 3), dtype=np.uint8)
+    path = str(tmp_path / ('odd' + extension))
+    cv2.imwrite(path, image)
+    expected = pyramid_downscale(cv2.imread(path), downscale_factor)
+    assert decode_image(path, downscale_factor).shape == expected.shape
+    assert decode_image(path, downscale_factor, grayscale=True).shape == expected.shape[:2]
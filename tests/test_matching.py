@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from matching import FeatureMatcher
+
+
+def descriptor_sets(num:int = 200, seed:int = 0) -> tuple:
+    """
+    Descriptors of a second image: a shuffled, slightly noisy copy of the first plus unrelated distractors.
+    """
+    rng = np.random.default_rng(seed)
+    descriptors_0 = rng.random((num, 128)).astype(np.float32)
+    order = rng.permutation(num)
+    copies = descriptors_0[order] + rng.normal(0, 0.01, (num, 128)).astype(np.float32)
+    descriptors_1 = np.vstack((copies, rng.random((50, 128)).astype(np.float32)))
+    # descriptors_1[position] is a copy of descriptors_0[order[position]]
+    truth = np.empty(num, dtype=np.int64)
+    truth[order] = np.arange(num)
+    return descriptors_0, descriptors_1, truth
+
+
+@pytest.mark.parametrize('backend', FeatureMatcher.BACKENDS)
+def test_backends_find_the_true_matches(backend):
+    descriptors_0, descriptors_1, truth = descriptor_sets()
+    matches_0, matches_1 = FeatureMatcher(backend).match(descriptors_0, descriptors_1)
+    assert len(matches_0) >= 190
+    np.testing.assert_array_equal(matches_1, truth[matches_0])
+    assert matches_0.dtype == matches_1.dtype == np.int64
+
+
+def test_ratio_test_drops_ambiguous_matches():
+    descriptors_0, descriptors_1, _ = descriptor_sets()
+    # A second copy of the first 20 descriptors of the first image makes them ambiguous
+    noise = np.random.default_rng(2).normal(0, 0.01, (20, 128)).astype(np.float32)
+    descriptors_1 = np.vstack((descriptors_1, descriptors_0[:20] + noise))
+    matches_0, _ = FeatureMatcher('bf').match(descriptors_0, descriptors_1)
+    assert not np.isin(np.arange(20), matches_0).any()
+    assert np.isin(np.arange(20, 200), matches_0).mean() > 0.95
+
+
+def test_crosscheck_keeps_only_mutual_nearest_neighbours():
+    rng = np.random.default_rng(1)
+    train = rng.random((30, 128)).astype(np.float32)
+    # Both queries are closest to train descriptor 0, only the nearer one is its nearest neighbour back
+    query = np.vstack((train[0] + 0.001, train[0] + 0.002)).astype(np.float32)
+    bf_matches, _ = FeatureMatcher('bf', ratio=0.9).match(query, train)
+    crosscheck_matches, crosscheck_train = FeatureMatcher('crosscheck', ratio=0.9).match(query, train)
+    np.testing.assert_array_equal(bf_matches, [0, 1])
+    np.testing.assert_array_equal(crosscheck_matches, [0])
+    np.testing.assert_array_equal(crosscheck_train, [0])
+
+
+def test_match_handles_too_few_descriptors():
+    matches_0, matches_1 = FeatureMatcher().match(np.ones((1, 128)), np.ones((10, 128)))
+    assert len(matches_0) == len(matches_1) == 0
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        FeatureMatcher('annoy')
@@ -0,0 +1,79 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from octree import INDEX_FILE, load_octree_index, load_tile, select_tiles, write_octree
+
+
+def clustered_cloud(num_points:int = 5000, seed:int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-10, 10, (8, 3))
+    points = centers[rng.integers(0, 8, num_points)] + rng.normal(0, 0.5, (num_points, 3))
+    colors = rng.integers(0, 256, (num_points, 3))
+    return points.astype(np.float32), colors.astype(np.uint8)
+
+
+def test_tiles_partition_the_cloud(tmp_path):
+    points, colors = clustered_cloud()
+    directory = str(tmp_path / 'octree')
+    index = write_octree(directory, points, colors, max_points_per_tile=300)
+    assert index == load_octree_index(directory)
+    assert index['num_points'] == len(points)
+    assert not os.path.exists(directory + '.partial')
+
+    nodes = index['nodes']
+    tiles = [load_tile(directory, index, name) for name in sorted(nodes)]
+    tile_points = np.vstack([tile_points for tile_points, _ in tiles])
+    tile_colors = np.vstack([tile_colors for _, tile_colors in tiles])
+    # Every point is stored exactly once, with its own color
+    assert len(tile_points) == len(points)
+    order = np.lexsort(tile_points.T)
+    expected = np.lexsort(points.T)
+    np.testing.assert_array_equal(tile_points[order], points[expected])
+    np.testing.assert_array_equal(tile_colors[order], colors[expected])
+
+    for name, node in nodes.items():
+        node_points, _ = load_tile(directory, index, name)
+        assert len(node_points) == node['num_points'] <= 300
+        low, high = np.array(node['bounds'])
+        assert ((node_points >= low - 1e-4) & (node_points <= high + 1e-4)).all()
+        assert node['level'] == len(name) - 1
+        for child in node['children']:
+            assert child[:-1] == name
+            child_low, child_high = np.array(nodes[child]['bounds'])
+            assert (child_low >= low - 1e-9).all() and (child_high <= high + 1e-9).all()
+        # Only full tiles have children
+        assert not node['children'] or node['num_points'] == 300
+
+
+def test_max_depth_keeps_the_rest_in_the_leaves(tmp_path):
+    points, colors = clustered_cloud(2000)
+    index = write_octree(str(tmp_path / 'octree'), points, colors, max_points_per_tile=100, max_depth=1)
+    assert max(node['level'] for node in index['nodes'].values()) == 1
+    assert sum(node['num_points'] for node in index['nodes'].values()) == len(points)
+
+
+def test_select_tiles_is_a_rooted_subtree_within_budget(tmp_path):
+    points, colors = clustered_cloud()
+    index = write_octree(str(tmp_path / 'octree'), points, colors, max_points_per_tile=300)
+    for camera_position in ([0.0, 0.0, -30.0], [10.0, 10.0, 10.0], points[0]):
+        selected = select_tiles(index, camera_position, point_budget=2000)
+        assert selected[0] == 'r'
+        assert sum(index['nodes'][name]['num_points'] for name in selected) <= 2000
+        chosen = set(selected)
+        assert all(name[:-1] in chosen for name in selected[1:])
+    assert select_tiles(index, [0.0, 0.0, 0.0], point_budget=1) == ['r']
+    assert len(select_tiles(index, [0.0, 0.0, 0.0], point_budget=len(points))) == len(index['nodes'])
+
+
+def test_load_rejects_other_format_versions(tmp_path):
+    points, colors = clustered_cloud(100)
+    directory = str(tmp_path / 'octree')
+    index = write_octree(directory, points, colors)
+    index['format_version'] = -1
+    with open(os.path.join(directory, INDEX_FILE), 'w') as f:
+        json.dump(index, f)
+    with pytest.raises(ValueError):
+        load_octree_index(directory)
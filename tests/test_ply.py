@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from ply import PlyStreamWriter, read_ply, write_ply
+
+
+def random_cloud(num_points:int, seed:int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 100, (num_points, 3)).astype(np.float32), rng.integers(0, 256, (num_points, 3)).astype(np.uint8)
+
+
+@pytest.mark.parametrize('binary', [True, False])
+def test_write_read_round_trip(tmp_path, binary):
+    points, colors = random_cloud(1000)
+    filename = str(tmp_path / 'cloud.ply')
+    write_ply(filename, points, colors, binary=binary, chunk_size=300)
+    read_points, read_colors = read_ply(filename)
+    if binary:
+        np.testing.assert_array_equal(read_points, points)
+    else:
+        # ascii stores six decimals
+        np.testing.assert_allclose(read_points, points, atol=1e-5)
+    np.testing.assert_array_equal(read_colors, colors)
+
+
+@pytest.mark.parametrize('binary', [True, False])
+def test_write_read_empty_and_single_point(tmp_path, binary):
+    for points, colors in (random_cloud(0), random_cloud(1)):
+        filename = str(tmp_path / 'cloud.ply')
+        write_ply(filename, points, colors, binary=binary)
+        read_points, read_colors = read_ply(filename)
+        assert read_points.shape == points.shape and read_colors.shape == colors.shape
+        np.testing.assert_allclose(read_points, points, atol=1e-5)
+
+
+def test_write_clips_colors(tmp_path):
+    filename = str(tmp_path / 'cloud.ply')
+    write_ply(filename, np.zeros((2, 3)), [[-5, 128, 300], [0, 0, 0]])
+    _, colors = read_ply(filename)
+    np.testing.assert_array_equal(colors, [[0, 128, 255], [0, 0, 0]])
+
+
+@pytest.mark.parametrize('binary', [True, False])
+def test_stream_writer_is_valid_between_appends(tmp_path, binary):
+    filename = str(tmp_path / 'preview.ply')
+    points, colors = random_cloud(500)
+    with PlyStreamWriter(filename, binary=binary) as writer:
+        assert len(read_ply(filename)[0]) == 0
+        for start in range(0, 500, 200):
+            writer.append(points[start:start + 200], colors[start:start + 200])
+            read_points, read_colors = read_ply(filename)
+            assert len(read_points) == writer.num_vertices == min(start + 200, 500)
+    read_points, read_colors = read_ply(filename)
+    np.testing.assert_allclose(read_points, points, atol=1e-5)
+    np.testing.assert_array_equal(read_colors, colors)
+
+
+def test_read_rejects_truncated_header(tmp_path):
+    filename = tmp_path / 'broken.ply'
+    filename.write_bytes(b'ply\nformat ascii 1.0\nelement vertex 3\n')
+    with pytest.raises(ValueError):
+        read_ply(str(filename))
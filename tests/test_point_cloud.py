@@ -0,0 +1,104 @@
+import numpy as np
+
+from point_cloud import PointCloud, filter_point_cloud, merge_duplicates, point_spacing, radius_outlier_mask, statistical_outlier_mask, voxel_downsample
+from tracks import FeatureTracks
+
+
+def grid_cloud(step:float = 0.1, size:int = 10) -> np.ndarray:
+    axis = np.arange(size) * step
+    return np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1).reshape(-1, 3)
+
+
+def test_append_grows_past_capacity():
+    cloud = PointCloud(capacity=2)
+    for batch in range(5):
+        cloud.append(np.full((3, 3), batch), np.full((3, 3), 300), track_ids=np.arange(3) + 3 * batch)
+    assert len(cloud) == 15
+    np.testing.assert_array_equal(cloud.points[::3, 0], np.arange(5))
+    np.testing.assert_array_equal(cloud.colors, 255)
+    np.testing.assert_array_equal(cloud.track_ids, np.arange(15))
+    assert np.isnan(cloud.errors).all()
+
+
+def test_to_arrays_round_trip():
+    rng = np.random.default_rng(0)
+    cloud = PointCloud()
+    cloud.append(rng.normal(size=(50, 3)), rng.integers(0, 256, (50, 3)), np.arange(50) - 10, rng.random(50))
+    restored = PointCloud.from_arrays(cloud.to_arrays())
+    for name, array in cloud.to_arrays().items():
+        np.testing.assert_array_equal(restored.to_arrays()[name], array)
+    restored.append(np.zeros((1, 3)), np.zeros((1, 3)))
+    assert len(cloud) == 50 and len(restored) == 51
+
+
+def test_update_from_tracks_moves_tracked_points_only():
+    tracks = FeatureTracks()
+    tracks.add_image(0, 2)
+    tracks.add_image(1, 2)
+    tracks.add_matches(0, 1, [0, 1], [0, 1])
+    tracks.set_points([0, 1], [[1.0, 1.0, 1.0], [2.0, 2.0, 2.0]])
+    cloud = PointCloud()
+    cloud.append(np.zeros((3, 3)), np.zeros((3, 3)), [1, -1, 0])
+    cloud.update_from_tracks(tracks)
+    np.testing.assert_array_equal(cloud.points, [[2, 2, 2], [0, 0, 0], [1, 1, 1]])
+
+
+def test_voxel_downsample_averages_every_voxel():
+    points = np.array([[0.1, 0.1, 0.1], [0.3, 0.3, 0.3], [1.5, 0.2, 0.2], [1.7, 0.2, 0.2]])
+    colors = np.array([[0, 0, 0], [100, 100, 100], [10, 20, 30], [30, 40, 50]])
+    centroids, mean_colors = voxel_downsample(points, colors, 1.0, chunk_size=3)
+    order = np.argsort(centroids[:, 0])
+    np.testing.assert_allclose(centroids[order], [[0.2, 0.2, 0.2], [1.6, 0.2, 0.2]])
+    np.testing.assert_array_equal(mean_colors[order], [[50, 50, 50], [20, 30, 40]])
+    assert mean_colors.dtype == np.uint8
+
+
+def test_voxel_downsample_keeps_points_in_distinct_voxels():
+    points = grid_cloud(0.1)
+    centroids, _ = voxel_downsample(points, np.zeros_like(points), 0.05)
+    assert len(centroids) == len(points)
+    empty_points, empty_colors = voxel_downsample(np.empty((0, 3)), np.empty((0, 3)), 0.1)
+    assert empty_points.shape == (0, 3) and empty_colors.shape == (0, 3)
+
+
+def test_outlier_masks_drop_isolated_points():
+    points = np.vstack((grid_cloud(0.1), [[5.0, 5.0, 5.0], [-4.0, 0.0, 0.0]]))
+    statistical = statistical_outlier_mask(points, num_neighbors=8, std_ratio=2.0, chunk_size=64)
+    radius = radius_outlier_mask(points, 0.15, min_neighbors=2, chunk_size=64)
+    for keep in (statistical, radius):
+        assert keep[:-2].all()
+        assert not keep[-2:].any()
+
+
+def test_point_spacing_ignores_exact_duplicates():
+    points = np.vstack([grid_cloud(0.1)] * 3)
+    assert np.isclose(point_spacing(points), 0.1)
+    assert point_spacing(np.ones((100, 3))) == 0.0
+
+
+def test_merge_duplicates_averages_colors():
+    points = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, 0.0]])
+    colors = np.array([[0, 0, 0], [7, 7, 7], [100, 50, 20]])
+    unique, mean_colors = merge_duplicates(points, colors)
+    np.testing.assert_array_equal(unique, [[0, 0, 0], [1, 0, 0]])
+    np.testing.assert_array_equal(mean_colors, [[50, 25, 10], [7, 7, 7]])
+
+
+def test_filter_point_cloud_collapses_duplicates():
+    points, colors = filter_point_cloud(np.ones((100, 3)), np.zeros((100, 3)))
+    assert len(points) == 1
+
+
+def test_filter_point_cloud_removes_noise_and_non_finite_points():
+    cloud = grid_cloud(0.1)
+    points = np.vstack((cloud, [[50.0, 50.0, 50.0], [np.nan, 0.0, 0.0], [np.inf, 1.0, 1.0]]))
+    filtered, colors = filter_point_cloud(points, np.full((len(points), 3), 9), voxel_size=0)
+    assert len(filtered) == len(cloud)
+    assert np.isfinite(filtered).all()
+    assert colors.dtype == np.uint8
+
+
+def test_filter_point_cloud_disabled_keeps_every_finite_point():
+    points = np.vstack((np.ones((4, 3)), [[50.0, 50.0, 50.0]]))
+    filtered, _ = filter_point_cloud(points, np.zeros((5, 3)), voxel_size=0, num_neighbors=0, radius=0)
+    assert len(filtered) == 5
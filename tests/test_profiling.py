@@ -0,0 +1,54 @@
+import csv
+import json
+import tracemalloc
+
+import numpy as np
+
+from profiling import PipelineProfiler, peak_rss_mb
+
+
+def test_nested_stages_keep_the_heap_peak_of_inner_stages():
+    profiler = PipelineProfiler(trace_memory=True)
+    try:
+        with profiler.stage('outer'):
+            with profiler.stage('inner'):
+                block = np.ones(4 * 1024 * 1024 // 8)
+                del block
+            with profiler.stage('small'):
+                pass
+    finally:
+        tracemalloc.stop()
+    peaks = {record['stage']: record['peak_traced_mb'] for record in profiler.records}
+    assert [record['stage'] for record in profiler.records] == ['inner', 'small', 'outer']
+    assert peaks['inner'] >= 4.0
+    assert peaks['small'] < 1.0
+    assert peaks['outer'] >= peaks['inner']
+
+
+def test_records_report_the_rss_high_water_mark_and_its_growth(tmp_path):
+    profiler = PipelineProfiler()
+    with profiler.stage('decode', view=3):
+        pass
+    profiler.record('sift', 0.5, view=np.int64(3))
+    stage, recorded = profiler.records
+    assert stage['view'] == 3 and stage['rss_growth_mb'] >= 0.0
+    assert 0.0 < stage['rss_high_water_mb'] <= recorded['rss_high_water_mb'] <= peak_rss_mb()
+    assert recorded['rss_growth_mb'] is None and recorded['seconds'] == 0.5
+
+    profiler.to_json(str(tmp_path / 'timings.json'))
+    profiler.to_csv(str(tmp_path / 'timings.csv'))
+    with open(str(tmp_path / 'timings.json')) as f:
+        summary = json.load(f)['summary']
+    assert summary['stages']['sift'] == {'calls': 1, 'seconds': 0.5, 'max_seconds': 0.5, 'mean_seconds': 0.5}
+    with open(str(tmp_path / 'timings.csv'), newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['stage'] for row in rows] == ['decode', 'sift']
+    assert set(rows[0]) == set(PipelineProfiler.FIELDS)
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = PipelineProfiler(enabled=False)
+    with profiler.stage('decode'):
+        pass
+    profiler.record('sift', 1.0)
+    assert profiler.records == []
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from retrieval import ImageRetrieval, VocabularyTree, build_view_graph
+
+
+def two_scenes(num_images:int = 6, seed:int = 0) -> list:
+    """
+    Descriptors of images alternating between two scenes, each image sees a random subset of its scene's features.
+    """
+    rng = np.random.default_rng(seed)
+    scenes = [rng.random((300, 32)).astype(np.float32) for _ in range(2)]
+    descriptors = []
+    for image in range(num_images):
+        features = scenes[image % 2][rng.choice(300, 200, replace=False)]
+        descriptors.append(features + rng.normal(0, 0.01, features.shape).astype(np.float32))
+    return descriptors
+
+
+def test_quantize_finds_the_nearest_word_of_a_single_level():
+    rng = np.random.default_rng(1)
+    data = rng.random((500, 16)).astype(np.float32)
+    tree = VocabularyTree(branching=8, depth=1).fit([data[:250], data[250:]])
+    words = tree.quantize(data, chunk_size=64)
+    distances = np.linalg.norm(data[:, np.newaxis] - tree.centers[0][np.newaxis], axis=2)
+    np.testing.assert_array_equal(words, np.argmin(distances, axis=1))
+
+
+def test_quantize_is_deterministic_and_within_the_vocabulary():
+    descriptors = two_scenes()
+    words = [VocabularyTree(branching=4, depth=3, seed=3).fit(descriptors).quantize(descriptors[0]) for _ in range(2)]
+    np.testing.assert_array_equal(words[0], words[1])
+    assert words[0].min() >= 0 and words[0].max() < 4 ** 3
+
+
+def test_quantize_requires_a_trained_tree():
+    with pytest.raises(ValueError):
+        VocabularyTree().quantize(np.zeros((1, 128)))
+
+
+def test_retrieval_ranks_images_of_the_same_scene_first():
+    descriptors = two_scenes()
+    retrieval = ImageRetrieval(VocabularyTree(branching=4, depth=3).fit(descriptors))
+    retrieval.build(descriptors)
+    scores = retrieval.similarities()
+    np.testing.assert_allclose(scores, scores.T)
+    assert (np.diag(scores) == 0).all()
+    for image, row in enumerate(scores):
+        same = [other for other in range(len(row)) if other != image and other % 2 == image % 2]
+        different = [other for other in range(len(row)) if other % 2 != image % 2]
+        assert row[same].min() > row[different].max()
+
+    pairs = retrieval.top_k_pairs(2)
+    assert all(i < j and (j - i) % 2 == 0 for i, j, _ in pairs)
+    assert len(pairs) == len({(i, j) for i, j, _ in pairs}) == 6
+
+
+def test_build_view_graph_links_similar_images():
+    graph = build_view_graph(two_scenes(), num_neighbors=2, branching=4, depth=3)
+    assert sorted(graph.edges) == [(0, 2), (0, 4), (1, 3), (1, 5), (2, 4), (3, 5)]
+    assert all(edge['score'] > 0 for edge in graph.edges.values())
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from bundle_adjustment import LocalBundleAdjustmentScheduler, params_to_transform
+from tracks import FeatureTracks
+
+
+def pose_errors(transform, expected) -> tuple:
+    """
+    Rotation error in degrees and camera center distance of a [R|t] matrix.
+    """
+    rotation = np.matmul(transform[:, :3], expected[:, :3].T)
+    angle = np.degrees(np.arccos(np.clip((np.trace(rotation) - 1) / 2, -1.0, 1.0)))
+    center = -np.matmul(transform[:, :3].T, transform[:, 3])
+    expected_center = -np.matmul(expected[:, :3].T, expected[:, 3])
+    return angle, np.linalg.norm(center - expected_center)
+
+
+@pytest.fixture
+def reconstruction(synthetic_sfm, scene):
+    """
+    The synthetic StructurefromMotion with views 0 to 3 registered at their true poses and view 4 left to register.
+    """
+    sfm = synthetic_sfm
+    num_points = len(scene['points'])
+    sfm.initial_pair = (0, 1)
+    sfm.cameras = {view: params_to_transform(scene['camera_params'][view]) for view in range(4)}
+    sfm.tracks = FeatureTracks()
+    for view in range(5):
+        sfm.tracks.add_image(view, num_points)
+    for view in range(1, 4):
+        sfm.tracks.add_matches(0, view, np.arange(200), np.arange(200))
+    track_ids, points_3d, errors = sfm.triangulate_new_tracks(np.arange(sfm.tracks.num_tracks))
+    sfm.tracks.set_points(track_ids, points_3d)
+    sfm.point_cloud.append(points_3d, np.zeros_like(points_3d), track_ids, errors)
+    return sfm
+
+
+@pytest.mark.parametrize('mode', [None, 'view', 'local', 'global'])
+def test_register_view_with_bundle_adjustment(reconstruction, scene, mode):
+    sfm = reconstruction
+    fixed = {view: sfm.cameras[view].copy() for view in (0, 1, 2)}
+    error, image = sfm.register_view(4, mode, LocalBundleAdjustmentScheduler(2, every=1))
+    if mode == 'global':
+        before, after = sfm.global_bundle_adjustment()
+        assert after <= before
+        sfm.point_cloud.update_from_tracks(sfm.tracks)
+
+    adjusted = any(record['stage'] == 'bundle_adjustment' for record in sfm.profiler.records)
+    assert adjusted == (mode in ('view', 'local'))
+    assert image.shape == (480, 640, 3)
+    assert error < 1.0
+    assert sfm.mean_reprojection_error() < 0.8
+    assert len(sfm.point_cloud) == 300
+    np.testing.assert_allclose(sfm.point_cloud.points, sfm.tracks.points[sfm.point_cloud.track_ids])
+    np.testing.assert_allclose(sfm.cameras[0], fixed[0], atol=1e-12)
+    if mode != 'global':
+        # Only the window (the new view, or the last two views) is refined
+        for view in (1, 2):
+            np.testing.assert_array_equal(sfm.cameras[view], fixed[view])
+    # Global adjustment only holds the first camera fixed, which leaves the narrow arc of views some slack
+    max_angle = 0.5 if mode == 'global' else 0.1
+    angle, distance = pose_errors(sfm.cameras[4], params_to_transform(scene['camera_params'][4]))
+    assert angle < max_angle and distance < 0.05
+
+
+def test_bundle_adjustment_does_not_increase_the_error(reconstruction):
+    sfm = reconstruction
+    sfm.register_view(4)
+    baseline = sfm.mean_reprojection_error()
+    before, after = sfm.local_bundle_adjustment([3, 4])
+    assert after <= before
+    assert sfm.mean_reprojection_error() <= baseline + 1e-9
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from bundle_adjustment import params_to_transform
+from ply import PlyStreamWriter, read_ply
+
+
+def relative_pose(scene, view_0:int, view_1:int) -> tuple:
+    transform_0 = params_to_transform(scene['camera_params'][view_0])
+    transform_1 = params_to_transform(scene['camera_params'][view_1])
+    rotation = np.matmul(transform_1[:, :3], transform_0[:, :3].T)
+    translation = transform_1[:, 3] - np.matmul(rotation, transform_0[:, 3])
+    return rotation, translation / np.linalg.norm(translation)
+
+
+def test_initial_pair_points_reach_the_point_cloud(synthetic_sfm, scene, tmp_path):
+    sfm = synthetic_sfm
+    rotation, translation = relative_pose(scene, 0, 2)
+    sfm.view_graph.add_edge(0, 2, inliers=200, rotation=rotation, translation=translation, triangulation_angle=10.0)
+    with PlyStreamWriter(str(tmp_path / 'preview.ply')) as ply_stream:
+        sfm.register_initial_pair(ply_stream)
+
+    assert sfm.initial_pair == (0, 2)
+    triangulated = np.flatnonzero(sfm.tracks.is_triangulated(np.arange(sfm.tracks.num_tracks)))
+    assert len(triangulated) == 200
+    assert len(sfm.point_cloud) == len(triangulated)
+    np.testing.assert_array_equal(np.sort(sfm.point_cloud.track_ids), triangulated)
+    np.testing.assert_array_equal(sfm.point_cloud.points, sfm.tracks.points[sfm.point_cloud.track_ids])
+    # The blank image of view 2 is filled with 80
+    np.testing.assert_array_equal(sfm.point_cloud.colors, 80)
+    assert (sfm.point_cloud.errors < 2.0).all()
+    assert len(read_ply(str(tmp_path / 'preview.ply'))[0]) == len(triangulated)
+
+
+def test_run_closes_the_prefetcher_and_preview_on_errors(synthetic_sfm, monkeypatch):
+    sfm = synthetic_sfm
+    sfm.feature_workers = 2
+
+    def fail():
+        raise RuntimeError('view graph failed')
+
+    monkeypatch.setattr(sfm, 'build_view_graph', fail)
+    with pytest.raises(RuntimeError):
+        sfm(stream_ply=True, headless=True)
+    assert sfm.prefetcher is None
@@ -0,0 +1,96 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from bundle_adjustment import params_to_transform
+from ply import read_ply
+from streaming import watch_directory
+
+
+@pytest.fixture
+def matchable_sfm(synthetic_sfm, scene):
+    """
+    The synthetic StructurefromMotion with descriptors shared by all observations of a point, so pairs match for real.
+    """
+    sfm = synthetic_sfm
+    rng = np.random.default_rng(7)
+    num_points = len(scene['points'])
+    descriptors = rng.random((num_points, 128))
+    for view, image_path in enumerate(sfm.img_obj.image_list):
+        keypoints = scene['points_2d'][scene['camera_indices'] == view] + rng.normal(0, 0.3, (num_points, 2))
+        sfm.feature_store.put(image_path, sfm.img_obj.factor, keypoints, descriptors + rng.normal(0, 0.01, descriptors.shape))
+    return sfm
+
+
+def relative_rotation_error(transform_0, transform_1, expected_0, expected_1) -> float:
+    rotation = np.matmul(transform_1[:, :3], transform_0[:, :3].T)
+    expected = np.matmul(expected_1[:, :3], expected_0[:, :3].T)
+    cosine = (np.trace(np.matmul(rotation, expected.T)) - 1) / 2
+    return np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+
+
+def test_images_pushed_one_at_a_time_are_registered(matchable_sfm, scene):
+    sfm = matchable_sfm
+    image_paths = list(sfm.img_obj.image_list)
+    with pytest.raises(RuntimeError):
+        sfm.add_image(image_paths[0])
+
+    # Local adjustment keeps the narrow arc of views from drifting
+    sfm.start_stream(bundle_adjustment_enabled=True)
+    assert sfm.add_image(image_paths[0]) == []
+    registered = [sfm.add_image(path) for path in image_paths[1:]]
+    assert sorted(registered[0]) == [0, 1]
+    assert registered[1:] == [[2], [3], [4]]
+    assert sfm.add_image(image_paths[2]) == []
+
+    snapshot = sfm.snapshot()
+    assert sorted(snapshot['poses']) == sorted(image_paths)
+    assert len(snapshot['points']) == len(sfm.point_cloud) >= 250
+    expected = [params_to_transform(params) for params in scene['camera_params']]
+    poses = [snapshot['poses'][path] for path in image_paths]
+    assert relative_rotation_error(poses[0], poses[4], expected[0], expected[4]) < 1.0
+    # The snapshot is a copy
+    snapshot['points'][:] = 0
+    assert np.abs(sfm.point_cloud.points).sum() > 0
+
+    summary = sfm.finish_stream()
+    assert summary['registered_views'] == 5 and summary['points'] > 0
+    assert sfm._stream is None
+
+
+def test_stream_consumes_a_generator_and_writes_the_preview(matchable_sfm):
+    sfm = matchable_sfm
+    image_paths = list(sfm.img_obj.image_list)
+    summary = sfm.stream((path for path in image_paths), stream_ply=True, flush_every=2)
+    assert summary['registered_views'] == 5
+    preview = os.path.join(sfm.results_dir(False), sfm.img_obj.name + '_preview.ply')
+    assert len(read_ply(preview)[0]) == len(sfm.point_cloud)
+
+
+def write(path, size:int = 16) -> None:
+    with open(path, 'wb') as f:
+        f.write(b'\xff' * size)
+
+
+def test_watch_directory_yields_complete_images_in_order(tmp_path):
+    directory = str(tmp_path)
+    write(os.path.join(directory, 'b.JPG'))
+    write(os.path.join(directory, 'a.png'))
+    write(os.path.join(directory, 'notes.txt'))
+    write(os.path.join(directory, 'c.jpg'), 0)
+    watch = watch_directory(directory, poll_interval=0.01)
+    assert [os.path.basename(next(watch)) for _ in range(2)] == ['a.png', 'b.JPG']
+
+    # The empty c.jpg is still being written, the stop file waits for it
+    write(os.path.join(directory, 'STOP'))
+    timer = threading.Timer(0.1, write, (os.path.join(directory, 'c.jpg'),))
+    timer.start()
+    assert [os.path.basename(path) for path in watch] == ['c.jpg']
+    timer.join()
+
+
+def test_watch_directory_stops_when_idle(tmp_path):
+    write(str(tmp_path / 'a.jpg'))
+    assert [os.path.basename(path) for path in watch_directory(str(tmp_path), poll_interval=0.01, idle_timeout=0.05, stop_file=None)] == ['a.jpg']
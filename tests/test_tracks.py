@@ -0,0 +1,52 @@
+import numpy as np
+
+from tracks import FeatureTracks
+
+
+def make_tracks():
+    tracks = FeatureTracks()
+    for image_id, num_keypoints in ((0, 10), (1, 12), (2, 8)):
+        tracks.add_image(image_id, num_keypoints)
+    tracks.add_matches(0, 1, [0, 1, 2, 3], [5, 6, 7, 8])
+    tracks.add_matches(1, 2, [5, 6, 9], [0, 1, 2])
+    tracks.set_points([0, 1], [[0.0, 0.0, 5.0], [1.0, 2.0, 6.0]])
+    return tracks
+
+
+def test_add_matches_links_tracks_across_views():
+    tracks = make_tracks()
+    assert tracks.num_tracks == 5
+    np.testing.assert_array_equal(tracks.track_of[2][:3], [0, 1, 4])
+    keypoints, track_ids = tracks.observed_tracks(2, triangulated=True)
+    np.testing.assert_array_equal(np.sort(track_ids), [0, 1])
+
+
+def test_add_matches_drops_conflicting_matches():
+    tracks = make_tracks()
+    # Keypoint 0 of image 0 is in track 0, keypoint 1 of image 2 in track 1, joining them is refused
+    result = tracks.add_matches(0, 2, [0], [1])
+    np.testing.assert_array_equal(result, [-1])
+    assert tracks.num_tracks == 5
+
+
+def test_to_arrays_round_trip():
+    tracks = make_tracks()
+    restored = FeatureTracks.from_arrays(tracks.to_arrays())
+    assert restored.num_tracks == tracks.num_tracks
+    np.testing.assert_array_equal(restored.points, tracks.points)
+    np.testing.assert_array_equal(restored.obs_track, tracks.obs_track)
+    np.testing.assert_array_equal(restored.obs_image, tracks.obs_image)
+    np.testing.assert_array_equal(restored.obs_keypoint, tracks.obs_keypoint)
+    for image_id in tracks.track_of:
+        np.testing.assert_array_equal(restored.track_of[image_id], tracks.track_of[image_id])
+
+
+def test_from_arrays_copies_and_keeps_growing():
+    tracks = make_tracks()
+    arrays = tracks.to_arrays()
+    restored = FeatureTracks.from_arrays(arrays)
+    restored.set_points([2], [[3.0, 3.0, 3.0]])
+    restored.add_matches(0, 1, [4], [10])
+    assert np.isnan(tracks.points[2]).all()
+    assert restored.num_tracks == 6
+    np.testing.assert_array_equal(restored.keypoint_of([5], 1), [10])
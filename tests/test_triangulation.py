@@ -0,0 +1,50 @@
+import numpy as np
+
+from bundle_adjustment import params_to_transform
+from triangulation import triangulate_tracks
+
+
+def transforms_of(scene):
+    return np.array([params_to_transform(params) for params in scene['camera_params']])
+
+
+def test_triangulate_tracks_recovers_points(scene):
+    rng = np.random.default_rng(3)
+    points_2d = scene['points_2d'] + rng.normal(0, 0.2, scene['points_2d'].shape)
+    points, valid, errors = triangulate_tracks(transforms_of(scene), scene['K'], scene['camera_indices'], scene['point_indices'], points_2d,
+                                               len(scene['points']), min_angle=1.0, max_error=4.0)
+    assert valid.all()
+    np.testing.assert_allclose(points, scene['points'], atol=0.05)
+    assert errors.max() < 1.0
+
+
+def test_triangulate_tracks_rejects_bad_points(scene):
+    num_points = len(scene['points'])
+    camera_indices, point_indices, points_2d = scene['camera_indices'], scene['point_indices'], scene['points_2d'].copy()
+    # Point 0 is seen once, point 1 has an observation far off
+    single = ~((point_indices == 0) & (camera_indices > 0))
+    camera_indices, point_indices, points_2d = camera_indices[single], point_indices[single], points_2d[single]
+    points_2d[np.flatnonzero(point_indices == 1)[0]] += 50
+
+    points, valid, _ = triangulate_tracks(transforms_of(scene), scene['K'], camera_indices, point_indices, points_2d, num_points)
+    assert not valid[0] and not valid[1]
+    assert np.isnan(points[:2]).all()
+    assert valid[2:].all()
+
+
+def test_triangulate_tracks_rejects_narrow_baseline(scene):
+    # Cameras 1 and 2 are 5 degrees apart around the cloud, too narrow for a minimum of 10 degrees
+    pair = np.isin(scene['camera_indices'], [1, 2])
+    _, valid, _ = triangulate_tracks(transforms_of(scene), scene['K'], scene['camera_indices'][pair], scene['point_indices'][pair], scene['points_2d'][pair],
+                                     len(scene['points']), min_angle=10.0)
+    assert not valid.any()
+
+
+def test_triangulate_tracks_ignores_non_finite_cameras(scene):
+    transforms = transforms_of(scene)
+    transforms[4] = np.nan
+    points_2d = scene['points_2d'].copy()
+    points_2d[0] = np.nan
+    points, valid, _ = triangulate_tracks(transforms, scene['K'], scene['camera_indices'], scene['point_indices'], points_2d, len(scene['points']))
+    assert valid.all()
+    np.testing.assert_allclose(points, scene['points'], atol=1e-6)
@@ -0,0 +1,63 @@
+import numpy as np
+
+from bundle_adjustment import params_to_transform
+from matching import FeatureMatcher
+from two_view import verify_pair, verify_view_graph
+from view_graph import ViewGraph
+
+
+def relative_pose(scene, view_0:int, view_1:int) -> tuple:
+    transform_0 = params_to_transform(scene['camera_params'][view_0])
+    transform_1 = params_to_transform(scene['camera_params'][view_1])
+    rotation = np.matmul(transform_1[:, :3], transform_0[:, :3].T)
+    translation = transform_1[:, 3] - np.matmul(rotation, transform_0[:, 3])
+    return rotation, translation / np.linalg.norm(translation)
+
+
+def view_points(scene, view:int) -> np.ndarray:
+    return scene['points_2d'][scene['camera_indices'] == view]
+
+
+def test_verify_pair_recovers_the_relative_pose(scene):
+    result = verify_pair(view_points(scene, 0), view_points(scene, 4), scene['K'])
+    rotation, translation = relative_pose(scene, 0, 4)
+    assert result['inliers'] == result['inlier_mask'].sum() >= 290
+    np.testing.assert_allclose(result['rotation'], rotation, atol=1e-3)
+    np.testing.assert_allclose(result['translation'], translation, atol=1e-2)
+    assert 5.0 < result['triangulation_angle'] < 30.0
+
+
+def test_verify_pair_rejects_too_few_matches(scene):
+    result = verify_pair(view_points(scene, 0)[:4], view_points(scene, 4)[:4], scene['K'])
+    assert result['inliers'] == 0 and result['rotation'] is None
+    assert result['inlier_mask'].shape == (4,) and not result['inlier_mask'].any()
+
+
+def test_verify_view_graph_keeps_consistent_pairs(scene):
+    rng = np.random.default_rng(3)
+    num_points = len(scene['points'])
+    descriptors = rng.random((num_points, 128)).astype(np.float32)
+    # Views 0 and 4 see the scene, view 1 only sees unrelated points with unrelated descriptors
+    keypoints = [view_points(scene, 0), rng.uniform(0, 480, (num_points, 2)), view_points(scene, 4)]
+    all_descriptors = [descriptors, rng.random((num_points, 128)).astype(np.float32), descriptors[::-1]]
+    keypoints[2] = keypoints[2][::-1]
+
+    view_graph = ViewGraph(3)
+    for pair in ((0, 1), (0, 2), (1, 2)):
+        view_graph.add_edge(*pair, score=1.0)
+    timings = []
+    verify_view_graph(view_graph, keypoints, all_descriptors, FeatureMatcher(), scene['K'], workers=2, min_inliers=30,
+                      on_pair=lambda image_0, image_1, match_seconds, pose_seconds: timings.append((image_0, image_1, match_seconds, pose_seconds)))
+
+    assert list(view_graph.edges) == [(0, 2)]
+    matches_0, matches_2 = view_graph.edges[(0, 2)]['matches']
+    assert len(matches_0) >= 290
+    np.testing.assert_array_equal(matches_2, num_points - 1 - matches_0)
+    assert sorted(timing[:2] for timing in timings) == [(0, 1), (0, 2), (1, 2)]
+    assert all(match_seconds >= 0 and pose_seconds >= 0 for _, _, match_seconds, pose_seconds in timings)
+
+
+def test_structure_from_motion_records_matching_and_pose_separately(synthetic_sfm):
+    sfm = synthetic_sfm
+    sfm.record_pair_timings(0, 3, 0.25, 0.5)
+    assert [(record['stage'], record['view'], record['seconds']) for record in sfm.profiler.records] == [('matching', 3, 0.25), ('pose_estimation', 3, 0.5)]
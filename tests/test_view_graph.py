@@ -0,0 +1,34 @@
+import numpy as np
+
+from view_graph import ViewGraph
+
+
+def test_to_arrays_round_trip():
+    graph = ViewGraph.sequential(4)
+    rotation = np.eye(3)
+    translation = np.array([1.0, 0.0, 0.0])
+    graph.add_edge(0, 1, inliers=40, rotation=rotation, translation=translation, triangulation_angle=3.5,
+                   matches=(np.array([1, 2, 3]), np.array([4, 5, 6])))
+    graph.add_edge(0, 2, score=0.5, inliers=12, rotation=None, translation=None, triangulation_angle=0.5,
+                   matches=(np.array([7]), np.array([8])))
+
+    restored = ViewGraph.from_arrays(graph.num_images, graph.to_arrays())
+    assert sorted(restored.edges) == sorted(graph.edges)
+    for pair, edge in graph.edges.items():
+        other = restored.edges[pair]
+        assert other['score'] == edge['score']
+        assert other.get('inliers', -1) == edge.get('inliers', -1)
+        if 'matches' in edge:
+            np.testing.assert_array_equal(other['matches'][0], edge['matches'][0])
+            np.testing.assert_array_equal(other['matches'][1], edge['matches'][1])
+    np.testing.assert_array_equal(restored.edge(0, 1)['rotation'], rotation)
+    np.testing.assert_array_equal(restored.edge(0, 1)['translation'], translation)
+    assert restored.edge(0, 2)['rotation'] is None
+    assert restored.neighbors(0) == graph.neighbors(0)
+
+
+def test_next_best_view_follows_edges():
+    graph = ViewGraph.sequential(4)
+    assert graph.next_best_view({0, 1}) == 2
+    graph.remove_edge(1, 2)
+    assert graph.next_best_view({0, 1}) is None
@@ -0,0 +1,252 @@
+import numpy as np
+
+
+class FeatureTracks:
+    """
+    Feature tracks linking keypoints of the same scene point across views.
+
+    Every observation is a (image id, keypoint index) pair. Each image keeps a
+    keypoint -> track lookup array, so linking a batch of matches and collecting
+    the 2D-3D correspondences of a view are vectorized array operations that run
+    in time linear in the number of matches.
+
+    Attributes:
+    -----------
+    track_of : dict
+        Maps an image id to an int64 array holding the track id of every keypoint (-1 if none).
+    points : np.ndarray
+        (num_tracks, 3) triangulated position of every track, NaN while not triangulated.
+    obs_track, obs_image, obs_keypoint : np.ndarray
+        Flat list of all observations.
+    """
+    def __init__(self):
+        """
+        Initialize an empty set of tracks.
+        """
+        self.track_of = {}
+        self.num_tracks = 0
+        self.num_observations = 0
+        self._points = np.empty((0, 3))
+        self._obs = np.empty((3, 0), dtype=np.int64)
+
+    @property
+    def points(self) -> np.ndarray:
+        return self._points[:self.num_tracks]
+
+    @property
+    def obs_track(self) -> np.ndarray:
+        return self._obs[0, :self.num_observations]
+
+    @property
+    def obs_image(self) -> np.ndarray:
+        return self._obs[1, :self.num_observations]
+
+    @property
+    def obs_keypoint(self) -> np.ndarray:
+        return self._obs[2, :self.num_observations]
+
+    def add_image(self, image_id:int, num_keypoints:int) -> None:
+        """
+        Register an image and its number of keypoints.
+
+        Parameters:
+        -----------
+        image_id : int
+            Index of the image.
+        num_keypoints : int
+            Number of keypoints detected in the image.
+        """
+        if image_id not in self.track_of:
+            self.track_of[image_id] = np.full(num_keypoints, -1, dtype=np.int64)
+
+    def add_matches(self, image_0:int, image_1:int, keypoints_0, keypoints_1) -> np.ndarray:
+        """
+        Link matched keypoints of two images into tracks.
+
+        A match extends the track of whichever keypoint already has one, or
+        starts a new track when neither does. Matches that would put two
+        keypoints of one image in the same track, or join two existing tracks,
+        are dropped.
+
+        Parameters:
+        -----------
+        image_0 : int
+            Index of the first image.
+        image_1 : int
+            Index of the second image.
+        keypoints_0 : np.ndarray
+            Keypoint indices in the first image.
+        keypoints_1 : np.ndarray
+            Keypoint indices in the second image, aligned with keypoints_0.
+
+        Returns:
+        --------
+        np.ndarray
+            Track id of every match, -1 for dropped matches.
+        """
+        keypoints_0 = np.asarray(keypoints_0, dtype=np.int64)
+        keypoints_1 = np.asarray(keypoints_1, dtype=np.int64)
+        result = np.full(len(keypoints_0), -1, dtype=np.int64)
+
+        # A keypoint may take part in at most one match of the batch
+        _, first_0 = np.unique(keypoints_0, return_index=True)
+        _, first_1 = np.unique(keypoints_1, return_index=True)
+        valid = np.zeros(len(keypoints_0), dtype=bool)
+        valid[np.intersect1d(first_0, first_1)] = True
+
+        tracks_0 = self.track_of[image_0][keypoints_0]
+        tracks_1 = self.track_of[image_1][keypoints_1]
+        in_0 = self.track_of[image_0]
+        in_1 = self.track_of[image_1]
+
+        # Matches where both keypoints are already tracked
+        both = valid & (tracks_0 >= 0) & (tracks_1 >= 0)
+        same = both & (tracks_0 == tracks_1)
+        result[same] = tracks_0[same]
+
+        # Extend existing tracks, unless the track is already seen in the other image
+        extend_0 = valid & (tracks_0 >= 0) & (tracks_1 < 0) & ~np.isin(tracks_0, in_1[in_1 >= 0])
+        extend_1 = valid & (tracks_1 >= 0) & (tracks_0 < 0) & ~np.isin(tracks_1, in_0[in_0 >= 0])
+        self._append(tracks_0[extend_0], image_1, keypoints_1[extend_0])
+        self._append(tracks_1[extend_1], image_0, keypoints_0[extend_1])
+        result[extend_0] = tracks_0[extend_0]
+        result[extend_1] = tracks_1[extend_1]
+
+        # Start new tracks where neither keypoint is tracked
+        new = valid & (tracks_0 < 0) & (tracks_1 < 0)
+        new_ids = self._new_tracks(int(new.sum()))
+        self._append(new_ids, image_0, keypoints_0[new])
+        self._append(new_ids, image_1, keypoints_1[new])
+        result[new] = new_ids
+        return result
+
+    def observed_tracks(self, image_id:int, triangulated:bool = None) -> tuple:
+        """
+        Get the tracks observed in an image.
+
+        Parameters:
+        -----------
+        image_id : int
+            Index of the image.
+        triangulated : bool
+            If True only tracks with a 3D point, if False only tracks without one, if None all.
+
+        Returns:
+        --------
+        tuple
+            Keypoint indices in the image and the matching track ids.
+        """
+        tracks = self.track_of[image_id]
+        keypoints = np.flatnonzero(tracks >= 0)
+        track_ids = tracks[keypoints]
+        if triangulated is not None:
+            keep = self.is_triangulated(track_ids) == triangulated
+            keypoints, track_ids = keypoints[keep], track_ids[keep]
+        return keypoints, track_ids
+
+    def keypoint_of(self, track_ids, image_id:int) -> np.ndarray:
+        """
+        Get the keypoint observing each track in an image.
+
+        Parameters:
+        -----------
+        track_ids : np.ndarray
+            Track ids.
+        image_id : int
+            Index of the image.
+
+        Returns:
+        --------
+        np.ndarray
+            Keypoint index for every track, -1 where the track is not seen in the image.
+        """
+        tracks = self.track_of[image_id]
+        lookup = np.full(self.num_tracks, -1, dtype=np.int64)
+        keypoints = np.flatnonzero(tracks >= 0)
+        lookup[tracks[keypoints]] = keypoints
+        return lookup[np.asarray(track_ids, dtype=np.int64)]
+
+    def is_triangulated(self, track_ids) -> np.ndarray:
+        """
+        Check which tracks have a 3D point.
+        """
+        return ~np.isnan(self._points[np.asarray(track_ids, dtype=np.int64), 0])
+
+    def set_points(self, track_ids, points_3d) -> None:
+        """
+        Set the 3D position of tracks.
+
+        Parameters:
+        -----------
+        track_ids : np.ndarray
+            Track ids.
+        points_3d : np.ndarray
+            (N, 3) positions aligned with track_ids.
+        """
+        self._points[np.asarray(track_ids, dtype=np.int64)] = np.reshape(points_3d, (-1, 3))
+
+    def to_arrays(self) -> dict:
+        """
+        Export the tracks as flat arrays, e.g. for a checkpoint.
+
+        Returns:
+        --------
+        dict
+            'points' (num_tracks, 3), 'observations' (3, num_observations) rows of track id, image id
+            and keypoint index, and 'images' / 'num_keypoints' of every registered image.
+        """
+        images = np.array(sorted(self.track_of), dtype=np.int64)
+        return {'points': self.points, 'observations': self._obs[:, :self.num_observations], 'images': images,
+                'num_keypoints': np.array([len(self.track_of[image_id]) for image_id in images], dtype=np.int64)}
+
+    @classmethod
+    def from_arrays(cls, arrays:dict) -> 'FeatureTracks':
+        """
+        Rebuild tracks exported with to_arrays.
+
+        Parameters:
+        -----------
+        arrays : dict
+            Arrays returned by to_arrays, possibly memory-mapped.
+
+        Returns:
+        --------
+        FeatureTracks
+            Tracks owning writable copies of the arrays.
+        """
+        tracks = cls()
+        for image_id, num_keypoints in zip(arrays['images'], arrays['num_keypoints']):
+            tracks.add_image(int(image_id), int(num_keypoints))
+        tracks._points = np.array(arrays['points'], dtype=np.float64).reshape(-1, 3)
+        tracks.num_tracks = len(tracks._points)
+        tracks._obs = np.array(arrays['observations'], dtype=np.int64).reshape(3, -1)
+        tracks.num_observations = tracks._obs.shape[1]
+        obs_track, obs_image, obs_keypoint = tracks._obs
+        for image_id, lookup in tracks.track_of.items():
+            in_image = obs_image == image_id
+            lookup[obs_keypoint[in_image]] = obs_track[in_image]
+        return tracks
+
+    def _new_tracks(self, count:int) -> np.ndarray:
+        if self.num_tracks + count > len(self._points):
+            grown = np.full((max(2 * len(self._points), self.num_tracks + count, 1024), 3), np.nan)
+            grown[:self.num_tracks] = self._points[:self.num_tracks]
+            self._points = grown
+        ids = np.arange(self.num_tracks, self.num_tracks + count, dtype=np.int64)
+        self.num_tracks += count
+        return ids
+
+    def _append(self, track_ids, image_id:int, keypoints) -> None:
+        count = len(track_ids)
+        if count == 0:
+            return
+        if self.num_observations + count > self._obs.shape[1]:
+            grown = np.empty((3, max(2 * self._obs.shape[1], self.num_observations + count, 4096)), dtype=np.int64)
+            grown[:, :self.num_observations] = self._obs[:, :self.num_observations]
+            self._obs = grown
+        end = self.num_observations + count
+        self._obs[0, self.num_observations:end] = track_ids
+        self._obs[1, self.num_observations:end] = image_id
+        self._obs[2, self.num_observations:end] = keypoints
+        self.num_observations = end
+        self.track_of[image_id][keypoints] = track_ids
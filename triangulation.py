@@ -0,0 +1,94 @@
+import numpy as np
+
+
+def triangulate_tracks(transforms, K, camera_indices, point_indices, points_2d, num_points:int, min_angle:float = 1.0, max_error:float = 4.0) -> tuple:
+    """
+    Triangulate any number of points from all of their observations in one batch.
+
+    Every point is solved with the linear DLT method over all views observing it:
+    each observation adds two rows to the point's system A X = 0, the 4x4 normal
+    matrices A^T A of all points are accumulated in one pass and their smallest
+    eigenvectors found with one batched eigendecomposition. Image points are
+    normalized with K first, which keeps the systems well conditioned.
+
+    A point is rejected if it is at infinity, behind any observing camera, seen
+    under a triangulation angle below min_angle, or reprojects further than
+    max_error pixels from any of its observations. Observations of cameras with a
+    non-finite pose are ignored, so a single failed camera cannot break the batch.
+
+    Parameters:
+    -----------
+    transforms : np.ndarray
+        (num_cameras, 3, 4) extrinsic [R|t] matrices.
+    K : np.ndarray
+        Camera intrinsic matrix shared by all cameras.
+    camera_indices : np.ndarray
+        Camera of every observation.
+    point_indices : np.ndarray
+        Point of every observation, in [0, num_points).
+    points_2d : np.ndarray
+        (num_observations, 2) observed image points in pixels.
+    num_points : int
+        Number of points.
+    min_angle : float
+        Minimum triangulation angle in degrees, the largest angle between the ray of the
+        first observation and the rays of the others.
+    max_error : float
+        Maximum reprojection error in pixels of any observation.
+
+    Returns:
+    --------
+    tuple
+        (num_points, 3) points, NaN where rejected or observed fewer than twice, a boolean
+        mask of the accepted points and the (num_points,) mean reprojection error in pixels.
+    """
+    transforms = np.asarray(transforms, dtype=np.float64).reshape(-1, 3, 4)
+    camera_indices = np.asarray(camera_indices, dtype=np.int64)
+    point_indices = np.asarray(point_indices, dtype=np.int64)
+    points_2d = np.asarray(points_2d, dtype=np.float64).reshape(-1, 2)
+
+    # Observations from a camera without a valid pose, or without a finite image point, are ignored
+    finite = np.isfinite(transforms).all(axis=(1, 2))[camera_indices] & np.isfinite(points_2d).all(axis=1)
+    camera_indices, point_indices, points_2d = camera_indices[finite], point_indices[finite], points_2d[finite]
+
+    # Normalized image coordinates, the cameras become [R|t]
+    normalized = np.linalg.solve(K, np.vstack((points_2d.T, np.ones(len(points_2d))))).T[:, :2]
+    P = transforms[camera_indices]
+    row_x = normalized[:, 0:1] * P[:, 2] - P[:, 0]
+    row_y = normalized[:, 1:2] * P[:, 2] - P[:, 1]
+    normal = np.zeros((num_points, 4, 4))
+    np.add.at(normal, point_indices, row_x[:, :, np.newaxis] * row_x[:, np.newaxis, :] + row_y[:, :, np.newaxis] * row_y[:, np.newaxis, :])
+    finite = np.isfinite(normal).all(axis=(1, 2))
+    normal[~finite] = np.eye(4)
+    _, vectors = np.linalg.eigh(normal)
+    homogeneous = vectors[:, :, 0]
+
+    counts = np.bincount(point_indices, minlength=num_points)
+    scale = np.max(np.abs(homogeneous[:, :3]), axis=1)
+    valid = finite & (counts >= 2) & (np.abs(homogeneous[:, 3]) > 1e-9 * np.maximum(scale, 1e-300))
+    points = np.full((num_points, 3), np.nan)
+    points[valid] = homogeneous[valid, :3] / homogeneous[valid, 3:4]
+
+    # Cheirality and reprojection error of every observation
+    points_obs = points[point_indices]
+    points_cam = np.einsum('nij,nj->ni', P[:, :, :3], points_obs) + P[:, :, 3]
+    depth = points_cam[:, 2]
+    projected = np.matmul(points_cam[:, :2] / depth[:, np.newaxis], K[:2, :2].T) + K[:2, 2]
+    errors = np.linalg.norm(projected - points_2d, axis=1)
+    bad = ~(depth > 0) | ~(errors <= max_error)
+    valid &= np.bincount(point_indices, weights=bad, minlength=num_points) == 0
+
+    # Triangulation angle against the ray of each point's first observation
+    centers = -np.einsum('nji,nj->ni', P[:, :, :3], P[:, :, 3])
+    rays = points_obs - centers
+    rays /= np.maximum(np.linalg.norm(rays, axis=1, keepdims=True), 1e-300)
+    first = np.full(num_points, -1, dtype=np.int64)
+    first[point_indices[::-1]] = np.arange(len(point_indices))[::-1]
+    cosine = np.einsum('ij,ij->i', rays, rays[first[point_indices]])
+    angles = np.zeros(num_points)
+    np.maximum.at(angles, point_indices, np.degrees(np.arccos(np.clip(np.nan_to_num(cosine, nan=1.0), -1.0, 1.0))))
+    valid &= angles >= min_angle
+
+    mean_errors = np.bincount(point_indices, weights=np.nan_to_num(errors, nan=0.0), minlength=num_points) / np.maximum(counts, 1)
+    points[~valid] = np.nan
+    return points, valid, mean_errors
@@ -0,0 +1,135 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+def triangulation_angles(points_0, points_1, rot_matrix, tran_vector, K) -> np.ndarray:
+    """
+    Angle between the two viewing rays of every correspondence of a calibrated pair.
+
+    Parameters:
+    -----------
+    points_0 : np.ndarray
+        (N, 2) image points in the first image.
+    points_1 : np.ndarray
+        (N, 2) image points in the second image.
+    rot_matrix : np.ndarray
+        Rotation of the second camera relative to the first.
+    tran_vector : np.ndarray
+        Translation of the second camera relative to the first.
+    K : np.ndarray
+        Camera intrinsic matrix.
+
+    Returns:
+    --------
+    np.ndarray
+        (N,) triangulation angles in degrees.
+    """
+    tran_vector = np.reshape(tran_vector, 3)
+    normalized_0 = cv2.undistortPoints(np.reshape(points_0, (-1, 1, 2)).astype(np.float64), K, None)[:, 0, :]
+    normalized_1 = cv2.undistortPoints(np.reshape(points_1, (-1, 1, 2)).astype(np.float64), K, None)[:, 0, :]
+    points_3d = cv2.triangulatePoints(np.eye(3, 4), np.hstack((rot_matrix, tran_vector[:, np.newaxis])), normalized_0.T, normalized_1.T)
+    points_3d = (points_3d[:3] / points_3d[3]).T
+    center_1 = -np.matmul(rot_matrix.T, tran_vector)
+    ray_0 = points_3d
+    ray_1 = points_3d - center_1
+    cosine = np.einsum('ij,ij->i', ray_0, ray_1) / np.maximum(np.linalg.norm(ray_0, axis=1) * np.linalg.norm(ray_1, axis=1), 1e-12)
+    return np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+
+
+def verify_pair(points_0, points_1, K, threshold:float = 0.4, prob:float = 0.999) -> dict:
+    """
+    Estimate the relative pose of an image pair from putative matches with essential matrix RANSAC.
+
+    Parameters:
+    -----------
+    points_0 : np.ndarray
+        (N, 2) matched image points in the first image.
+    points_1 : np.ndarray
+        (N, 2) matched image points in the second image.
+    K : np.ndarray
+        Camera intrinsic matrix.
+    threshold : float
+        RANSAC threshold in pixels.
+    prob : float
+        RANSAC confidence.
+
+    Returns:
+    --------
+    dict
+        'inliers' (number of matches consistent with the pose and in front of both cameras),
+        'inlier_mask', 'rotation', 'translation' and 'triangulation_angle' (median, in degrees).
+        Pairs with fewer than five matches, or without a valid essential matrix, get 0 inliers.
+    """
+    failed = {'inliers': 0, 'inlier_mask': np.zeros(len(points_0), dtype=bool), 'rotation': None, 'translation': None, 'triangulation_angle': 0.0}
+    if len(points_0) < 5:
+        return failed
+    essential_matrix, em_mask = cv2.findEssentialMat(points_0, points_1, K, method=cv2.RANSAC, prob=prob, threshold=threshold, mask=None)
+    if essential_matrix is None or essential_matrix.shape != (3, 3):
+        return failed
+    _, rot_matrix, tran_matrix, pose_mask = cv2.recoverPose(essential_matrix, points_0, points_1, K, mask=em_mask.copy())
+    inlier_mask = (em_mask.ravel() > 0) & (pose_mask.ravel() > 0)
+    if not inlier_mask.any():
+        return failed
+    angles = triangulation_angles(points_0[inlier_mask], points_1[inlier_mask], rot_matrix, tran_matrix, K)
+    return {'inliers': int(inlier_mask.sum()), 'inlier_mask': inlier_mask, 'rotation': rot_matrix, 'translation': tran_matrix.ravel(),
+            'triangulation_angle': float(np.median(angles))}
+
+
+def verify_view_graph(view_graph, keypoints:list, descriptors:list, matcher, K, workers:int = None, min_inliers:int = 30, threshold:float = 0.4, on_pair=None, pairs=None) -> None:
+    """
+    Match and geometrically verify every pair of a view graph in a thread pool.
+
+    OpenCV releases the GIL while matching and running RANSAC, so the pairs are
+    verified concurrently. Every surviving edge gets the verification results
+    and its inlier matches as 'matches'; edges with fewer than min_inliers
+    inliers are removed from the graph.
+
+    Parameters:
+    -----------
+    view_graph : ViewGraph
+        Graph whose edges are verified in place.
+    keypoints : list
+        (N_i, 2) keypoint coordinates of every image.
+    descriptors : list
+        (N_i, D) descriptors of every image.
+    matcher : FeatureMatcher
+        Descriptor matcher producing the putative matches.
+    K : np.ndarray
+        Camera intrinsic matrix.
+    workers : int
+        Number of threads, defaults to the number of CPUs.
+    min_inliers : int
+        Minimum number of inliers for a pair to stay in the graph.
+    threshold : float
+        RANSAC threshold in pixels.
+    on_pair : callable
+        Called with (image_0, image_1, match_seconds, pose_seconds) after every pair, e.g. to
+        record the descriptor matching and the essential matrix RANSAC timings separately.
+    pairs : list
+        Edges to verify, defaults to every edge of the graph.
+    """
+    def verify(pair):
+        image_0, image_1 = pair
+        start = time.perf_counter()
+        matches_0, matches_1 = matcher.match(descriptors[image_0], descriptors[image_1])
+        matched = time.perf_counter()
+        result = verify_pair(keypoints[image_0][matches_0], keypoints[image_1][matches_1], K, threshold)
+        pose_seconds = time.perf_counter() - matched
+        inlier_mask = result.pop('inlier_mask')
+        result['matches'] = (matches_0[inlier_mask], matches_1[inlier_mask])
+        if on_pair is not None:
+            on_pair(image_0, image_1, matched - start, pose_seconds)
+        return pair, result
+
+    pairs = list(view_graph.edges) if pairs is None else list(pairs)
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    with ThreadPoolExecutor(max(1, workers)) as executor:
+        for (image_0, image_1), result in executor.map(verify, pairs):
+            if result['inliers'] < min_inliers:
+                view_graph.remove_edge(image_0, image_1)
+            else:
+                view_graph.add_edge(image_0, image_1, **result)
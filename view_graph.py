@@ -0,0 +1,201 @@
+import numpy as np
+
+
+class ViewGraph:
+    """
+    Undirected graph of the image pairs worth matching.
+
+    Every edge stores a dictionary of attributes, at least the 'score' its pair was
+    proposed with (retrieval similarity, or 1 for consecutive images). Verified
+    edges also carry their 'inliers', relative pose and 'triangulation_angle'.
+    The graph decides which pairs are matched, the initial pair and the order in
+    which the remaining views are registered.
+
+    Attributes:
+    -----------
+    num_images : int
+        Number of images, the nodes are 0 .. num_images - 1.
+    edges : dict
+        Maps (i, j) with i < j to the attributes of the pair.
+    """
+    def __init__(self, num_images:int):
+        """
+        Initialize a graph without edges.
+
+        Parameters:
+        -----------
+        num_images : int
+            Number of images.
+        """
+        self.num_images = num_images
+        self.edges = {}
+        self._adjacency = {image_id: set() for image_id in range(num_images)}
+
+    @classmethod
+    def sequential(cls, num_images:int) -> 'ViewGraph':
+        """
+        Graph linking every image to the next one, for ordered sequences.
+        """
+        graph = cls(num_images)
+        for image_id in range(num_images - 1):
+            graph.add_edge(image_id, image_id + 1, score=1.0)
+        return graph
+
+    def add_image(self) -> int:
+        """
+        Add an image without edges, e.g. one that just arrived in a stream, and return its index.
+        """
+        self._adjacency[self.num_images] = set()
+        self.num_images += 1
+        return self.num_images - 1
+
+    def add_edge(self, image_0:int, image_1:int, **attributes) -> None:
+        """
+        Add an edge, or update the attributes of an existing one.
+
+        Parameters:
+        -----------
+        image_0 : int
+            Index of the first image.
+        image_1 : int
+            Index of the second image.
+        attributes : dict
+            Attributes stored on the edge.
+        """
+        if image_0 == image_1:
+            raise ValueError('an image cannot be paired with itself')
+        self.edges.setdefault(self._key(image_0, image_1), {}).update(attributes)
+        self._adjacency[image_0].add(image_1)
+        self._adjacency[image_1].add(image_0)
+
+    def remove_edge(self, image_0:int, image_1:int) -> None:
+        """
+        Remove an edge if present.
+        """
+        if self.edges.pop(self._key(image_0, image_1), None) is not None:
+            self._adjacency[image_0].discard(image_1)
+            self._adjacency[image_1].discard(image_0)
+
+    def edge(self, image_0:int, image_1:int) -> dict:
+        """
+        Attributes of an edge, None if the images are not linked.
+        """
+        return self.edges.get(self._key(image_0, image_1))
+
+    def weight(self, image_0:int, image_1:int) -> float:
+        """
+        Strength of an edge, its number of inliers once verified, otherwise its score, 0 if the images are not linked.
+        """
+        edge = self.edge(image_0, image_1)
+        if edge is None:
+            return 0.0
+        return float(edge['inliers']) if 'inliers' in edge else edge['score']
+
+    def neighbors(self, image_id:int) -> list:
+        """
+        Images linked to an image, strongest edge first.
+        """
+        return sorted(self._adjacency[image_id], key=lambda other: (-self.weight(image_id, other), other))
+
+    def initial_pair(self, min_angle:float = 0.0) -> tuple:
+        """
+        Pick the pair to start the reconstruction from.
+
+        Parameters:
+        -----------
+        min_angle : float
+            Minimum median triangulation angle in degrees of a verified pair, so the
+            initial points are well conditioned. Ignored if no pair reaches it.
+
+        Returns:
+        --------
+        tuple
+            The strongest pair with a wide enough baseline, lowest indices first on ties.
+        """
+        if not self.edges:
+            raise ValueError('the view graph has no edges')
+        candidates = [pair for pair, edge in self.edges.items() if edge.get('triangulation_angle', min_angle) >= min_angle] or list(self.edges)
+        return min(candidates, key=lambda pair: (-self.weight(*pair), pair))
+
+    def next_best_view(self, registered) -> int:
+        """
+        Pick the unregistered image most strongly linked to the registered ones.
+
+        Parameters:
+        -----------
+        registered : iterable
+            Indices of the registered images.
+
+        Returns:
+        --------
+        int
+            Index of the next image to register, None if no unregistered image is linked to a registered one.
+        """
+        registered = set(registered)
+        best, best_weight = None, 0.0
+        for image_id in range(self.num_images):
+            if image_id in registered:
+                continue
+            weight = sum(self.weight(image_id, other) for other in self._adjacency[image_id] & registered)
+            if weight > best_weight:
+                best, best_weight = image_id, weight
+        return best
+
+    def to_arrays(self) -> dict:
+        """
+        Export the edges as flat arrays, e.g. for a checkpoint.
+
+        Returns:
+        --------
+        dict
+            'pairs' (E, 2) and 'score' (E,) of every edge. Verification results are 'inliers'
+            (-1 if unverified), 'rotation', 'translation' (NaN if unverified), 'triangulation_angle',
+            and the inlier matches of edge e as columns match_offsets[e]:match_offsets[e + 1] of 'matches'.
+        """
+        pairs = sorted(self.edges)
+        edges = [self.edges[pair] for pair in pairs]
+        matches = [edge.get('matches', (np.empty(0, dtype=np.int64),) * 2) for edge in edges]
+        return {
+            'pairs': np.array(pairs, dtype=np.int64).reshape(-1, 2),
+            'score': np.array([edge['score'] for edge in edges], dtype=np.float64),
+            'inliers': np.array([edge.get('inliers', -1) for edge in edges], dtype=np.int64),
+            'rotation': np.array([edge['rotation'] if edge.get('rotation') is not None else np.full((3, 3), np.nan) for edge in edges]).reshape(-1, 3, 3),
+            'translation': np.array([edge['translation'] if edge.get('translation') is not None else np.full(3, np.nan) for edge in edges]).reshape(-1, 3),
+            'triangulation_angle': np.array([edge.get('triangulation_angle', np.nan) for edge in edges], dtype=np.float64),
+            'match_offsets': np.concatenate(([0], np.cumsum([len(m[0]) for m in matches]))).astype(np.int64),
+            'matches': np.hstack([np.vstack(m) for m in matches]).astype(np.int64) if matches else np.empty((2, 0), dtype=np.int64),
+        }
+
+    @classmethod
+    def from_arrays(cls, num_images:int, arrays:dict) -> 'ViewGraph':
+        """
+        Rebuild a graph exported with to_arrays.
+
+        Parameters:
+        -----------
+        num_images : int
+            Number of images.
+        arrays : dict
+            Arrays returned by to_arrays, possibly memory-mapped.
+
+        Returns:
+        --------
+        ViewGraph
+            Graph with the same edges and attributes.
+        """
+        graph = cls(num_images)
+        offsets = np.asarray(arrays['match_offsets'])
+        matches = np.array(arrays['matches'], dtype=np.int64)
+        for e, (image_0, image_1) in enumerate(np.asarray(arrays['pairs'])):
+            attributes = {'score': float(arrays['score'][e])}
+            if arrays['inliers'][e] >= 0:
+                verified = not np.isnan(arrays['rotation'][e]).any()
+                attributes.update(inliers=int(arrays['inliers'][e]), triangulation_angle=float(arrays['triangulation_angle'][e]),
+                                  rotation=np.array(arrays['rotation'][e]) if verified else None, translation=np.array(arrays['translation'][e]) if verified else None,
+                                  matches=(matches[0, offsets[e]:offsets[e + 1]], matches[1, offsets[e]:offsets[e + 1]]))
+            graph.add_edge(int(image_0), int(image_1), **attributes)
+        return graph
+
+    @staticmethod
+    def _key(image_0:int, image_1:int) -> tuple:
+        return (int(image_0), int(image_1)) if image_0 < image_1 else (int(image_1), int(image_0))
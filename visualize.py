@@ -1,12 +1,88 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import open3d as o3d
 
+from octree import INDEX_FILE, load_octree_index, load_tile, select_tiles
+
 def visualize_point_cloud_with_open3d(ply_file_path):
     # Load the point cloud
     pcd = o3d.io.read_point_cloud(ply_file_path)
-    
+
     # Visualize the point cloud
     o3d.visualization.draw_geometries([pcd])
 
+def tile_geometry(points, colors):
+    # Open3D expects RGB colors in [0, 1], the tiles store OpenCV's BGR order
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(points.astype(np.float64)))
+    pcd.colors = o3d.utility.Vector3dVector(colors[:, ::-1].astype(np.float64) / 255)
+    return pcd
+
+def visualize_octree_with_open3d(octree_dir, point_budget=3000000, workers=2, refresh=0.25):
+    """
+    Show a level-of-detail octree written by write_octree, streaming tiles as the camera moves.
+
+    The root tile is shown first, then the tiles chosen by select_tiles for the current
+    camera are read in background threads and swapped in, coarse to fine, while the
+    tiles no longer chosen are dropped, so at most point_budget points stay loaded.
+
+    Parameters:
+    -----------
+    octree_dir : str
+        Directory of the octree.
+    point_budget : int
+        Maximum number of points loaded at once.
+    workers : int
+        Number of threads reading tiles.
+    refresh : float
+        Seconds between two updates of the tile selection.
+    """
+    index = load_octree_index(octree_dir)
+    vis = o3d.visualization.Visualizer()
+    vis.create_window(window_name=os.path.basename(os.path.normpath(octree_dir)))
+    loaded, pending = {}, {}
+    with ThreadPoolExecutor(workers) as executor:
+        loaded['r'] = tile_geometry(*load_tile(octree_dir, index, 'r'))
+        vis.add_geometry(loaded['r'])
+        last_update = 0.0
+        while vis.poll_events():
+            if time.monotonic() - last_update > refresh:
+                last_update = time.monotonic()
+                extrinsic = vis.get_view_control().convert_to_pinhole_camera_parameters().extrinsic
+                camera_position = -np.matmul(extrinsic[:3, :3].T, extrinsic[:3, 3])
+                wanted = select_tiles(index, camera_position, point_budget)
+                wanted_set = set(wanted)
+
+                # Drop what is no longer wanted, then queue the most important missing tiles
+                for name in [name for name in pending if name not in wanted_set]:
+                    pending.pop(name).cancel()
+                for name in [name for name in loaded if name not in wanted_set]:
+                    vis.remove_geometry(loaded.pop(name), reset_bounding_box=False)
+                for name in wanted:
+                    if len(pending) >= 2 * workers:
+                        break
+                    if name not in loaded and name not in pending:
+                        pending[name] = executor.submit(load_tile, octree_dir, index, name)
+
+            for name in [name for name, future in pending.items() if future.done()]:
+                loaded[name] = tile_geometry(*pending.pop(name).result())
+                vis.add_geometry(loaded[name], reset_bounding_box=False)
+            vis.update_renderer()
+        for future in pending.values():
+            future.cancel()
+    vis.destroy_window()
+
 if __name__ == "__main__":
-    ply_file_path = "Results\without bundle adjustment\\fountain-P11\\0000.ply"  # Update this path
-    visualize_point_cloud_with_open3d(ply_file_path)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Show a point cloud exported by SFM.py.')
+    parser.add_argument('path', help='.ply file, or the _octree directory written next to it to stream a large cloud level by level')
+    parser.add_argument('--point-budget', type=int, default=3000000, help='maximum number of points loaded at once from an octree')
+    args = parser.parse_args()
+
+    path = os.path.dirname(args.path) if os.path.basename(args.path) == INDEX_FILE else args.path
+    if os.path.isdir(path):
+        visualize_octree_with_open3d(path, args.point_budget)
+    else:
+        visualize_point_cloud_with_open3d(path)